@@ -20,15 +20,20 @@ Para usar este archivo:
 import streamlit as st
 import pandas as pd
 import time
-import requests
 from datetime import datetime, date
+from pathlib import Path
 from rut_chile import rut_chile
 import io
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 
 # Importar el sistema de buffer
-from db_buffer import get_buffer
+from db_buffer import get_buffer, HIDRATANDO, DEGRADADO
+from circuit_breaker import ABIERTO, SEMI_ABIERTO
+from api_client import get_api_client
+from snapshot_cache import get_snapshot_cache
+from config_cursos import descargar_config
+from registros_cursos import get_registros_cursos
 
 # Configuración básica
 st.set_page_config(page_title="Registro de Asistencia", layout="wide", initial_sidebar_state="collapsed")
@@ -37,54 +42,45 @@ st.set_page_config(page_title="Registro de Asistencia", layout="wide", initial_s
 SECRET_PASSWORD = st.secrets["SECRET_PASSWORD"]
 API_URL = st.secrets["API_URL"]
 API_KEY = st.secrets["API_KEY"]
+API = get_api_client(API_URL, API_KEY)  # Sesión HTTP compartida del proceso
+SNAPSHOT_DIR = Path(st.secrets.get("SNAPSHOT_DIR", "snapshots"))  # Último config bueno y espejo de registros
+
+# Columnas de registros que usa esta app: búsqueda de inscritos y todo campo que
+# lean generar_excel_ist y generar_excel_mk (si falta uno, el reporte sale en blanco)
+COLUMNAS_REGISTROS = ['curso_id', 'rut', 'nombres', 'apellido_paterno', 'apellido_materno',
+                      'nombre', 'email', 'sexo', 'rol', 'region', 'comuna', 'rut_empresa',
+                      'razon_social', 'id_ct', 'num_suc', 'nom_suc', 'comuna_suc', 'suc_resuelta',
+                      'nacionalidad', 'direccion']
 
 # ==================== FUNCIONES DE API ====================
 
+# Descarga de la configuración de cursos (la sirve CONFIG, ver get_config_data)
+def _descargar_config():
+    return descargar_config(API, fechas_utc=True)
+
+# Snapshot de cursos compartido por todas las sesiones: se renueva en segundo
+# plano y se persiste en Parquet para arrancar con datos aunque el API esté caído
+CONFIG = get_snapshot_cache("asistencia.config", _descargar_config, ttl=300,
+                            ruta=SNAPSHOT_DIR / "asistencia_config.parquet")
+
+# Inscripciones: espejo local en DuckDB que solo descarga las filas nuevas de la
+# hoja y se pone al día en segundo plano (ver registros_cursos.py)
+REGISTROS = get_registros_cursos(SNAPSHOT_DIR / "asistencia_registros.duckdb", API,
+                                 columnas=COLUMNAS_REGISTROS)
+
 # Función para obtener datos de configuración de cursos
-@st.cache_data(ttl=300)  # Cache por 5 minutos
 def get_config_data():
     try:
-        response = requests.get(f"{API_URL}?action=getConfig&key={API_KEY}")
-        data = response.json()
-
-        if data['success']:
-            df = pd.DataFrame(data['cursos'])
-            if not df.empty:
-                # Convertir columnas de fecha a datetime (detectando formato automáticamente)
-                date_cols = ['fecha_inicio', 'fecha_fin', 'fecha_sesion_1', 'fecha_sesion_2', 'fecha_sesion_3', 'fecha_sesion_4']
-                for col in date_cols:
-                    if col in df.columns:
-                        df[col] = (pd.to_datetime(df[col], utc=True, errors='coerce')
-                                   .dt.tz_convert(None)
-                                   .dt.normalize())
-
-                df['cupo_maximo'] = pd.to_numeric(df['cupo_maximo'], errors='coerce')
-                if 'num_sesiones' in df.columns:
-                    df['num_sesiones'] = pd.to_numeric(df['num_sesiones'], errors='coerce').fillna(3).astype(int)
-                else:
-                    # Auto-detectar num_sesiones contando columnas fecha_sesion_N no nulas
-                    def _count_sesiones(row):
-                        count = 0
-                        for i in range(1, 5):
-                            col = f'fecha_sesion_{i}'
-                            if col in row.index and pd.notna(row[col]) and row[col] != '':
-                                count = i
-                        return max(count, 3)
-                    df['num_sesiones'] = df.apply(_count_sesiones, axis=1).astype(int)
-            return df
-        else:
-            st.error(f"Error al obtener configuración: {data.get('error', 'Error desconocido')}")
-            return pd.DataFrame()
+        return CONFIG.get()  # Vista sin copia del snapshot compartido
     except Exception as e:
-        st.error(f"Error al conectar con la API: {str(e)}")
+        st.error(f"Error al obtener configuración: {str(e)}")
         return pd.DataFrame()
 
 # Función para obtener asistencias directamente desde Google Sheets (para descargas)
 @st.cache_data(ttl=60)
 def get_asistencias_desde_sheets(curso_id=None, sesion=None):
     try:
-        response = requests.get(f"{API_URL}?action=getAsistencias&key={API_KEY}", timeout=15)
-        data = response.json()
+        data = API.get('getAsistencias')
         if data.get('success') and data.get('asistencias'):
             df = pd.DataFrame(data['asistencias'])
             if df.empty:
@@ -98,27 +94,6 @@ def get_asistencias_desde_sheets(curso_id=None, sesion=None):
     except Exception:
         return pd.DataFrame()
 
-# Función para obtener registros de inscripción
-@st.cache_data(ttl=180)  # Cache por 3 minutos
-def get_registros_data():
-    try:
-        response = requests.get(f"{API_URL}?action=getRegistros&key={API_KEY}")
-        data = response.json()
-
-        if data['success']:
-            df = pd.DataFrame(data['registros'])
-            # Si la API devolvió datos pero sin columnas esperadas, tratar como vacío
-            if not df.empty and 'rut' not in df.columns:
-                st.warning("⚠️ La API devolvió registros sin estructura esperada.")
-                return pd.DataFrame()
-            return df
-        else:
-            st.error(f"Error al obtener registros: {data.get('error', 'Error desconocido')}")
-            return pd.DataFrame()
-    except Exception as e:
-        st.error(f"Error al conectar con la API: {str(e)}")
-        return pd.DataFrame()
-
 # ==================== FUNCIONES DE BUFFER ====================
 
 def guardar_asistencia_buffer(curso_id, rut, sesion):
@@ -135,15 +110,8 @@ def guardar_asistencia_buffer(curso_id, rut, sesion):
     """
     buffer = get_buffer()
 
-    # Verificar si ya existe
-    if buffer.verificar_asistencia(curso_id, rut, sesion):
-        return {
-            'success': False,
-            'message': 'Ya existe un registro de asistencia para este participante en esta sesión'
-        }
-
-    # Marcar asistencia en buffer (ultra rápido)
-    resultado = buffer.marcar_asistencia(
+    # Una sola sentencia atómica: inserta o informa que ya existe
+    return buffer.registrar_si_no_existe(
         curso_id=curso_id,
         rut=rut,
         sesion=sesion,
@@ -151,8 +119,6 @@ def guardar_asistencia_buffer(curso_id, rut, sesion):
         metodo='streamlit_buffer'
     )
 
-    return resultado
-
 def get_asistencias_from_buffer(curso_id=None, sesion=None):
     """
     Obtiene asistencias desde el buffer local (instantáneo).
@@ -172,7 +138,7 @@ def get_asistencias_from_buffer(curso_id=None, sesion=None):
         return buffer.get_asistencias_curso(curso_id)
     else:
         # Obtener todas las asistencias
-        return buffer.conn.execute("SELECT * FROM asistencias_buffer").df()
+        return buffer.get_todas_asistencias()
 
 # ==================== FUNCIONES AUXILIARES ====================
 
@@ -211,32 +177,21 @@ def get_cursos_con_sesion_hoy(df_cursos):
     else:
         return pd.DataFrame()
 
-def validar_participante_inscrito(rut, curso_id, df_registros):
+def validar_participante_inscrito(rut, curso_id, espejo):
     """
     Verifica si un participante está inscrito en un curso.
 
     Args:
         rut: RUT del participante
         curso_id: ID del curso
-        df_registros: DataFrame con registros de inscripciones
+        espejo: EspejoRegistros con las inscripciones
 
     Returns:
         tuple: (bool, dict) - (está_inscrito, datos_participante)
     """
-    if df_registros.empty:
-        return False, None
-
-    # Buscar participante — comparación case-insensitive (ej: 12345678-k == 12345678-K)
-    rut_norm = str(rut).upper().strip()
-    participante = df_registros[
-        (df_registros['rut'].astype(str).str.upper().str.strip() == rut_norm) &
-        (df_registros['curso_id'] == curso_id)
-    ]
-
-    if not participante.empty:
-        return True, participante.iloc[0].to_dict()
-    else:
-        return False, None
+    # Búsqueda en DuckDB — comparación case-insensitive (ej: 12345678-k == 12345678-K)
+    participante = espejo.buscar_inscrito(curso_id, rut)
+    return participante is not None, participante
 
 # ==================== GENERACIÓN DE REPORTES EXCEL ====================
 
@@ -429,6 +384,13 @@ def main():
     # Obtener instancia del buffer
     buffer = get_buffer()
 
+    # Las sesiones de hoy se sincronizan antes que las correcciones y el backfill
+    df_cursos = get_config_data()
+    df_cursos_hoy = get_cursos_con_sesion_hoy(df_cursos)
+    buffer.actualizar_sesiones_hoy(
+        [] if df_cursos_hoy.empty else list(zip(df_cursos_hoy['curso_id'], df_cursos_hoy['sesion_hoy']))
+    )
+
     # ==================== SIDEBAR CON PANEL ADMIN ====================
 
     st.sidebar.title("🔐 Panel de Control")
@@ -441,11 +403,13 @@ def main():
         st.sidebar.success("✅ Acceso administrativo concedido")
 
         # Recargar asistencias desde Sheets al iniciar sesión admin (solo una vez por sesión)
+        # (si la carga inicial sigue en segundo plano, ya trae lo nuevo)
         if not st.session_state.get("admin_hydrated"):
-            with st.spinner("🔄 Cargando asistencias desde Google Sheets..."):
-                n = buffer.force_hydrate()
+            if buffer.estado_hidratacion != HIDRATANDO:
+                with st.spinner("🔄 Cargando asistencias nuevas desde Google Sheets..."):
+                    n = buffer.force_hydrate()
+                st.sidebar.info(f"✅ {n} asistencias nuevas cargadas desde Sheets")
             st.session_state["admin_hydrated"] = True
-            st.sidebar.info(f"✅ {n} asistencias cargadas desde Sheets")
 
         # Mostrar estadísticas del buffer
         st.sidebar.subheader("📊 Estado del Buffer")
@@ -459,6 +423,44 @@ def main():
             st.sidebar.metric("Pendientes", stats['pendientes'])
             st.sidebar.metric("Fallidas", stats['fallidas'])
 
+        if stats['por_curso']:
+            with st.sidebar.expander("📚 Por curso"):
+                st.dataframe(
+                    pd.DataFrame.from_dict(stats['por_curso'], orient='index')
+                    [['total', 'pendientes', 'sincronizadas', 'fallidas']],
+                    use_container_width=True
+                )
+
+        # Estado del circuit breaker del API de Google Sheets
+        circuito = buffer.breaker.get_estado()
+        if circuito['estado'] == ABIERTO:
+            st.sidebar.error(f"🔴 API Sheets caída — próxima prueba en {circuito['segundos_para_prueba']:.0f}s")
+        elif circuito['estado'] == SEMI_ABIERTO:
+            st.sidebar.warning("🟡 API Sheets en prueba de recuperación")
+        else:
+            st.sidebar.caption("🟢 API Sheets operativa")
+
+        # Estado de la carga de asistencias desde Sheets
+        hidratacion = buffer.get_estado_hidratacion()
+        if hidratacion['estado'] == HIDRATANDO:
+            st.sidebar.info("⏳ Cargando asistencias desde Sheets en segundo plano...")
+        elif hidratacion['estado'] == DEGRADADO:
+            st.sidebar.warning(f"⚠️ Buffer sin datos de Sheets al día: {hidratacion['error']}")
+        elif hidratacion['reconciliados']:
+            st.sidebar.caption(f"🔁 {hidratacion['reconciliados']} check-ins ya estaban en Sheets")
+
+        # Antigüedad de los datos de cursos e inscritos (se renuevan en segundo plano)
+        st.sidebar.caption(REGISTROS.describir_edades(CONFIG))
+
+        # Botón para releer la hoja de inscritos completa (toma las filas corregidas)
+        if st.sidebar.button("🔁 Recargar Inscritos"):
+            with st.spinner("Descargando la hoja completa de inscritos..."):
+                try:
+                    REGISTROS.recargar()
+                    st.sidebar.success(f"✅ Inscritos recargados: {REGISTROS.espejo.filas} filas")
+                except Exception as e:
+                    st.sidebar.warning(f"⚠️ No se pudo recargar: {str(e)}")
+
         # Botón para forzar sincronización
         if st.sidebar.button("🔄 Sincronizar Ahora"):
             with st.spinner("Sincronizando con Google Sheets..."):
@@ -475,8 +477,7 @@ def main():
 
         # Botón para borrar TODO el buffer y re-hidratar desde Sheets
         if st.sidebar.button("🚨 Borrar Todo el Buffer", type="primary"):
-            buffer.conn.execute("DELETE FROM asistencias_buffer")
-            buffer.hydrate_from_sheets()  # Recargar lo que ya está en Sheets
+            buffer.vaciar_buffer()  # Borra todo y recarga lo que ya está en Sheets
             st.sidebar.success("✅ Buffer vaciado y recargado desde Sheets")
             st.rerun()
 
@@ -487,10 +488,7 @@ def main():
     if not admin_mode:
         st.info("👤 **Modo Participante:** Marca tu asistencia ingresando tu RUT")
 
-        # Obtener cursos con sesión hoy
-        df_cursos = get_config_data()
-        df_cursos_hoy = get_cursos_con_sesion_hoy(df_cursos)
-
+        # Cursos con sesión hoy (calculados al inicio de main)
         if df_cursos_hoy.empty:
             st.warning("⚠️ No hay cursos con sesión programada para hoy.")
             st.stop()
@@ -517,9 +515,8 @@ def main():
                         if not rut_chile.is_valid_rut(rut_input):
                             st.error("❌ RUT inválido. Verifica el formato.")
                         else:
-                            df_registros = get_registros_data()
                             esta_inscrito, datos = validar_participante_inscrito(
-                                rut_input, curso_id, df_registros
+                                rut_input, curso_id, REGISTROS.get_espejo()
                             )
                             if not esta_inscrito:
                                 st.error("❌ No estás inscrito en este curso. Contacta al administrador.")
@@ -585,13 +582,10 @@ def main():
                     # Asistentes actuales con nombre + RUT
                     df_asist_actual = get_asistencias_from_buffer(curso_seleccionado, sesion_seleccionada if sesiones else 1)
                     if not df_asist_actual.empty:
-                        df_reg_all = get_registros_data()
-                        if not df_reg_all.empty and 'curso_id' in df_reg_all.columns:
-                            df_reg_c = df_reg_all[df_reg_all['curso_id'] == curso_seleccionado].copy()
-                            df_reg_c['rut_norm'] = df_reg_c['rut'].astype(str).str.upper().str.strip()
-                            ruts_asist = df_asist_actual['rut'].str.upper().str.strip()
-                            df_reg_c['asistió'] = df_reg_c['rut_norm'].isin(ruts_asist)
-                            df_mostrar = df_reg_c[df_reg_c['asistió']][['rut', 'nombres', 'apellido_paterno']].copy()
+                        espejo = REGISTROS.get_espejo()
+                        if espejo.filas:
+                            df_reg_c = espejo.get_registros_curso(curso_seleccionado, ruts=df_asist_actual['rut'])
+                            df_mostrar = df_reg_c.reindex(columns=['rut', 'nombres', 'apellido_paterno'])
                             df_mostrar.columns = ['RUT', 'Nombres', 'Apellido Paterno']
                             st.write(f"**Asistentes registrados: {len(df_mostrar)}**")
                             st.dataframe(df_mostrar, use_container_width=True, hide_index=True)
@@ -617,9 +611,8 @@ def main():
                             if not rut_chile.is_valid_rut(rut):
                                 st.error("❌ RUT inválido")
                             else:
-                                df_registros = get_registros_data()
                                 esta_inscrito, datos = validar_participante_inscrito(
-                                    rut, curso_seleccionado, df_registros
+                                    rut, curso_seleccionado, REGISTROS.get_espejo()
                                 )
 
                                 if not esta_inscrito:
@@ -640,13 +633,11 @@ def main():
                                         st.error(f"❌ {resultado['message']}")
                     st.divider()
                     st.subheader("📥 Descargar Reportes")
-                    df_registros_rep = get_registros_data()
-                    if not df_registros_rep.empty and 'curso_id' in df_registros_rep.columns:
+                    espejo_rep = REGISTROS.get_espejo()
+                    if espejo_rep.filas:
                         df_asist_rep = get_asistencias_desde_sheets(curso_seleccionado, sesion_seleccionada)
-                        ruts_rep = df_asist_rep['rut'].astype(str).str.upper().str.strip().unique() if not df_asist_rep.empty else []
-                        df_reg_rep = df_registros_rep[df_registros_rep['curso_id'] == curso_seleccionado].copy()
-                        df_reg_rep['rut_norm'] = df_reg_rep['rut'].astype(str).str.upper().str.strip()
-                        df_asistentes_rep = df_reg_rep[df_reg_rep['rut_norm'].isin(ruts_rep)].copy()
+                        ruts_rep = df_asist_rep['rut'].astype(str).unique() if not df_asist_rep.empty else []
+                        df_asistentes_rep = espejo_rep.get_registros_curso(curso_seleccionado, ruts=ruts_rep)
 
                         if df_asistentes_rep.empty:
                             st.info("ℹ️ No hay asistentes registrados para generar reportes.")
@@ -685,6 +676,92 @@ def main():
 
             st.divider()
 
+            st.write("### Telemetría de Sincronización")
+            metricas = buffer.get_metricas()
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric("En cola", metricas['cola_pendientes'])
+            col2.metric("Pendiente más antigua", f"{metricas['fila_pendiente_mas_antigua_segundos']:.0f}s")
+            ultima = metricas['ultima_pasada']
+            col3.metric("Filas/s (última pasada)", ultima['filas_por_segundo'] if ultima else 0)
+
+            if metricas['latencias']:
+                st.write("**Latencia por acción del API (s)**")
+                st.dataframe(pd.DataFrame.from_dict(metricas['latencias'], orient='index'),
+                             use_container_width=True)
+            if metricas['consumo_api']:
+                st.write("**Consumo del API por acción (proceso)**")
+                st.dataframe(pd.DataFrame.from_dict(metricas['consumo_api'], orient='index'),
+                             use_container_width=True)
+            if metricas['errores']:
+                st.write("**Errores por clase**")
+                st.dataframe(pd.DataFrame(list(metricas['errores'].items()),
+                                          columns=['Clase', 'Filas']),
+                             hide_index=True)
+            if buffer.metricas_path:
+                st.caption(f"Métricas en formato Prometheus: `{buffer.metricas_path}`")
+
+            st.divider()
+
+            st.write("### Registros Fallidos")
+            st.caption("Registros que agotaron sus reintentos automáticos de sincronización.")
+
+            agrupar_por = st.radio("Agrupar por", ['curso_id', 'error_clase', 'ultimo_error'],
+                                   format_func={'curso_id': 'Curso', 'error_clase': 'Clase de error',
+                                                'ultimo_error': 'Texto del error'}.get,
+                                   horizontal=True)
+            grupos = buffer.agrupar_fallidas(por=agrupar_por)
+
+            if grupos.empty:
+                st.info("No hay registros fallidos")
+            else:
+                st.dataframe(grupos, hide_index=True, use_container_width=True)
+
+                col1, col2 = st.columns(2)
+                with col1:
+                    curso_fallidas = st.selectbox(
+                        "Curso", ["(todos)"] + sorted(buffer.agrupar_fallidas('curso_id')['curso_id'])
+                    )
+                with col2:
+                    error_contiene = st.text_input("Error contiene", placeholder="ej: timeout, quota")
+
+                filtros = {
+                    'curso_id': None if curso_fallidas == "(todos)" else curso_fallidas,
+                    'error_contiene': error_contiene.strip() or None
+                }
+                seleccion = buffer.get_fallidas(**filtros)
+                with st.expander(f"Ver {len(seleccion)} registros seleccionados"):
+                    st.dataframe(seleccion, hide_index=True, use_container_width=True)
+
+                if st.button("♻️ Reintentar Seleccionadas", disabled=seleccion.empty):
+                    reenviadas = buffer.reenviar_fallidas(**filtros)
+                    st.success(f"✅ {reenviadas} registros vuelven a la cola de sincronización")
+
+            st.divider()
+
+            st.write("### Cambios de Estado sin Enviar")
+            retenidos = buffer.get_cambios_retenidos()
+            if retenidos.empty:
+                st.info("No hay cambios de estado retenidos")
+            else:
+                st.warning(f"⚠️ {len(retenidos)} cambios de estado de asistencias que ya estaban en Sheets "
+                           "no se enviaron: SYNC_UPDATES está desactivado. Se enviarán como "
+                           "updateAsistencia al activarlo (requiere esa acción en el Apps Script).")
+                st.dataframe(retenidos, hide_index=True, use_container_width=True)
+
+            st.divider()
+
+            st.write("### Recarga desde Google Sheets")
+            st.caption("Al iniciar sesión solo se traen las filas nuevas de la hoja. "
+                       "Usa la recarga completa si la hoja se editó a mano.")
+
+            if st.button("🔄 Recarga Completa desde Sheets"):
+                with st.spinner("Recargando hoja completa..."):
+                    cargados = buffer.recargar_desde_sheets()
+                st.success(f"✅ {cargados} asistencias cargadas desde Sheets")
+
+            st.divider()
+
             st.write("### Limpieza de Registros")
             dias = st.number_input("Mantener últimos N días", min_value=1, max_value=30, value=7)
 
@@ -12,6 +12,11 @@ import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+from api_client import get_api_client
+from snapshot_cache import get_snapshot_cache
+from config_cursos import descargar_config
+from registros_cursos import get_registros_cursos
+
 # Configuración básica
 st.set_page_config(page_title="Inscripción de Participantes", layout="wide")
 
@@ -21,6 +26,8 @@ MAESTRO_LOCAL_PATH = Path(__file__).parent / "maestro_adherentes.parquet"
 SECRET_PASSWORD = st.secrets["SECRET_PASSWORD"]
 API_URL = st.secrets["API_URL"]  # URL del Apps Script publicado como aplicación web
 API_KEY = st.secrets["API_KEY"]  # Clave API configurada en el Apps Script
+API = get_api_client(API_URL, API_KEY)  # Sesión HTTP compartida del proceso
+SNAPSHOT_DIR = Path(st.secrets.get("SNAPSHOT_DIR", "snapshots"))  # Último config bueno y espejo de registros
 SMTP_USER = st.secrets.get("SMTP_USER", "")
 SMTP_PASSWORD = st.secrets.get("SMTP_PASSWORD", "")
 MAESTRO_URL = st.secrets.get("MAESTRO_URL", None)
@@ -73,13 +80,15 @@ def buscar_sucursales(rut_empresa: str = "", razon_social: str = "") -> pl.DataF
         return df.filter(pl.col('Razón Social') == razon_social)
     return pl.DataFrame()
 
-@st.cache_data(show_spinner=False)
-def listar_empresas() -> list[str]:
+# cache_resource: la misma tupla para todas las llamadas (cache_data la
+# deserializaría completa en cada rerun del formulario)
+@st.cache_resource(show_spinner=False)
+def listar_empresas() -> tuple[str, ...]:
     df = load_maestro()
-    if df.is_empty(): return []
+    if df.is_empty(): return ()
     pdf = df.select(['Razón Social', 'Rut Empresa']).unique().to_pandas()
     pdf = pdf.dropna(subset=['Razón Social']).sort_values('Razón Social')
-    return [f"{r['Razón Social']} — {r['Rut Empresa']}" for _, r in pdf.iterrows()]
+    return tuple(f"{r['Razón Social']} — {r['Rut Empresa']}" for _, r in pdf.iterrows())
 
 # Listas para formulario
 ROLES = ["TRABAJADOR", "PROFESIONAL SST", "MIEMBRO DE COMITÉ PARITARIO", 
@@ -143,71 +152,34 @@ def enviar_confirmacion(destinatario, nombres, apellido_paterno, rut, curso_id,
         pass  # El correo es opcional — no interrumpe la inscripción
 
 
+# Descarga de la configuración de cursos (la sirve CONFIG, ver get_config_data)
+def _descargar_config():
+    return descargar_config(API, fechas_utc=False)
+
+# Snapshot de cursos compartido por todas las sesiones: se renueva en segundo
+# plano y se persiste en Parquet para arrancar con datos aunque el API esté caído
+CONFIG = get_snapshot_cache("inscripcion.config", _descargar_config, ttl=300,
+                            ruta=SNAPSHOT_DIR / "inscripcion_config.parquet")
+
+# Inscripciones: espejo local en DuckDB (ver registros_cursos.py). Sin podar
+# columnas: la descarga por curso exporta todas.
+REGISTROS = get_registros_cursos(SNAPSHOT_DIR / "inscripcion_registros.duckdb", API)
+
 # Función para obtener datos de configuración desde la API
-@st.cache_data(ttl=300)  # Cache por 5 minutos
 def get_config_data():
     try:
-        response = requests.get(f"{API_URL}?action=getConfig&key={API_KEY}")
-        data = response.json()
-        
-        if data['success']:
-            df = pd.DataFrame(data['cursos'])
-            if not df.empty:
-                # Convertir columnas de fecha a datetime (probando múltiples formatos)
-                date_cols = ['fecha_inicio', 'fecha_fin', 'fecha_sesion_1', 'fecha_sesion_2', 'fecha_sesion_3', 'fecha_sesion_4']
-                for col in date_cols:
-                    if col in df.columns:
-                        df[col] = pd.to_datetime(df[col], errors='coerce')
-
-                if 'cupo_maximo' in df.columns:
-                    df['cupo_maximo'] = pd.to_numeric(df['cupo_maximo'], errors='coerce')
-                if 'num_sesiones' in df.columns:
-                    df['num_sesiones'] = pd.to_numeric(df['num_sesiones'], errors='coerce').fillna(3).astype(int)
-                else:
-                    # Auto-detectar num_sesiones contando columnas fecha_sesion_N no nulas
-                    def _count_sesiones(row):
-                        count = 0
-                        for i in range(1, 5):
-                            col = f'fecha_sesion_{i}'
-                            if col in row.index and pd.notna(row[col]) and row[col] != '':
-                                count = i
-                        return max(count, 3)
-                    df['num_sesiones'] = df.apply(_count_sesiones, axis=1).astype(int)
-            return df
-        else:
-            st.error(f"Error al obtener configuración: {data.get('error', 'Error desconocido')}")
-            return pd.DataFrame()
+        return CONFIG.get()  # Vista sin copia del snapshot compartido
     except Exception as e:
-        st.error(f"Error al conectar con la API: {str(e)}")
-        return pd.DataFrame()
-
-# Función para obtener registros desde la API
-@st.cache_data(ttl=180)  # Cache por 3 minutos (se actualiza más frecuentemente)
-def get_registros_data():
-    try:
-        response = requests.get(f"{API_URL}?action=getRegistros&key={API_KEY}")
-        data = response.json()
-        
-        if data['success']:
-            return pd.DataFrame(data['registros'])
-        else:
-            st.error(f"Error al obtener registros: {data.get('error', 'Error desconocido')}")
-            return pd.DataFrame()
-    except Exception as e:
-        st.error(f"Error al conectar con la API: {str(e)}")
+        st.error(f"Error al obtener configuración: {str(e)}")
         return pd.DataFrame()
 
 # Función para activar un curso
 def activar_curso(curso_id):
     try:
-        response = requests.post(
-            API_URL,
-            params={"action": "activarCurso", "key": API_KEY},
-            json={"curso_id": curso_id}
-        )
-        data = response.json()
+        data = API.post('activarCurso', {"curso_id": curso_id})
         
         if data['success']:
+            CONFIG.invalidar()
             return True
         else:
             st.error(f"Error al activar curso: {data.get('error', 'Error desconocido')}")
@@ -219,14 +191,10 @@ def activar_curso(curso_id):
 # Función para crear un nuevo curso
 def crear_curso(curso_data):
     try:
-        response = requests.post(
-            API_URL,
-            params={"action": "addCurso", "key": API_KEY},
-            json=curso_data
-        )
-        data = response.json()
+        data = API.post('addCurso', curso_data)
         
         if data['success']:
+            CONFIG.invalidar()
             return True
         else:
             st.error(f"Error al crear curso: {data.get('error', 'Error desconocido')}")
@@ -257,15 +225,10 @@ def guardar_registro(registro, max_retries=3):
                 time.sleep(jitter)
                 st.info(f"🔄 Reintentando... (intento {attempt + 1}/{max_retries})")
 
-            response = requests.post(
-                API_URL,
-                params={"action": "addRegistro", "key": API_KEY},
-                json=registro,
-                timeout=15  # Timeout de 15 segundos
-            )
-            data = response.json()
+            data = API.post('addRegistro', registro)  # Timeout de 15 segundos (api_client.TIMEOUTS)
 
             if data['success']:
+                REGISTROS.invalidar()  # El cupo se recalcula con el próximo delta
                 return True
             else:
                 error_msg = data.get('error', 'Error desconocido')
@@ -315,8 +278,7 @@ def formato_fecha_dd_mm_yyyy(fecha):
 # Función para obtener el curso activo
 def get_curso_activo():
     try:
-        response = requests.get(f"{API_URL}?action=getCursoActivo&key={API_KEY}")
-        data = response.json()
+        data = API.get('getCursoActivo')
 
         if data['success']:
             return data['curso']
@@ -345,9 +307,19 @@ try:
 
     # Botón para limpiar cache (útil cuando hay actualizaciones)
     if st.sidebar.button("🔄 Actualizar Datos"):
-        st.cache_data.clear()
-        st.sidebar.success("✅ Cache limpiado. Datos actualizados.")
-        st.rerun()
+        with st.spinner("Descargando cursos e inscritos..."):
+            # Hoja completa de inscritos: toma también las filas editadas
+            for recargar in (CONFIG.refrescar, REGISTROS.recargar):
+                try:
+                    recargar()
+                except Exception:
+                    pass  # Queda en ultimo_error; se siguen mostrando los últimos datos
+        if CONFIG.ultimo_error or REGISTROS.ultimo_error:
+            st.sidebar.warning("⚠️ No se pudo actualizar; se muestran los últimos datos descargados.")
+        else:
+            st.sidebar.success("✅ Cache limpiado. Datos actualizados.")
+            st.rerun()
+    st.sidebar.caption(REGISTROS.describir_edades(CONFIG))
 
     if password == SECRET_PASSWORD:
         st.sidebar.success("✅ Acceso concedido")
@@ -484,8 +456,8 @@ try:
         # Gestión de registros existentes
         st.sidebar.subheader("Gestión de Registros")
         
-        # Obtener registros existentes
-        df_registros = get_registros_data()
+        # Espejo de registros existentes
+        espejo = REGISTROS.get_espejo()
         
         # Selector de curso para descargar
         if not df_cursos.empty:
@@ -498,9 +470,9 @@ try:
             )
             
             if curso_seleccionado_descarga and st.sidebar.button("Descargar Registros"):
-                # Filtrar registros del curso seleccionado
-                if not df_registros.empty:
-                    registros_curso = df_registros[df_registros['curso_id'] == curso_seleccionado_descarga]
+                # Registros del curso seleccionado (consulta al espejo)
+                if espejo.filas:
+                    registros_curso = espejo.get_registros_curso(curso_seleccionado_descarga)
                     
                     if not registros_curso.empty:
                         # Preparar Excel para descarga
@@ -634,13 +606,8 @@ try:
                             st.write(f"📅 Sesión {i}: {formato_fecha_dd_mm_yyyy(curso_actual[fecha_col])}")
 
             # Verificar cupos disponibles
-            df_registros = get_registros_data()
-            if not df_registros.empty:
-                inscritos_actuales = len(df_registros[df_registros['curso_id'] == curso_actual['curso_id']])
-                cupos_disponibles = int(curso_actual['cupo_maximo']) - inscritos_actuales
-            else:
-                inscritos_actuales = 0
-                cupos_disponibles = int(curso_actual['cupo_maximo'])
+            inscritos_actuales = REGISTROS.get_espejo().contar_inscritos(curso_actual['curso_id'])
+            cupos_disponibles = int(curso_actual['cupo_maximo']) - inscritos_actuales
 
             # Mostrar información de cupos
             col1, col2, col3 = st.columns(3)
@@ -745,30 +712,19 @@ try:
 
                 if st.form_submit_button("Enviar"):
                     # Verificar nuevamente los cupos disponibles
-                    df_registros = get_registros_data()
-                    if not df_registros.empty:
-                        inscritos_actuales = len(df_registros[df_registros['curso_id'] == curso_actual['curso_id']])
-                        cupos_disponibles = int(curso_actual['cupo_maximo']) - inscritos_actuales
-                    else:
-                        cupos_disponibles = int(curso_actual['cupo_maximo'])
+                    espejo = REGISTROS.get_espejo()
+                    inscritos_actuales = espejo.contar_inscritos(curso_actual['curso_id'])
+                    cupos_disponibles = int(curso_actual['cupo_maximo']) - inscritos_actuales
 
                     # Normalizar RUT para comparación (formato estándar: 12345678-5)
                     rut_normalizado = rut_chile.format_rut_without_dots(rut).upper()
 
-                    # Verificar si el usuario ya está inscrito en este curso
-                    if not df_registros.empty:
-                        # Normalizar todos los RUTs en el dataframe para comparación
-                        df_registros['rut_normalizado'] = df_registros['rut'].apply(lambda x: rut_chile.format_rut_without_dots(str(x)).upper() if x else '')
-
-                        usuario_ya_inscrito = df_registros[
-                            (df_registros['rut_normalizado'] == rut_normalizado) &
-                            (df_registros['curso_id'] == curso_actual['curso_id'])
-                        ]
-
-                        if not usuario_ya_inscrito.empty:
-                            st.error("⚠️ Ya estás inscrito en este curso")
-                            st.info(f"📅 Inscripción registrada el: {usuario_ya_inscrito.iloc[0]['fecha_registro']}")
-                            st.stop()  # Detener ejecución
+                    # Verificar si el usuario ya está inscrito en este curso (búsqueda en el espejo)
+                    usuario_ya_inscrito = espejo.buscar_inscrito(curso_actual['curso_id'], rut_normalizado)
+                    if usuario_ya_inscrito is not None:
+                        st.error("⚠️ Ya estás inscrito en este curso")
+                        st.info(f"📅 Inscripción registrada el: {usuario_ya_inscrito.get('fecha_registro')}")
+                        st.stop()  # Detener ejecución
 
                     if cupos_disponibles <= 0:
                         st.error("Lo sentimos, mientras se procesaba su solicitud se agotaron los cupos disponibles.")
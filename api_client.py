@@ -0,0 +1,174 @@
+"""
+Cliente HTTP compartido para el Apps Script API
+===============================================
+
+Un solo requests.Session por (URL, key) y proceso, compartido por las dos
+apps y por el buffer de asistencias:
+
+- Conexiones keep-alive en un pool: el handshake TLS con Apps Script se paga
+  una vez por proceso y no en cada llamada.
+- Respuestas comprimidas (Accept-Encoding: gzip).
+- Timeout por acción (ninguna llamada queda sin límite).
+- Conteo de llamadas, segundos y bytes recibidos por acción.
+- Circuit breaker: por defecto las llamadas pasan por el breaker compartido
+  del proceso (ver circuit_breaker.py).
+
+Uso:
+    from api_client import get_api_client
+
+    api = get_api_client(API_URL, API_KEY)
+    data = api.get('getConfig')
+    data = api.post('addRegistro', registro)
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import get_circuit_breaker
+
+# Segundos máximos de lectura por acción del Apps Script
+TIMEOUTS = {
+    'getConfig': 15,
+    'getRegistros': 30,
+    'getAsistencias': 15,
+    'getCursoActivo': 10,
+    'activarCurso': 15,
+    'addCurso': 15,
+    'addRegistro': 15,
+    'addAsistencia': 10,
+    'updateAsistencia': 10,
+    'addAsistenciasBatch': 30,
+}
+TIMEOUT_DEFAULT = 20
+TIMEOUT_CONEXION = 5     # Segundos para abrir la conexión (TCP + TLS)
+CONEXIONES_POR_HOST = 32  # Tamaño del pool (>= sync_workers del buffer)
+
+
+class ApiClient:
+    """
+    Cliente thread-safe del Apps Script con conexiones reutilizables.
+    """
+
+    def __init__(self, api_url, api_key, breaker=None, timeouts=None):
+        """
+        Args:
+            api_url: URL del Apps Script API
+            api_key: Key del API
+            breaker: CircuitBreaker por defecto (default: el compartido del proceso)
+            timeouts: Dict acción → segundos que reemplaza entradas de TIMEOUTS
+        """
+        self.api_url = api_url
+        self.api_key = api_key
+        self.breaker = breaker or get_circuit_breaker()
+        self.timeouts = dict(TIMEOUTS, **(timeouts or {}))
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=CONEXIONES_POR_HOST)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+        self._lock = threading.Lock()
+        self._estadisticas = defaultdict(lambda: {'llamadas': 0, 'errores': 0, 'segundos': 0.0,
+                                                  'bytes': 0, 'bytes_red': 0})
+
+    def get(self, action, params=None, **kwargs):
+        """GET de una acción; retorna el JSON de respuesta (ver llamar)."""
+        return self.llamar('GET', action, params=params, **kwargs)
+
+    def post(self, action, body=None, **kwargs):
+        """POST de una acción con body JSON; retorna el JSON de respuesta (ver llamar)."""
+        return self.llamar('POST', action, body=body, **kwargs)
+
+    def llamar(self, metodo, action, params=None, body=None, timeout=None, breaker=True):
+        """
+        Ejecuta una acción del Apps Script.
+
+        Args:
+            metodo: 'GET' o 'POST'
+            action: Acción del API (getConfig, addRegistro, ...)
+            params: Parámetros de query adicionales a action y key
+            body: Body JSON (POST)
+            timeout: Segundos de lectura (default: TIMEOUTS[action])
+            breaker: True = breaker del cliente, False = sin breaker,
+                     o un CircuitBreaker específico
+
+        Returns:
+            dict: Respuesta JSON del API
+
+        Raises:
+            CircuitoAbiertoError: Si el circuito está abierto
+            requests.exceptions.RequestException, ValueError: Errores de red o JSON
+        """
+        if breaker is True:
+            breaker = self.breaker
+        if breaker:
+            return breaker.ejecutar(self._enviar, metodo, action, params, body, timeout)
+        return self._enviar(metodo, action, params, body, timeout)
+
+    def _enviar(self, metodo, action, params, body, timeout):
+        """Hace el request y registra tiempos y tamaños."""
+        query = {"action": action, "key": self.api_key, **(params or {})}
+        lectura = timeout or self.timeouts.get(action, TIMEOUT_DEFAULT)
+        inicio = time.perf_counter()
+        error = True
+        tamano = tamano_red = 0
+        try:
+            response = self._session.request(
+                metodo, self.api_url, params=query, json=body,
+                timeout=(TIMEOUT_CONEXION, lectura)
+            )
+            tamano = len(response.content)
+            # Bytes que viajaron por la red (comprimidos si hubo gzip)
+            tamano_red = int(response.headers.get('Content-Length') or response.raw.tell() or tamano)
+            data = response.json()
+            error = False
+            return data
+        finally:
+            with self._lock:
+                e = self._estadisticas[action]
+                e['llamadas'] += 1
+                e['errores'] += error
+                e['segundos'] += time.perf_counter() - inicio
+                e['bytes'] += tamano
+                e['bytes_red'] += tamano_red
+
+    def get_estadisticas(self):
+        """
+        Obtiene el consumo acumulado por acción.
+
+        Returns:
+            dict: acción → {llamadas, errores, segundos, bytes, bytes_red}
+        """
+        with self._lock:
+            return {action: dict(e, segundos=round(e['segundos'], 3))
+                    for action, e in self._estadisticas.items()}
+
+    def close(self):
+        """Cierra las conexiones del pool."""
+        self._session.close()
+
+
+_clientes = {}
+_clientes_lock = threading.Lock()
+
+
+def get_api_client(api_url, api_key):
+    """
+    Obtiene el cliente compartido del proceso para una URL y key.
+
+    Args:
+        api_url: URL del Apps Script API
+        api_key: Key del API
+
+    Returns:
+        ApiClient: Instancia única por (api_url, api_key)
+    """
+    with _clientes_lock:
+        if (api_url, api_key) not in _clientes:
+            _clientes[(api_url, api_key)] = ApiClient(api_url, api_key)
+        return _clientes[(api_url, api_key)]
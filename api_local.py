@@ -0,0 +1,306 @@
+"""
+Stand-in Local del Apps Script API
+==================================
+
+Servidor HTTP mínimo que imita las acciones del Apps Script que usa el
+buffer de asistencias y el espejo de registros. Permite probar y medir la
+sincronización sin tocar Google Sheets, con una latencia configurable por
+request.
+
+Como el frontend de Google, mantiene las conexiones abiertas (HTTP/1.1
+keep-alive) y comprime con gzip las respuestas grandes.
+
+Las escrituras respetan idempotency_key: si la clave ya se procesó con
+éxito, se responde lo mismo sin volver a escribir (cuenta en repetidos).
+
+Acciones soportadas:
+- GET  getConfig
+- GET  getAsistencias (parámetro opcional desde: filas ya leídas)
+- GET  getRegistros (parámetro opcional desde: filas ya leídas)
+- POST addRegistro
+- POST addAsistencia
+- POST updateAsistencia (cambio de estado; si la fila no existe, la agrega)
+- POST addAsistenciasBatch (cada fila con op 'add' o 'update')
+
+Uso:
+    from api_local import iniciar_api_local
+
+    api = iniciar_api_local(latencia=0.3)
+    buffer = AsistenciaBuffer(api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0)
+    buffer.sincronizar()
+    api.detener()
+
+También se puede ejecutar directamente:
+    python api_local.py --port 8765 --latencia 0.3
+"""
+
+import gzip
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class ApiLocal:
+    """
+    Estado en memoria de la API local (equivalente a la hoja de asistencias).
+    """
+
+    def __init__(self, api_key="local", latencia=0.0, latencia_fila=0.0):
+        """
+        Args:
+            api_key: Key que deben enviar los clientes
+            latencia: Segundos de espera fijos por request (simula Apps Script)
+            latencia_fila: Segundos adicionales por fila escrita
+        """
+        self.api_key = api_key
+        self.latencia = latencia
+        self.latencia_fila = latencia_fila
+        self.asistencias = []
+        self.registros = []       # Hoja de inscripciones (se puede poblar directo)
+        self.cursos = []          # Hoja de configuración de cursos
+        self.fallar_ruts = set()  # RUTs que responden con error (pruebas)
+        self.llamadas = {}
+        self.url = None
+        self.repetidos = 0        # Escrituras respondidas por idempotency_key
+        self.conexiones = 0       # Conexiones TCP aceptadas (keep-alive las reutiliza)
+        self._claves = set()
+        self._sockets = set()     # Conexiones abiertas (se cierran al detener)
+        self._idempotencia = {}   # idempotency_key → resultado
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    # ==================== ACCIONES ====================
+
+    def get_asistencias(self, params):
+        desde = int(params.get('desde') or 0)
+        with self._lock:
+            return {'success': True,
+                    'asistencias': self.asistencias[desde:],
+                    'total': len(self.asistencias)}
+
+    def get_config(self):
+        with self._lock:
+            return {'success': True, 'cursos': list(self.cursos)}
+
+    def get_registros(self, params):
+        desde = int(params.get('desde') or 0)
+        with self._lock:
+            return {'success': True,
+                    'registros': self.registros[desde:],
+                    'total': len(self.registros)}
+
+    def add_registro(self, registro):
+        faltantes = [c for c in ('curso_id', 'rut') if not registro.get(c)]
+        if faltantes:
+            return {'success': False, 'error': f"Faltan campos: {', '.join(faltantes)}"}
+        with self._lock:
+            self.registros.append(dict(registro))
+        return {'success': True}
+
+    def add_asistencia(self, asistencia):
+        time.sleep(self.latencia_fila)
+        return self._idempotente(asistencia, self._guardar_asistencia)
+
+    def add_asistencias_batch(self, body):
+        asistencias = body.get('asistencias') or []
+        time.sleep(self.latencia_fila * len(asistencias))
+        resultados = []
+        for asistencia in asistencias:
+            if asistencia.get('op') == 'update':
+                resultado = self._idempotente(asistencia, self._actualizar_asistencia)
+            else:
+                resultado = self._idempotente(asistencia, self._guardar_asistencia)
+            resultado['id'] = asistencia.get('id')
+            resultados.append(resultado)
+        return {'success': True, 'resultados': resultados}
+
+    def update_asistencia(self, asistencia):
+        time.sleep(self.latencia_fila)
+        return self._idempotente(asistencia, self._actualizar_asistencia)
+
+    def _idempotente(self, asistencia, operacion):
+        clave = asistencia.get('idempotency_key')
+        if clave:
+            with self._lock:
+                if clave in self._idempotencia:
+                    self.repetidos += 1
+                    return dict(self._idempotencia[clave])
+        resultado = operacion(asistencia)
+        if clave and resultado.get('success'):
+            with self._lock:
+                self._idempotencia[clave] = dict(resultado)
+        return resultado
+
+    def _actualizar_asistencia(self, asistencia):
+        if asistencia.get('rut') in self.fallar_ruts:
+            return {'success': False, 'error': 'Error simulado por la API local'}
+
+        clave = (str(asistencia.get('curso_id')), str(asistencia.get('rut')),
+                 int(asistencia.get('sesion') or 0))
+        with self._lock:
+            for fila in self.asistencias:
+                if (str(fila['curso_id']), str(fila['rut']), int(fila['sesion'])) == clave:
+                    fila['estado'] = asistencia.get('estado', fila.get('estado'))
+                    fila['fecha_registro'] = asistencia.get('fecha_registro', fila.get('fecha_registro'))
+                    fila['metodo'] = asistencia.get('metodo', fila.get('metodo', ''))
+                    return {'success': True}
+        return self._guardar_asistencia(asistencia)
+
+    def _guardar_asistencia(self, asistencia):
+        faltantes = [c for c in ('curso_id', 'rut', 'sesion') if not asistencia.get(c)]
+        if faltantes:
+            return {'success': False, 'error': f"Faltan campos: {', '.join(faltantes)}"}
+
+        if asistencia['rut'] in self.fallar_ruts:
+            return {'success': False, 'error': 'Error simulado por la API local'}
+
+        clave = (str(asistencia['curso_id']), str(asistencia['rut']), int(asistencia['sesion']))
+        with self._lock:
+            if clave in self._claves:
+                return {'success': False, 'error': 'La asistencia ya existe'}
+            self._claves.add(clave)
+            self.asistencias.append({
+                'curso_id': clave[0],
+                'rut': clave[1],
+                'sesion': clave[2],
+                'fecha_registro': asistencia.get('fecha_registro'),
+                'estado': asistencia.get('estado', 'presente'),
+                'metodo': asistencia.get('metodo', '')
+            })
+        return {'success': True}
+
+    # ==================== SERVIDOR ====================
+
+    def despachar(self, metodo, action, params, body):
+        """Ejecuta una acción y retorna el dict de respuesta."""
+        with self._lock:
+            self.llamadas[action] = self.llamadas.get(action, 0) + 1
+
+        time.sleep(self.latencia)
+
+        if params.get('key') != self.api_key:
+            return {'success': False, 'error': 'API key inválida'}
+
+        if metodo == 'GET' and action == 'getAsistencias':
+            return self.get_asistencias(params)
+        if metodo == 'GET' and action == 'getConfig':
+            return self.get_config()
+        if metodo == 'GET' and action == 'getRegistros':
+            return self.get_registros(params)
+        if metodo == 'POST' and action == 'addRegistro':
+            return self.add_registro(body)
+        if metodo == 'POST' and action == 'addAsistencia':
+            return self.add_asistencia(body)
+        if metodo == 'POST' and action == 'updateAsistencia':
+            return self.update_asistencia(body)
+        if metodo == 'POST' and action == 'addAsistenciasBatch':
+            return self.add_asistencias_batch(body)
+
+        return {'success': False, 'error': f'Acción no soportada: {action}'}
+
+    def iniciar(self, host="127.0.0.1", port=0):
+        """Levanta el servidor en un thread daemon y retorna la URL base."""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, como el frontend de Google
+
+            def setup(self):
+                super().setup()
+                with api._lock:
+                    api.conexiones += 1
+                    api._sockets.add(self.request)
+
+            def finish(self):
+                with api._lock:
+                    api._sockets.discard(self.request)
+                super().finish()
+
+            def _responder(self, metodo):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                body = {}
+                largo = int(self.headers.get('Content-Length') or 0)
+                if largo:
+                    body = json.loads(self.rfile.read(largo) or b'{}')
+
+                data = api.despachar(metodo, params.get('action', ''), params, body)
+
+                payload = json.dumps(data, default=str).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                if len(payload) > 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    payload = gzip.compress(payload)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                try:
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # El cliente se fue (ej: su timeout venció)
+
+            def do_GET(self):
+                self._responder('GET')
+
+            def do_POST(self):
+                self._responder('POST')
+
+            def log_message(self, format, *args):
+                pass  # Silencioso
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}/"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def detener(self):
+        """Detiene el servidor y corta las conexiones keep-alive abiertas."""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            with self._lock:
+                for sock in self._sockets:
+                    try:
+                        sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+
+def iniciar_api_local(port=0, api_key="local", latencia=0.0, latencia_fila=0.0):
+    """
+    Crea e inicia una API local en un puerto libre (o el indicado).
+
+    Returns:
+        ApiLocal: Instancia con atributos url y api_key listos para el buffer
+    """
+    api = ApiLocal(api_key=api_key, latencia=latencia, latencia_fila=latencia_fila)
+    api.iniciar(port=port)
+    return api
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="API local que imita el Apps Script")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--key", default="local")
+    parser.add_argument("--latencia", type=float, default=0.3)
+    parser.add_argument("--latencia-fila", type=float, default=0.0)
+    args = parser.parse_args()
+
+    api = iniciar_api_local(port=args.port, api_key=args.key,
+                            latencia=args.latencia, latencia_fila=args.latencia_fila)
+    print(f"🧪 API local escuchando en {api.url} (key={api.api_key})")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        api.detener()
@@ -0,0 +1,264 @@
+"""
+Benchmarks del buffer de asistencias.
+Mide el rendimiento del buffer contra la API local (api_local.py),
+sin tocar Google Sheets.
+
+Uso:
+    python bench_buffer.py            # Todos los benchmarks
+    python bench_buffer.py sync       # Solo los indicados
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from api_client import ApiClient
+from api_local import iniciar_api_local
+from db_buffer import AsistenciaBuffer, _clave_asistencia
+from espejo_registros import EspejoRegistros
+from snapshot_cache import SnapshotCache
+
+# ─────────────────────────────────────────────
+
+def seccion(titulo):
+    print(f"\n{'═'*60}")
+    print(f"  {titulo}")
+    print(f"{'═'*60}")
+
+def nuevo_buffer(api, **kwargs):
+    """Crea un buffer en un archivo temporal apuntando a la API local."""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_buffer_"), "buffer.duckdb")
+    kwargs.setdefault('auto_sync_interval', 0)
+    buffer = AsistenciaBuffer(db_path=db_path, api_url=api.url, api_key=api.api_key, **kwargs)
+    buffer.esperar_hidratacion()
+    return buffer
+
+def marcar_backlog(buffer, n, curso_id="BENCH-1", sesion=1):
+    for i in range(n):
+        buffer.marcar_asistencia(curso_id=curso_id, rut=f"{10000000 + i}-K", sesion=sesion)
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+def drenar(buffer, batch_size=50):
+    """Sincroniza hasta vaciar el buffer. Retorna (segundos, sincronizados)."""
+    total = 0
+    inicio = time.perf_counter()
+    while True:
+        stats = buffer.sincronizar(batch_size=batch_size)
+        total += stats['sincronizados']
+        if stats['total_pendientes'] == 0 or stats['sincronizados'] == 0:
+            break
+    return time.perf_counter() - inicio, total
+
+# ─────────────────────────────────────────────
+
+def bench_sync(n=100, latencia=0.1):
+    seccion(f"SYNC — {n} filas pendientes, latencia API {latencia*1000:.0f}ms")
+
+    for nombre, kwargs in [
+        ("Por fila (addAsistencia)", {}),
+        ("Por lotes de 25 (addAsistenciasBatch)", {'sync_por_lotes': True, 'filas_por_request': 25}),
+        ("Por lotes de 100 (addAsistenciasBatch)", {'sync_por_lotes': True, 'filas_por_request': 100}),
+    ]:
+        api = iniciar_api_local(latencia=latencia)
+        buffer = nuevo_buffer(api, **kwargs)
+        marcar_backlog(buffer, n)
+        segundos, sincronizados = drenar(buffer)
+        requests_api = sum(v for k, v in api.llamadas.items() if k != 'getAsistencias')
+        print(f"  {nombre:<40} {segundos:7.2f}s  {sincronizados / segundos:8.1f} filas/s  "
+              f"({requests_api} requests)")
+        buffer.close(presupuesto_s=0)  # Sin drenaje: no suma al tiempo medido
+        api.detener()
+
+def bench_workers(n=1000, latencia=0.1):
+    seccion(f"SYNC CONCURRENTE — backlog de {n} filas, latencia API {latencia*1000:.0f}ms")
+    print(f"  (Referencia por fila con 1 worker: ~{n * (latencia + 0.1):.0f}s)")
+
+    for nombre, kwargs in [
+        ("Por fila, 16 workers", {'sync_workers': 16}),
+        ("Lotes de 25, 1 worker", {'sync_por_lotes': True, 'filas_por_request': 25}),
+        ("Lotes de 25, 4 workers", {'sync_por_lotes': True, 'filas_por_request': 25,
+                                    'sync_workers': 4}),
+    ]:
+        api = iniciar_api_local(latencia=latencia)
+        buffer = nuevo_buffer(api, **kwargs)
+        for c in range(4):
+            marcar_backlog(buffer, n // 4, curso_id=f"BENCH-{c}")
+        segundos, sincronizados = drenar(buffer, batch_size=200)
+        print(f"  {nombre:<40} {segundos:7.2f}s  {sincronizados / segundos:8.1f} filas/s  "
+              f"({sincronizados} sincronizadas)")
+        buffer.close(presupuesto_s=0)
+        api.detener()
+
+def bench_group_commit(n=400, concurrencia=64):
+    seccion(f"CHECK-IN — {n} participantes, {concurrencia} simultáneos")
+
+    def verificar_y_marcar(buffer, curso_id, rut):
+        if buffer.verificar_asistencia(curso_id, rut, 1):
+            return False
+        return buffer.marcar_asistencia(curso_id, rut, 1)['success']
+
+    def registrar(buffer, curso_id, rut):
+        return buffer.registrar_si_no_existe(curso_id, rut, 1)['success']
+
+    for nombre, funcion, kwargs in [
+        ("Por fila (verificar + marcar)", verificar_y_marcar, {}),
+        ("registrar_si_no_existe (1 sentencia)", registrar, {}),
+        ("Group commit (INSERT agrupado)", registrar, {'group_commit': True}),
+    ]:
+        api = iniciar_api_local()
+        buffer = nuevo_buffer(api, **kwargs)
+
+        def participante(i):
+            inicio = time.perf_counter()
+            ok = funcion(buffer, "BENCH-GC", f"{20000000 + i}-K")
+            return ok, time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+            resultados = list(executor.map(participante, range(n)))
+        total = time.perf_counter() - inicio
+        latencias = [d * 1000 for _, d in resultados]
+        print(f"  {nombre:<38} p50 {percentil(latencias, 50):7.1f}ms  "
+              f"p99 {percentil(latencias, 99):7.1f}ms  total {total:5.2f}s  "
+              f"({sum(ok for ok, _ in resultados)} ok)")
+        buffer.close(presupuesto_s=0)
+        api.detener()
+
+def bench_memoria_indice(n=100_000):
+    seccion(f"ÍNDICE EN MEMORIA — {n:,} claves (curso_id, rut, sesion)")
+
+    tracemalloc.start()
+    claves = {_clave_asistencia(f"curso-{i % 50}", f"{10000000 + i}-K", 1 + i % 8)
+              for i in range(n)}
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    inicio = time.perf_counter()
+    for i in range(n):
+        _clave_asistencia(f"curso-{i % 50}", f"{10000000 + i}-K", 1 + i % 8) in claves
+    consulta = (time.perf_counter() - inicio) / n
+    print(f"  {len(claves):,} claves  {memoria / 1024 / 1024:6.1f} MB  "
+          f"{memoria / len(claves):6.0f} bytes/clave  "
+          f"{consulta * 1e6:5.2f}µs por verificación")
+
+def bench_hidratacion(tamanos=(10_000, 100_000, 500_000)):
+    seccion("HIDRATACIÓN — getAsistencias → DuckDB")
+
+    for n in tamanos:
+        api = iniciar_api_local()
+        api.asistencias.extend(
+            {'curso_id': f"curso-{i % 50}", 'rut': f"{10000000 + i}-K", 'sesion': 1 + i % 8,
+             'fecha_registro': '2026-03-04T12:00:00.000Z', 'estado': 'presente'}
+            for i in range(n)
+        )
+        db_path = os.path.join(tempfile.mkdtemp(prefix="bench_buffer_"), "buffer.duckdb")
+        inicio = time.perf_counter()
+        buffer = AsistenciaBuffer(db_path=db_path, api_url=api.url, api_key=api.api_key,
+                                  auto_sync_interval=0)
+        arranque = time.perf_counter() - inicio
+        buffer.esperar_hidratacion()
+        total = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        repetidas = buffer.hydrate_from_sheets()
+        recarga = time.perf_counter() - inicio
+        filas = buffer.conn.execute("SELECT COUNT(*) FROM asistencias_buffer").fetchone()[0]
+        print(f"  {n:>9,} filas  constructor {arranque * 1000:5.0f}ms  listo {total:6.2f}s  "
+              f"({filas / total:9,.0f} filas/s)  re-hidratar {recarga:6.2f}s  ({repetidas} nuevas)")
+        buffer.close(presupuesto_s=0)
+        api.detener()
+
+def bench_datos_rerun(n=50_000, cursos=200, reruns=30):
+    seccion(f"DATOS POR RERUN — {n:,} registros en {cursos} cursos (rerun del admin)")
+
+    registros = [
+        {'curso_id': f"curso-{i % cursos}", 'rut': f"{10000000 + i}-K", 'nombres': f"NOMBRE {i}",
+         'apellido_paterno': "PATERNO", 'apellido_materno': "MATERNO", 'email': f"p{i}@correo.cl",
+         'sexo': "MUJER", 'rol': "TRABAJADOR", 'region': "METROPOLITANA", 'comuna': "SANTIAGO",
+         'rut_empresa': "76123456-7", 'razon_social': "EMPRESA SPA", 'id_ct': i % 900,
+         'num_suc': i % 40, 'nom_suc': "CASA MATRIZ", 'fecha_registro': "2026-03-04T12:00:00.000Z"}
+        for i in range(n)
+    ]
+    df_registros = pd.DataFrame(registros)
+    df_config = pd.DataFrame({'curso_id': [f"curso-{i}" for i in range(cursos)],
+                              'cupo_maximo': 40, 'num_sesiones': 3,
+                              'fecha_sesion_1': pd.Timestamp("2026-03-04")})
+    curso, rut = "curso-7", f"{10000000 + 7}-K"
+
+    # st.cache_data guarda el DataFrame serializado y lo deserializa en cada llamada
+    serializados = {'config': pickle.dumps(df_config), 'registros': pickle.dumps(df_registros)}
+
+    def rerun_cache_data():
+        for _ in range(2):
+            pickle.loads(serializados['config'])
+        for _ in range(3):  # Asistentes, validar inscrito y reportes
+            df = pickle.loads(serializados['registros'])
+            df[df['curso_id'] == curso]
+
+    config = SnapshotCache("bench.config", lambda: df_config, ttl=3600)
+    snapshot = SnapshotCache("bench.registros", lambda: df_registros, ttl=3600)
+
+    def rerun_snapshot():
+        for _ in range(2):
+            config.get()
+        for _ in range(3):
+            df = snapshot.get()
+            df[df['curso_id'] == curso]
+
+    api = iniciar_api_local()
+    api.registros.extend(registros)
+    cliente = ApiClient(api.url, api.api_key)
+    espejo = EspejoRegistros(None, cliente)
+    espejo.sincronizar()
+
+    def rerun_espejo():
+        for _ in range(2):
+            config.get()
+        espejo.get_registros_curso(curso)
+        espejo.buscar_inscrito(curso, rut)
+        espejo.get_registros_curso(curso, ruts=[rut])
+
+    for nombre, rerun in [("st.cache_data (deserializa)", rerun_cache_data),
+                          ("snapshot compartido (vistas)", rerun_snapshot),
+                          ("espejo DuckDB (por curso)", rerun_espejo)]:
+        rerun()
+        inicio = time.perf_counter()
+        for _ in range(reruns):
+            rerun()
+        segundos = (time.perf_counter() - inicio) / reruns
+
+        tracemalloc.start()
+        rerun()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {nombre:30} {segundos * 1000:7.2f}ms por rerun  "
+              f"pico de memoria {pico / 1024 / 1024:6.1f} MB")
+
+    espejo.close()
+    cliente.close()
+    api.detener()
+
+# ─────────────────────────────────────────────
+
+BENCHMARKS = {
+    'sync': bench_sync,
+    'workers': bench_workers,
+    'group_commit': bench_group_commit,
+    'memoria_indice': bench_memoria_indice,
+    'hidratacion': bench_hidratacion,
+    'datos_rerun': bench_datos_rerun,
+}
+
+if __name__ == "__main__":
+    seleccion = sys.argv[1:] or list(BENCHMARKS)
+    for nombre in seleccion:
+        BENCHMARKS[nombre]()
@@ -0,0 +1,370 @@
+"""
+Servidor del Buffer de Asistencias
+==================================
+
+DuckDB permite un solo proceso escritor por archivo, así que cada réplica de
+Streamlit no puede abrir su propio asistencias_buffer.duckdb. Este módulo
+levanta un servicio HTTP pequeño que es dueño del archivo y del loop de
+sincronización, y un cliente (BufferClient) con la misma interfaz que
+AsistenciaBuffer para que N procesos de Streamlit compartan un solo buffer.
+
+Protocolo: POST /<método> con {'args': [...], 'kwargs': {...}} en JSON;
+responde {'ok': True, 'resultado': ...} o {'ok': False, 'error': str,
+'tipo': str}. Los DataFrames viajan como Arrow IPC (base64) para conservar
+los tipos. GET /salud responde el estado de la hidratación.
+
+Uso:
+    python buffer_server.py --port 8766 --db asistencias_buffer.duckdb
+
+    # .streamlit/secrets.toml de cada réplica
+    BUFFER_SERVER_URL = "http://127.0.0.1:8766/"
+
+    # En código (get_buffer() lo hace solo si existe BUFFER_SERVER_URL)
+    from buffer_server import BufferClient
+    buffer = BufferClient("http://127.0.0.1:8766/")
+    buffer.marcar_asistencia(curso_id="RM-Mar26", rut="12345678-9", sesion=1)
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pyarrow as pa
+import requests
+
+# Métodos de AsistenciaBuffer que se pueden invocar remotamente
+METODOS_REMOTOS = (
+    'marcar_asistencia',
+    'registrar_si_no_existe',
+    'verificar_asistencia',
+    'get_estadisticas',
+    'get_asistencias_curso',
+    'get_todas_asistencias',
+    'get_asistencias_pendientes',
+    'get_estado_hidratacion',
+    'esperar_hidratacion',
+    'force_hydrate',
+    'recargar_desde_sheets',
+    'vaciar_buffer',
+    'limpiar_sincronizados',
+    'sincronizar',
+    'get_metricas',
+    'get_fallidas',
+    'get_cambios_retenidos',
+    'agrupar_fallidas',
+    'reenviar_fallidas',
+    'reanudar_fallidas',
+    'actualizar_sesiones_hoy',
+)
+
+# Atributos del buffer que el cliente expone como propiedades
+ATRIBUTOS_REMOTOS = {
+    'estado_hidratacion': lambda buffer: buffer.estado_hidratacion,
+    'metricas_path': lambda buffer: buffer.metricas_path,
+    'get_estado_breaker': lambda buffer: buffer.breaker.get_estado(),
+}
+
+# Métodos que retornan {'success': ...}: si el servidor no responde, el
+# cliente retorna un resultado fallido en vez de lanzar la excepción
+METODOS_CON_RESULTADO = ('marcar_asistencia', 'registrar_si_no_existe')
+
+
+class BufferServerError(Exception):
+    """Error de transporte o de ejecución al llamar al servidor del buffer."""
+
+
+# ==================== SERIALIZACIÓN ====================
+
+def _codificar(valor):
+    """
+    Convierte un resultado del buffer a algo serializable como JSON.
+
+    DataFrames → Arrow IPC en base64, fechas → ISO, dicts con claves tupla
+    (ej: por_sesion de get_estadisticas) → lista de pares, cualquier otro
+    iterable (ej: zip) → lista.
+    """
+    if isinstance(valor, pd.DataFrame):
+        sink = pa.BufferOutputStream()
+        tabla = pa.Table.from_pandas(valor, preserve_index=False)
+        with pa.ipc.new_stream(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+        return {'__frame__': base64.b64encode(sink.getvalue().to_pybytes()).decode('ascii')}
+    if isinstance(valor, (datetime, date)):
+        return {'__fecha__': valor.isoformat()}
+    if isinstance(valor, dict):
+        if any(isinstance(k, tuple) for k in valor):
+            return {'__tuplas__': [[list(k), _codificar(v)] for k, v in valor.items()]}
+        return {str(k): _codificar(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        return [_codificar(v) for v in valor]
+    if hasattr(valor, '__iter__') and not isinstance(valor, (str, bytes)):
+        return [_codificar(v) for v in valor]  # zip, generadores, Series...
+    if hasattr(valor, 'item'):  # Escalares numpy
+        return valor.item()
+    return valor
+
+
+def _decodificar(valor):
+    """Inverso de _codificar."""
+    if isinstance(valor, dict):
+        if '__frame__' in valor:
+            datos = base64.b64decode(valor['__frame__'])
+            return pa.ipc.open_stream(datos).read_all().to_pandas()
+        if '__fecha__' in valor:
+            return datetime.fromisoformat(valor['__fecha__'])
+        if '__tuplas__' in valor:
+            return {tuple(k): _decodificar(v) for k, v in valor['__tuplas__']}
+        return {k: _decodificar(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_decodificar(v) for v in valor]
+    return valor
+
+
+# ==================== SERVIDOR ====================
+
+class BufferServer:
+    """
+    Expone un AsistenciaBuffer por HTTP a otros procesos.
+    """
+
+    def __init__(self, buffer, token=None):
+        """
+        Args:
+            buffer: AsistenciaBuffer dueño del archivo DuckDB
+            token: Si se indica, los clientes deben enviarlo en X-Buffer-Token
+        """
+        self.buffer = buffer
+        self.token = token
+        self.url = None
+        self.llamadas = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def despachar(self, metodo, body):
+        """
+        Ejecuta un método del buffer y retorna el dict de respuesta.
+
+        Args:
+            metodo: Nombre del método (METODOS_REMOTOS o ATRIBUTOS_REMOTOS)
+            body: {'args': [...], 'kwargs': {...}}
+
+        Returns:
+            dict: {'ok': True, 'resultado': ...} o {'ok': False, 'error': str, 'tipo': str}
+        """
+        with self._lock:
+            self.llamadas[metodo] = self.llamadas.get(metodo, 0) + 1
+
+        try:
+            if metodo in ATRIBUTOS_REMOTOS:
+                resultado = ATRIBUTOS_REMOTOS[metodo](self.buffer)
+            elif metodo in METODOS_REMOTOS:
+                args = _decodificar(body.get('args') or [])
+                kwargs = _decodificar(body.get('kwargs') or {})
+                resultado = getattr(self.buffer, metodo)(*args, **kwargs)
+            else:
+                return {'ok': False, 'error': f'Método no soportado: {metodo}',
+                        'tipo': 'AttributeError'}
+            return {'ok': True, 'resultado': _codificar(resultado)}
+
+        except Exception as e:
+            return {'ok': False, 'error': str(e), 'tipo': type(e).__name__}
+
+    def iniciar(self, host="127.0.0.1", port=0):
+        """Levanta el servidor en un thread daemon y retorna la URL base."""
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive: una conexión por cliente
+
+            def _enviar(self, status, data):
+                payload = json.dumps(data, default=str).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _autorizado(self):
+                if servidor.token and self.headers.get('X-Buffer-Token') != servidor.token:
+                    self._enviar(401, {'ok': False, 'error': 'Token inválido',
+                                       'tipo': 'PermissionError'})
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._autorizado():
+                    return
+                if self.path.rstrip('/') == '/salud':
+                    self._enviar(200, servidor.despachar('get_estado_hidratacion', {}))
+                else:
+                    self._enviar(404, {'ok': False, 'error': 'No encontrado', 'tipo': 'LookupError'})
+
+            def do_POST(self):
+                largo = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(largo) or b'{}') if largo else {}
+                if servidor._server is None:
+                    # Detenido: cerrar también las conexiones keep-alive abiertas
+                    self.close_connection = True
+                    self._enviar(503, {'ok': False, 'error': 'Servidor detenido',
+                                       'tipo': 'ConnectionError'})
+                    return
+                if not self._autorizado():
+                    return
+                self._enviar(200, servidor.despachar(self.path.strip('/'), body))
+
+            def log_message(self, format, *args):
+                pass  # Silencioso
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}/"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def detener(self):
+        """Detiene el servidor (no cierra el buffer)."""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# ==================== CLIENTE ====================
+
+class _BreakerRemoto:
+    """Vista de solo lectura del circuit breaker del servidor (buffer.breaker)."""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+
+    def get_estado(self):
+        return self._cliente._llamar('get_estado_breaker')
+
+
+class BufferClient:
+    """
+    Cliente del servidor del buffer con la misma interfaz que AsistenciaBuffer.
+
+    Los métodos de METODOS_REMOTOS se reenvían tal cual al servidor; la
+    conexión HTTP se reutiliza (keep-alive) entre llamadas.
+    """
+
+    def __init__(self, url, token=None, timeout=30):
+        """
+        Args:
+            url: URL base del servidor (ej: http://127.0.0.1:8766/)
+            token: Token compartido (X-Buffer-Token), si el servidor lo exige
+            timeout: Segundos máximos por llamada
+        """
+        self.url = url.rstrip('/') + '/'
+        self.timeout = timeout
+        self.breaker = _BreakerRemoto(self)
+        self._session = requests.Session()
+        if token:
+            self._session.headers['X-Buffer-Token'] = token
+        self._metricas_path = None
+
+    def _llamar(self, metodo, *args, **kwargs):
+        """
+        Invoca un método en el servidor.
+
+        Raises:
+            BufferServerError: Si el servidor no responde o el método falla
+        """
+        try:
+            response = self._session.post(
+                self.url + metodo,
+                json={'args': _codificar(list(args)), 'kwargs': _codificar(kwargs)},
+                timeout=self.timeout
+            )
+            data = response.json()
+        except Exception as e:
+            raise BufferServerError(f'Servidor del buffer no disponible: {e}') from e
+
+        if not data.get('ok'):
+            if data.get('tipo') == 'AttributeError':
+                raise AttributeError(data.get('error'))
+            raise BufferServerError(f"{data.get('tipo')}: {data.get('error')}")
+        return _decodificar(data.get('resultado'))
+
+    def __getattr__(self, nombre):
+        if nombre not in METODOS_REMOTOS:
+            raise AttributeError(f"'BufferClient' no tiene el atributo '{nombre}'")
+
+        def metodo(*args, **kwargs):
+            if nombre in METODOS_CON_RESULTADO:
+                try:
+                    return self._llamar(nombre, *args, **kwargs)
+                except BufferServerError as e:
+                    return {'success': False, 'message': str(e), 'id': None}
+            return self._llamar(nombre, *args, **kwargs)
+
+        metodo.__name__ = nombre
+        return metodo
+
+    @property
+    def estado_hidratacion(self):
+        """Estado de la hidratación del buffer del servidor."""
+        return self._llamar('estado_hidratacion')
+
+    @property
+    def metricas_path(self):
+        """Archivo .prom que escribe el servidor (ruta en la máquina del servidor)."""
+        if self._metricas_path is None:
+            self._metricas_path = self._llamar('metricas_path') or ''
+        return self._metricas_path
+
+    def close(self):
+        """Cierra la conexión (el buffer sigue vivo en el servidor)."""
+        self._session.close()
+
+
+# ==================== EJECUCIÓN DIRECTA ====================
+
+if __name__ == "__main__":
+    import argparse
+
+    from db_buffer import AsistenciaBuffer
+
+    parser = argparse.ArgumentParser(description="Servidor compartido del buffer de asistencias")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--db", default="asistencias_buffer.duckdb")
+    parser.add_argument("--api-url", default=os.environ.get("API_URL"))
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY"))
+    parser.add_argument("--token", default=os.environ.get("BUFFER_SERVER_TOKEN"))
+    parser.add_argument("--auto-sync", type=int, default=15)
+    parser.add_argument("--lotes", action="store_true", help="Sincronizar con addAsistenciasBatch")
+    parser.add_argument("--updates", action="store_true", help="Enviar cambios de estado con updateAsistencia")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--group-commit", action="store_true")
+    parser.add_argument("--metricas", default=os.path.join("snapshots", "metricas_sync.prom"))
+    args = parser.parse_args()
+
+    buffer = AsistenciaBuffer(
+        db_path=args.db,
+        api_url=args.api_url,
+        api_key=args.api_key,
+        auto_sync_interval=args.auto_sync,
+        sync_por_lotes=args.lotes,
+        sync_updates=args.updates,
+        sync_workers=args.workers,
+        group_commit=args.group_commit,
+        metricas_path=args.metricas
+    )
+    servidor = BufferServer(buffer, token=args.token)
+    servidor.iniciar(host=args.host, port=args.port)
+    print(f"🗄️  Buffer {args.db} escuchando en {servidor.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        servidor.detener()
+        buffer.close()
@@ -0,0 +1,167 @@
+"""
+Circuit Breaker para el Apps Script API
+=======================================
+
+Evita seguir golpeando el Apps Script cuando no responde. Tras N fallos
+de conexión consecutivos el circuito se abre y todas las llamadas fallan
+al instante; pasado un tiempo se deja pasar un único request de prueba
+(semi-abierto) que decide si el circuito se cierra o se vuelve a abrir.
+
+Estados:
+- cerrado: el API responde, todas las llamadas pasan
+- abierto: el API está caído, las llamadas fallan sin hacer request
+- semi_abierto: una sola llamada de prueba en curso
+
+Uso:
+    from circuit_breaker import get_circuit_breaker
+
+    breaker = get_circuit_breaker()
+    data = breaker.ejecutar(lambda: requests.get(url, timeout=10).json())
+"""
+
+import threading
+import time
+
+CERRADO = 'cerrado'
+ABIERTO = 'abierto'
+SEMI_ABIERTO = 'semi_abierto'
+
+
+class CircuitoAbiertoError(Exception):
+    """El API está marcado como caído; la llamada no se realizó."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker thread-safe compartido por todas las sesiones del proceso.
+    """
+
+    def __init__(self, nombre="apps_script", umbral_fallos=5, tiempo_apertura=30):
+        """
+        Args:
+            nombre: Identificador del servicio protegido
+            umbral_fallos: Fallos consecutivos para abrir el circuito
+            tiempo_apertura: Segundos en estado abierto antes de probar de nuevo
+        """
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_apertura = tiempo_apertura
+        self._estado = CERRADO
+        self._fallos_consecutivos = 0
+        self._abierto_desde = 0.0
+        self._sonda_en_curso = False
+        self._aperturas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        """Estado actual (cerrado, abierto o semi_abierto)."""
+        with self._lock:
+            return self._estado
+
+    def permitir(self):
+        """
+        Indica si se puede hacer una llamada al API ahora.
+
+        Si el circuito está abierto y ya pasó tiempo_apertura, pasa a
+        semi-abierto y autoriza una sola llamada de prueba.
+
+        Returns:
+            bool: True si la llamada puede hacerse
+        """
+        with self._lock:
+            if self._estado == CERRADO:
+                return True
+
+            if self._estado == ABIERTO:
+                if time.monotonic() - self._abierto_desde < self.tiempo_apertura:
+                    return False
+                self._estado = SEMI_ABIERTO
+                self._sonda_en_curso = False
+
+            # Semi-abierto: solo una llamada de prueba a la vez
+            if self._sonda_en_curso:
+                return False
+            self._sonda_en_curso = True
+            return True
+
+    def registrar_exito(self):
+        """Registra una llamada exitosa (cierra el circuito)."""
+        with self._lock:
+            self._estado = CERRADO
+            self._fallos_consecutivos = 0
+            self._sonda_en_curso = False
+
+    def registrar_fallo(self):
+        """Registra una llamada fallida (puede abrir el circuito)."""
+        with self._lock:
+            self._fallos_consecutivos += 1
+            self._sonda_en_curso = False
+            if (self._estado == SEMI_ABIERTO
+                    or self._fallos_consecutivos >= self.umbral_fallos):
+                if self._estado != ABIERTO:
+                    self._aperturas += 1
+                self._estado = ABIERTO
+                self._abierto_desde = time.monotonic()
+
+    def ejecutar(self, funcion, *args, **kwargs):
+        """
+        Ejecuta una llamada al API protegida por el circuito.
+
+        Cualquier excepción de la llamada cuenta como fallo y se re-lanza.
+
+        Returns:
+            El resultado de funcion(*args, **kwargs)
+
+        Raises:
+            CircuitoAbiertoError: Si el circuito no permite llamadas ahora
+        """
+        if not self.permitir():
+            raise CircuitoAbiertoError(
+                "API no disponible temporalmente, se reintentará en unos segundos"
+            )
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception:
+            self.registrar_fallo()
+            raise
+        self.registrar_exito()
+        return resultado
+
+    def get_estado(self):
+        """
+        Obtiene el estado del circuito para monitoreo.
+
+        Returns:
+            dict: Estado, fallos consecutivos, aperturas y segundos hasta la próxima prueba
+        """
+        with self._lock:
+            restante = 0
+            if self._estado == ABIERTO:
+                restante = max(0, self.tiempo_apertura - (time.monotonic() - self._abierto_desde))
+            return {
+                'estado': self._estado,
+                'fallos_consecutivos': self._fallos_consecutivos,
+                'aperturas': self._aperturas,
+                'segundos_para_prueba': round(restante, 1)
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(nombre="apps_script"):
+    """
+    Obtiene el circuit breaker compartido del proceso para un servicio.
+
+    Args:
+        nombre: Identificador del servicio protegido
+
+    Returns:
+        CircuitBreaker: Instancia única por nombre
+    """
+    with _breakers_lock:
+        if nombre not in _breakers:
+            _breakers[nombre] = CircuitBreaker(nombre=nombre)
+        return _breakers[nombre]
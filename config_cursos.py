@@ -0,0 +1,74 @@
+"""
+Configuración de Cursos desde el Apps Script
+============================================
+
+Descarga y tipado de getConfig, compartidos por AsistenciaCurso e
+InscripcionCSV (antes cada app tenía su copia de la función).
+
+La única diferencia entre las apps es cómo se leen las fechas: AsistenciaCurso
+compara fechas de sesión con la fecha de hoy, así que las convierte desde UTC
+(el Apps Script las entrega como ISO con zona horaria) y las deja a medianoche.
+
+Uso:
+    from config_cursos import descargar_config
+
+    df = descargar_config(api, fechas_utc=True)
+"""
+
+import pandas as pd
+
+COLUMNAS_FECHA = ['fecha_inicio', 'fecha_fin', 'fecha_sesion_1', 'fecha_sesion_2',
+                  'fecha_sesion_3', 'fecha_sesion_4']
+
+
+def descargar_config(api, fechas_utc=False):
+    """
+    Descarga la configuración de cursos y tipa sus columnas.
+
+    Args:
+        api: ApiClient del Apps Script (ver api_client.py)
+        fechas_utc: Leer las fechas como UTC, quitar la zona y normalizar a
+                    medianoche (default: interpretar el texto tal cual)
+
+    Returns:
+        DataFrame: Un curso por fila, con fechas datetime, cupo_maximo
+                   numérico y num_sesiones entero
+
+    Raises:
+        RuntimeError: Si getConfig no responde success (el snapshot anterior
+                      se conserva)
+    """
+    data = api.get('getConfig')
+    if not data['success']:
+        raise RuntimeError(data.get('error', 'Error desconocido'))
+
+    df = pd.DataFrame(data['cursos'])
+    if df.empty:
+        return df
+
+    for col in COLUMNAS_FECHA:
+        if col in df.columns:
+            if fechas_utc:
+                df[col] = (pd.to_datetime(df[col], utc=True, errors='coerce')
+                           .dt.tz_convert(None)
+                           .dt.normalize())
+            else:
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+
+    if 'cupo_maximo' in df.columns:
+        df['cupo_maximo'] = pd.to_numeric(df['cupo_maximo'], errors='coerce')
+    if 'num_sesiones' in df.columns:
+        df['num_sesiones'] = pd.to_numeric(df['num_sesiones'], errors='coerce').fillna(3).astype(int)
+    else:
+        df['num_sesiones'] = df.apply(_contar_sesiones, axis=1).astype(int)
+    return df
+
+
+def _contar_sesiones(curso):
+    """Auto-detecta num_sesiones: última columna fecha_sesion_N con valor (mínimo 3)."""
+    cantidad = 0
+    for i in range(1, 5):
+        col = f'fecha_sesion_{i}'
+        if col in curso.index and pd.notna(curso[col]) and curso[col] != '':
+            cantidad = i
+    return max(cantidad, 3)
@@ -24,12 +24,154 @@ Uso:
 import duckdb
 import streamlit as st
 import pandas as pd
-import requests
+import pyarrow as pa
 import time
-from datetime import datetime
+import random
+import json
+import hashlib
+from datetime import datetime, timedelta
 from pathlib import Path
 import threading
+import weakref
+import queue
+from collections import Counter
 import atexit
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from api_client import get_api_client
+from circuit_breaker import get_circuit_breaker
+from metricas_sync import MetricasSync, clasificar_excepcion, ERROR_API, ERROR_TIMEOUT
+
+# Reintentos de sincronización con backoff exponencial (con jitter)
+MAX_INTENTOS_SYNC = 10          # Tras esto el registro queda como "fallida"
+BACKOFF_BASE_SEGUNDOS = 15      # Espera tras el 1er fallo
+BACKOFF_MAX_SEGUNDOS = 3600     # Espera máxima entre intentos
+
+MENSAJE_DUPLICADO = 'Ya existe un registro de asistencia para este participante en esta sesión'
+
+# Estados de la hidratación desde Google Sheets
+HIDRATANDO = 'hidratando'    # Descarga inicial en curso; se aceptan check-ins igual
+LISTO = 'listo'              # Buffer al día con la hoja
+DEGRADADO = 'degradado'      # La última hidratación falló; se reintenta con el auto-sync
+
+FILAS_POR_CARGA = 10000      # Filas por INSERT al hidratar (~0,1s de lock por bloque)
+
+# Categorías de los contadores en memoria de get_estadisticas
+PENDIENTES = 'pendientes'
+SINCRONIZADAS = 'sincronizadas'
+FALLIDAS = 'fallidas'
+CONTADORES_RESYNC_SEGUNDOS = 300  # Cada cuánto se recuentan desde DuckDB
+
+# Auto-sync adaptativo
+AUTO_SYNC_MAX_INACTIVO = 300      # Espera máxima (s) con la cola vacía o sin avance
+AUTO_SYNC_AGRUPAR_SEGUNDOS = 0.2  # Tras despertar por una escritura, espera a que lleguen más
+LOTE_SYNC_MIN = 10                # Filas por pasada del auto-sync (AIMD)
+LOTE_SYNC_MAX = 1000
+LOTE_SYNC_INCREMENTO = 50
+LOTE_SYNC_OBJETIVO_SEGUNDOS = 5   # Pasadas más lentas que esto reducen el lote a la mitad
+
+DRENAJE_PRESUPUESTO_SEGUNDOS = 20 # Tiempo máximo sincronizando al cerrar el buffer
+
+
+def _clave_asistencia(curso_id, rut, sesion):
+    """Clave normalizada (curso_id, RUT en mayúsculas sin espacios, sesión)."""
+    return (str(curso_id), str(rut).strip().upper(), int(sesion))
+
+
+def _id_asistencia(curso_id, rut, sesion):
+    """
+    ID determinístico derivado de la clave normalizada: un reintento o una
+    fila re-encolada conserva su ID (y su clave de idempotencia).
+    """
+    curso_id, rut, sesion = _clave_asistencia(curso_id, rut, sesion)
+    return f"ASIST-{curso_id}-{rut}-{sesion}"
+
+
+class _EscritorAgrupado:
+    """
+    Group commit de check-ins: los llamadores encolan filas y un thread
+    escritor las inserta en un solo INSERT multi-fila cada pocos ms (o al
+    juntar max_filas). Cada llamador espera el resultado de su propia fila.
+    """
+
+    def __init__(self, insertar, intervalo_ms=5, max_filas=200):
+        """
+        Args:
+            insertar: Función que recibe una lista de filas y retorna un resultado por fila
+            intervalo_ms: Espera máxima para juntar filas tras la primera
+            max_filas: Filas máximas por INSERT
+        """
+        self._insertar = insertar
+        self._intervalo = intervalo_ms / 1000
+        self._max_filas = max_filas
+        self._cola = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True,
+                                        name="group_commit")
+        self._thread.start()
+
+    def encolar(self, fila, timeout=10):
+        """
+        Encola una fila y espera su resultado.
+
+        Si pasa el timeout y el escritor aún no tomó la fila, se retira de la
+        cola y se lanza TimeoutError: la fila no se escribirá. Si ya la tomó,
+        se espera a que termine de escribirla en vez de informar un error.
+        """
+        futuro = Future()
+        self._cola.put((fila, futuro))
+        try:
+            return futuro.result(timeout=timeout)
+        except FutureTimeout:
+            if futuro.cancel():
+                raise TimeoutError(f"el check-in no se registró en {timeout}s; reintenta") from None
+            return futuro.result()
+
+    def detener(self):
+        """Procesa lo encolado y detiene el thread escritor."""
+        self._cola.put(None)
+        self._thread.join(timeout=5)
+
+    def _loop(self):
+        activo = True
+        while activo:
+            item = self._cola.get()
+            if item is None:
+                break
+
+            lote = [item]
+            limite = time.monotonic() + self._intervalo
+            while len(lote) < self._max_filas:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    item = self._cola.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if item is None:
+                    activo = False
+                    break
+                lote.append(item)
+
+            # Las filas retiradas por timeout (ver encolar) no se escriben
+            lote = [(fila, futuro) for fila, futuro in lote
+                    if futuro.set_running_or_notify_cancel()]
+            if not lote:
+                continue
+            try:
+                resultados = self._insertar([fila for fila, _ in lote])
+                for (_, futuro), resultado in zip(lote, resultados):
+                    futuro.set_result(resultado)
+            except Exception as e:
+                for _, futuro in lote:
+                    futuro.set_result({
+                        'success': False,
+                        'insertado': False,
+                        'duplicado': False,
+                        'message': f'Error al registrar en buffer: {str(e)}',
+                        'id': None
+                    })
 
 
 class AsistenciaBuffer:
@@ -42,7 +184,14 @@ class AsistenciaBuffer:
                  db_path="asistencias_buffer.duckdb",
                  api_url=None,
                  api_key=None,
-                 auto_sync_interval=60):
+                 auto_sync_interval=60,
+                 sync_por_lotes=False,
+                 sync_updates=False,
+                 filas_por_request=25,
+                 sync_workers=1,
+                 circuit_breaker=None,
+                 group_commit=False,
+                 metricas_path=None):
         """
         Inicializa el buffer de asistencias.
 
@@ -51,20 +200,64 @@ class AsistenciaBuffer:
             api_url: URL del Apps Script API
             api_key: Key del API
             auto_sync_interval: Intervalo de sincronización en segundos (0 = manual)
+            sync_por_lotes: Enviar varias filas por request (acción addAsistenciasBatch)
+            filas_por_request: Filas por request cuando sync_por_lotes está activo
+            sync_updates: Enviar los cambios de estado de filas ya en Sheets como
+                          updateAsistencia (op 'update'); requiere esa acción en el Apps Script
+            sync_workers: Requests simultáneos máximos hacia el API al sincronizar
+            circuit_breaker: CircuitBreaker a consultar (default: el compartido del proceso)
+            group_commit: Agrupar check-ins concurrentes en un solo INSERT (ver registrar_si_no_existe)
+            metricas_path: Archivo donde escribir las métricas de sync en formato Prometheus (opcional)
         """
         self.db_path = db_path
         self.api_url = api_url or st.secrets.get("API_URL")
         self.api_key = api_key or st.secrets.get("API_KEY")
         self.auto_sync_interval = auto_sync_interval
+        self.sync_por_lotes = sync_por_lotes
+        self.sync_updates = sync_updates
+        self.filas_por_request = max(1, int(filas_por_request))
+        self.sync_workers = max(1, int(sync_workers))
+        self.breaker = circuit_breaker or get_circuit_breaker()
+        self.metricas = MetricasSync()
+        self.metricas_path = metricas_path
         self.conn = None
+        self._local = threading.local()          # Un cursor DuckDB por thread
+        self._cursores = weakref.WeakSet()
+        self._cursores_lock = threading.Lock()
+        self._escritura = threading.RLock()      # Un solo escritor a la vez
+        self._claves = set()                     # Índice en memoria de asistencias existentes
+        self._contadores = Counter()             # (curso_id, sesion, categoría) → filas
+        self._contadores_lock = threading.Lock()
+        self._contadores_resync = 0.0
         self._sync_thread = None
         self._stop_sync = False
+        self._sync_lock = threading.Lock()  # Una sola pasada de sync a la vez
+        self._hay_escrituras = threading.Event()  # Despierta al auto-sync
+        self.lote_sync = 50                 # Filas por pasada del auto-sync (se adapta)
+        self._sesiones_hoy = frozenset()    # (curso_id, sesion) con sesión hoy: se sincronizan primero
+        self.ultimo_drenaje = None          # Resultado de drenar() al cerrar
+        self._sync_executor = None
+        self._escritor_agrupado = None
+        self._hydrate_thread = None
+        self._hidratacion_lock = threading.RLock()  # Una sola hidratación a la vez
+        self._hidratacion_terminada = threading.Event()
+        self._hidratacion = {'estado': HIDRATANDO, 'cargados': 0, 'reconciliados': 0,
+                             'error': None, 'ultima': None}
 
         self._init_database()
+        self._reconstruir_indice()
+        self._recontar()
+
+        if group_commit:
+            self._escritor_agrupado = _EscritorAgrupado(self._insertar_si_no_existen)
 
-        # Hidratar desde Google Sheets para recuperar estado tras reinicios
+        # Hidratar desde Google Sheets para recuperar estado tras reinicios,
+        # en segundo plano para que el primer request no espere la descarga
         if self.api_url and self.api_key:
-            self.hydrate_from_sheets()
+            self._hydrate_thread = threading.Thread(target=self.hydrate_from_sheets, daemon=True)
+            self._hydrate_thread.start()
+        else:
+            self._terminar_hidratacion(DEGRADADO, error='API no configurada')
 
         # Iniciar sincronización automática si está habilitada
         if auto_sync_interval > 0:
@@ -91,10 +284,45 @@ class AsistenciaBuffer:
                 intentos_sync INTEGER DEFAULT 0,
                 ultimo_error VARCHAR,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                next_retry_at TIMESTAMP,
+                version INTEGER DEFAULT 1,
+                version_sincronizada INTEGER DEFAULT 0,
                 UNIQUE(curso_id, rut, sesion)
             )
         """)
 
+        # Migración de archivos creados antes de next_retry_at
+        self.conn.execute("""
+            ALTER TABLE asistencias_buffer
+            ADD COLUMN IF NOT EXISTS next_retry_at TIMESTAMP
+        """)
+        self.conn.execute("""
+            UPDATE asistencias_buffer
+            SET next_retry_at = created_at
+            WHERE sincronizado = false AND next_retry_at IS NULL
+        """)
+
+        # Migración de archivos creados antes del versionado (CDC)
+        self.conn.execute("ALTER TABLE asistencias_buffer ADD COLUMN IF NOT EXISTS version INTEGER DEFAULT 1")
+        self.conn.execute("""
+            ALTER TABLE asistencias_buffer
+            ADD COLUMN IF NOT EXISTS version_sincronizada INTEGER DEFAULT 0
+        """)
+        self.conn.execute("""
+            UPDATE asistencias_buffer
+            SET version_sincronizada = version
+            WHERE sincronizado = true AND version_sincronizada = 0
+        """)
+
+        # RUT normalizado (mayúsculas, sin espacios) en archivos anteriores
+        try:
+            self.conn.execute("""
+                UPDATE asistencias_buffer SET rut = upper(trim(rut))
+                WHERE rut <> upper(trim(rut))
+            """)
+        except duckdb.Error:
+            pass  # Mismo RUT con y sin normalizar: se deja como está
+
         # Índices para búsquedas rápidas
         self.conn.execute("""
             CREATE INDEX IF NOT EXISTS idx_sincronizado
@@ -106,11 +334,171 @@ class AsistenciaBuffer:
             ON asistencias_buffer(curso_id, sesion)
         """)
 
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_next_retry
+            ON asistencias_buffer(next_retry_at)
+        """)
+
+        # Dead-letter: copia de cada registro que agotó sus reintentos, con el
+        # payload que se intentó enviar y la clase del último error
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS asistencias_fallidas (
+                id VARCHAR PRIMARY KEY,
+                curso_id VARCHAR NOT NULL,
+                rut VARCHAR NOT NULL,
+                sesion INTEGER NOT NULL,
+                payload VARCHAR NOT NULL,
+                error_clase VARCHAR,
+                ultimo_error VARCHAR,
+                intentos INTEGER,
+                fallida_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Migración: fallidas de archivos anteriores a la tabla dead-letter
+        huerfanas = self.conn.execute("""
+            SELECT id, curso_id, rut, sesion, fecha_registro, estado, metodo,
+                   intentos_sync, version, ultimo_error
+            FROM asistencias_buffer b
+            WHERE sincronizado = false AND intentos_sync >= ?
+              AND NOT EXISTS (SELECT 1 FROM asistencias_fallidas f WHERE f.id = b.id)
+        """, [MAX_INTENTOS_SYNC]).fetchall()
+        columnas = ['id', 'curso_id', 'rut', 'sesion', 'fecha_registro', 'estado', 'metodo',
+                    'intentos_sync', 'version', 'ultimo_error']
+        for fila in huerfanas:
+            asistencia = dict(zip(columnas, fila))
+            self._guardar_fallida(self.conn, asistencia, asistencia['intentos_sync'],
+                                  {'error': asistencia['ultimo_error']})
+
+        # Cambios de estado de filas ya en Sheets: con sync_updates vuelven a
+        # la cola los que quedaron retenidos; sin él se retienen los pendientes,
+        # que enviados como alta se perderían con la respuesta "ya existe"
+        if self.sync_updates:
+            self.conn.execute("""
+                UPDATE asistencias_buffer
+                SET sincronizado = false, intentos_sync = 0, ultimo_error = NULL,
+                    next_retry_at = CAST(CURRENT_TIMESTAMP AS TIMESTAMP)
+                WHERE sincronizado = true AND version > version_sincronizada
+            """)
+        else:
+            self.conn.execute("""
+                DELETE FROM asistencias_fallidas f
+                USING asistencias_buffer b
+                WHERE b.id = f.id AND b.sincronizado = false AND b.version_sincronizada > 0
+            """)
+            self.conn.execute("""
+                UPDATE asistencias_buffer
+                SET sincronizado = true, intentos_sync = 0, ultimo_error = NULL
+                WHERE sincronizado = false AND version_sincronizada > 0
+            """)
+
+        # Metadatos del buffer (marca de agua de la hidratación incremental)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS buffer_meta (
+                clave VARCHAR PRIMARY KEY,
+                valor VARCHAR
+            )
+        """)
+
+    @property
+    def api(self):
+        """Cliente HTTP del Apps Script (conexiones compartidas por el proceso)."""
+        return get_api_client(self.api_url, self.api_key)
+
+    def _db(self):
+        """
+        Obtiene el cursor DuckDB del thread actual.
+
+        Una conexión DuckDB no debe usarse desde varios threads a la vez, y el
+        buffer es compartido por todas las sesiones de Streamlit y el thread de
+        sincronización. Cada thread obtiene su propio cursor (conexión duplicada
+        sobre la misma base), de modo que las lecturas corren en paralelo. Las
+        escrituras además se serializan con self._escritura para evitar
+        conflictos de transacción entre cursores.
+
+        Returns:
+            duckdb.DuckDBPyConnection: Cursor exclusivo del thread actual
+        """
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            with self._cursores_lock:
+                cursor = self.conn.cursor()
+                self._cursores.add(cursor)
+            self._local.cursor = cursor
+        return cursor
+
+    def _get_meta(self, clave, defecto=None):
+        """Lee un valor de buffer_meta."""
+        fila = self._db().execute(
+            "SELECT valor FROM buffer_meta WHERE clave = ?", [clave]
+        ).fetchone()
+        return fila[0] if fila else defecto
+
+    def _set_meta(self, clave, valor):
+        """Guarda un valor en buffer_meta."""
+        with self._escritura:
+            self._db().execute("""
+                INSERT INTO buffer_meta (clave, valor) VALUES (?, ?)
+                ON CONFLICT (clave) DO UPDATE SET valor = EXCLUDED.valor
+            """, [clave, str(valor)])
+
+    def _contar(self, filas, desde=None, hacia=None):
+        """
+        Mueve filas entre categorías de los contadores en memoria.
+
+        Args:
+            filas: Iterable de (curso_id, sesion)
+            desde: Categoría de origen (None = fila nueva)
+            hacia: Categoría de destino (None = fila eliminada)
+        """
+        with self._contadores_lock:
+            for curso_id, sesion in filas:
+                if desde:
+                    self._contadores[(curso_id, sesion, desde)] -= 1
+                if hacia:
+                    self._contadores[(curso_id, sesion, hacia)] += 1
+
+    def _recontar(self):
+        """
+        Recalcula los contadores en memoria con una sola pasada GROUP BY.
+        """
+        with self._escritura:
+            filas = self._db().execute("""
+                SELECT curso_id, sesion,
+                       CASE WHEN sincronizado THEN ?
+                            WHEN intentos_sync >= ? THEN ?
+                            ELSE ? END AS categoria,
+                       COUNT(*)
+                FROM asistencias_buffer
+                GROUP BY ALL
+            """, [SINCRONIZADAS, MAX_INTENTOS_SYNC, FALLIDAS, PENDIENTES]).fetchall()
+            with self._contadores_lock:
+                self._contadores = Counter({(c, s, cat): n for c, s, cat, n in filas})
+                self._contadores_resync = time.monotonic()
+
+    def _reconstruir_indice(self):
+        """
+        Recarga desde DuckDB el set en memoria de claves existentes.
+
+        Se usa al iniciar y tras borrados masivos; las inserciones agregan su
+        clave directamente.
+        """
+        with self._escritura:
+            filas = self._db().execute(
+                "SELECT curso_id, rut, sesion FROM asistencias_buffer"
+            ).fetchall()
+            self._claves = {_clave_asistencia(*fila) for fila in filas}
+
     def marcar_asistencia(self, curso_id, rut, sesion,
                           estado='presente', metodo='streamlit'):
         """
         Marca asistencia INMEDIATAMENTE en el buffer local.
 
+        Si la asistencia ya existe con otro estado (ej: presente → justificado)
+        se actualiza y sube su versión, de modo que el cambio también llegue a
+        Sheets. Varios cambios antes del próximo sync viajan como una sola
+        actualización con el último estado.
+
         Args:
             curso_id: ID del curso
             rut: RUT del participante
@@ -122,27 +510,73 @@ class AsistenciaBuffer:
             dict: {'success': True/False, 'message': str, 'id': str}
         """
         try:
-            # Generar ID único
-            timestamp = int(time.time() * 1000)
-            asist_id = f"ASIST-{curso_id}-{rut}-{sesion}-{timestamp}"
+            rut = _clave_asistencia(curso_id, rut, sesion)[1]
+            asist_id = _id_asistencia(curso_id, rut, sesion)
+            mensaje = 'Asistencia registrada en buffer local'
+            pendiente = True
 
             # Insertar en DuckDB (ultra rápido, <100ms)
-            self.conn.execute("""
-                INSERT INTO asistencias_buffer
-                (id, curso_id, rut, sesion, fecha_registro, estado, metodo)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT (curso_id, rut, sesion) DO UPDATE
-                SET fecha_registro = EXCLUDED.fecha_registro,
-                    estado = EXCLUDED.estado,
-                    metodo = EXCLUDED.metodo
-            """, [asist_id, curso_id, rut, sesion,
-                  datetime.now(), estado, metodo])
+            ahora = datetime.now()
+            with self._escritura:
+                db = self._db()
+                actual = db.execute("""
+                    SELECT id, estado, sincronizado, intentos_sync, version_sincronizada
+                    FROM asistencias_buffer
+                    WHERE curso_id = ? AND rut = ? AND sesion = ?
+                """, [curso_id, rut, sesion]).fetchone()
+
+                if actual is None:
+                    db.execute("""
+                        INSERT INTO asistencias_buffer
+                        (id, curso_id, rut, sesion, fecha_registro, estado, metodo, next_retry_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """, [asist_id, curso_id, rut, sesion,
+                          ahora, estado, metodo, ahora])
+                    self._claves.add(_clave_asistencia(curso_id, rut, sesion))
+                    self._contar([(curso_id, sesion)], hacia=PENDIENTES)
+                else:
+                    asist_id, estado_actual, sincronizado, intentos, version_sincronizada = actual
+                    if estado_actual == estado:
+                        mensaje = 'La asistencia ya estaba registrada con ese estado'
+                        pendiente = not sincronizado
+                    else:
+                        # Sin sync_updates, el cambio de una fila que ya está en
+                        # Sheets queda retenido (sincronizado, con version >
+                        # version_sincronizada) hasta que se active SYNC_UPDATES
+                        pendiente = self.sync_updates or not version_sincronizada
+                        db.execute("""
+                            UPDATE asistencias_buffer
+                            SET fecha_registro = ?,
+                                estado = ?,
+                                metodo = ?,
+                                version = version + 1,
+                                sincronizado = ?,
+                                intentos_sync = 0,
+                                ultimo_error = NULL,
+                                next_retry_at = ?
+                            WHERE id = ?
+                        """, [ahora, estado, metodo, not pendiente, ahora, asist_id])
+                        if sincronizado:
+                            desde = SINCRONIZADAS
+                        else:
+                            desde = FALLIDAS if intentos >= MAX_INTENTOS_SYNC else PENDIENTES
+                        if desde == FALLIDAS:
+                            db.execute("DELETE FROM asistencias_fallidas WHERE id = ?", [asist_id])
+                        self._contar([(curso_id, sesion)], desde=desde,
+                                     hacia=PENDIENTES if pendiente else SINCRONIZADAS)
+                        if pendiente:
+                            mensaje = 'Cambio de estado registrado en buffer local'
+                        else:
+                            mensaje = ('Cambio de estado guardado en el buffer; llegará a Sheets '
+                                       'cuando se active SYNC_UPDATES')
+            if pendiente:
+                self._hay_escrituras.set()
 
             return {
                 'success': True,
-                'message': 'Asistencia registrada en buffer local',
+                'message': mensaje,
                 'id': asist_id,
-                'sync_pending': True
+                'sync_pending': pendiente
             }
 
         except Exception as e:
@@ -152,31 +586,210 @@ class AsistenciaBuffer:
                 'id': None
             }
 
+    @property
+    def group_commit(self):
+        """True si los check-ins se escriben con group commit."""
+        return self._escritor_agrupado is not None
+
+    def _insertar_si_no_existen(self, filas):
+        """
+        Inserta varias asistencias en un solo INSERT multi-fila, sin
+        sobrescribir las que ya existen.
+
+        Args:
+            filas: Lista de dicts con curso_id, rut, sesion, estado y metodo
+
+        Returns:
+            list: Un dict {'success', 'insertado', 'duplicado', 'message', 'id'} por fila
+        """
+        ahora = datetime.now()
+
+        with self._escritura:
+            # Dentro del mismo lote, la primera fila de cada clave gana; las que
+            # ya están en el índice en memoria no llegan a DuckDB. El índice se
+            # consulta con el lock tomado, así que un INSERT simple basta
+            nuevas = []
+            ids = []
+            vistas = set()
+            for fila in filas:
+                clave = _clave_asistencia(fila['curso_id'], fila['rut'], fila['sesion'])
+                if clave in vistas or clave in self._claves:
+                    ids.append(None)
+                    continue
+                vistas.add(clave)
+                asist_id = _id_asistencia(*clave)
+                ids.append(asist_id)
+                nuevas.append([asist_id, fila['curso_id'], clave[1], fila['sesion'],
+                               ahora, fila['estado'], fila['metodo'], ahora])
+
+            insertadas = []
+            if nuevas:
+                try:
+                    self._insertar_filas(nuevas)
+                    insertadas = nuevas
+                except duckdb.ConstraintException:
+                    # Alguna fila ya estaba en DuckDB aunque no en el índice:
+                    # se reintenta fila por fila y las que chocan cuentan como duplicado
+                    for valores in nuevas:
+                        try:
+                            self._insertar_filas([valores])
+                            insertadas.append(valores)
+                        except duckdb.ConstraintException:
+                            pass
+                self._claves.update(vistas)
+                self._contar([(v[1], v[3]) for v in insertadas], hacia=PENDIENTES)
+        insertados = {v[0] for v in insertadas}
+        if insertados:
+            self._hay_escrituras.set()
+
+        resultados = []
+        for asist_id in ids:
+            if asist_id in insertados:
+                resultados.append({
+                    'success': True,
+                    'insertado': True,
+                    'duplicado': False,
+                    'message': 'Asistencia registrada en buffer local',
+                    'id': asist_id,
+                    'sync_pending': True
+                })
+            else:
+                resultados.append({
+                    'success': False,
+                    'insertado': False,
+                    'duplicado': True,
+                    'message': MENSAJE_DUPLICADO,
+                    'id': None
+                })
+        return resultados
+
+    def _insertar_filas(self, filas):
+        """
+        INSERT multi-fila simple (sin ON CONFLICT) en asistencias_buffer.
+
+        Args:
+            filas: Listas [id, curso_id, rut, sesion, fecha_registro, estado,
+                   metodo, next_retry_at]
+
+        Raises:
+            duckdb.ConstraintException: Si alguna fila ya existe (la sentencia no inserta ninguna)
+        """
+        placeholders = ", ".join(["(?, ?, ?, ?, ?, ?, ?, ?)"] * len(filas))
+        self._db().execute(f"""
+            INSERT INTO asistencias_buffer
+            (id, curso_id, rut, sesion, fecha_registro, estado, metodo, next_retry_at)
+            VALUES {placeholders}
+        """, [valor for fila in filas for valor in fila])
+
+    def registrar_si_no_existe(self, curso_id, rut, sesion,
+                               estado='presente', metodo='streamlit'):
+        """
+        Registra un check-in solo si no existe, en una sola sentencia atómica.
+
+        Reemplaza el par verificar_asistencia + marcar_asistencia: el índice en
+        memoria se consulta y actualiza bajo el lock de escritura, y solo las
+        filas nuevas llegan a DuckDB con un INSERT simple, sin ventana de
+        carrera entre la verificación y la inserción. Si DuckDB igual rechaza
+        la fila por la restricción UNIQUE, se informa como "ya existe".
+        Con group_commit activo la fila se encola y se inserta junto con las
+        de otros llamadores concurrentes.
+
+        Args:
+            curso_id: ID del curso
+            rut: RUT del participante
+            sesion: Número de sesión
+            estado: Estado de asistencia
+            metodo: Método de registro
+
+        Returns:
+            dict: {'success': bool, 'insertado': bool, 'duplicado': bool,
+                   'message': str, 'id': str}
+        """
+        fila = {'curso_id': curso_id, 'rut': rut, 'sesion': sesion,
+                'estado': estado, 'metodo': metodo}
+        try:
+            if _clave_asistencia(curso_id, rut, sesion) in self._claves:
+                return {
+                    'success': False,
+                    'insertado': False,
+                    'duplicado': True,
+                    'message': MENSAJE_DUPLICADO,
+                    'id': None
+                }
+            if self._escritor_agrupado:
+                return self._escritor_agrupado.encolar(fila)
+            return self._insertar_si_no_existen([fila])[0]
+        except Exception as e:
+            return {
+                'success': False,
+                'insertado': False,
+                'duplicado': False,
+                'message': f'Error al registrar en buffer: {str(e)}',
+                'id': None
+            }
+
+    def actualizar_sesiones_hoy(self, sesiones):
+        """
+        Indica qué sesiones ocurren hoy, para sincronizarlas antes que el resto.
+
+        La app la llama en cada carga con los cursos de get_config_data que
+        tienen sesión hoy (es lo que miran los relatores en Sheets).
+
+        Args:
+            sesiones: Iterable de (curso_id, sesion)
+        """
+        self._sesiones_hoy = frozenset((str(c), int(s)) for c, s in sesiones)
+
     def get_asistencias_pendientes(self, limit=50):
         """
         Obtiene asistencias pendientes de sincronizar.
 
+        Solo retorna registros cuyo próximo intento ya venció (next_retry_at).
+        El orden es por prioridad: primero las sesiones de hoy (ver
+        actualizar_sesiones_hoy), luego las correcciones manuales del admin y
+        al final el resto (backfill histórico). Dentro de cada prioridad los
+        registros se intercalan por curso (el 1° de cada curso, luego el 2°,
+        etc.) para que un curso con mucho backlog no retrase a los demás.
+
         Args:
             limit: Máximo número de registros a obtener
 
         Returns:
             list: Lista de diccionarios con asistencias pendientes
         """
-        query = """
+        params = []
+        sesiones_hoy = self._sesiones_hoy
+        if sesiones_hoy:
+            hoy = "list_contains(?, curso_id || '#' || sesion)"
+            params.append([f"{c}#{s}" for c, s in sesiones_hoy])
+        else:
+            hoy = "false"
+        params += [MAX_INTENTOS_SYNC, datetime.now(), limit]
+
+        query = f"""
             SELECT id, curso_id, rut, sesion, fecha_registro,
-                   estado, metodo, intentos_sync
-            FROM asistencias_buffer
-            WHERE sincronizado = false
-              AND intentos_sync < 5
-            ORDER BY created_at ASC
+                   estado, metodo, intentos_sync, version, version_sincronizada
+            FROM (
+                SELECT *,
+                       CASE WHEN {hoy} THEN 0
+                            WHEN metodo = 'admin_manual' THEN 1
+                            ELSE 2 END AS prioridad
+                FROM asistencias_buffer
+                WHERE sincronizado = false
+                  AND intentos_sync < ?
+                  AND next_retry_at <= ?
+            )
+            ORDER BY prioridad,
+                     ROW_NUMBER() OVER (PARTITION BY prioridad, curso_id ORDER BY created_at ASC),
+                     created_at ASC
             LIMIT ?
         """
 
-        result = self.conn.execute(query, [limit]).fetchall()
+        result = self._db().execute(query, params).fetchall()
 
         # Convertir a lista de diccionarios
         columns = ['id', 'curso_id', 'rut', 'sesion', 'fecha_registro',
-                   'estado', 'metodo', 'intentos_sync']
+                   'estado', 'metodo', 'intentos_sync', 'version', 'version_sincronizada']
 
         return [dict(zip(columns, row)) for row in result]
 
@@ -184,6 +797,11 @@ class AsistenciaBuffer:
         """
         Sincroniza asistencias pendientes con Google Sheets en lotes.
 
+        Con sync_workers > 1 los requests se envían en paralelo (como máximo
+        sync_workers en vuelo); los resultados se escriben en DuckDB desde este
+        mismo thread a medida que llegan. Si el circuit breaker está abierto
+        los registros se omiten sin gastar intentos.
+
         Args:
             batch_size: Tamaño del lote (default: 50)
 
@@ -194,52 +812,244 @@ class AsistenciaBuffer:
             'total_pendientes': 0,
             'sincronizados': 0,
             'fallidos': 0,
+            'omitidos': 0,
             'errores': []
         }
 
-        try:
-            # Obtener asistencias pendientes
-            pendientes = self.get_asistencias_pendientes(limit=batch_size)
-            stats['total_pendientes'] = len(pendientes)
+        with self._sync_lock:
+            inicio = time.perf_counter()
+            try:
+                # Obtener asistencias pendientes
+                pendientes = self.get_asistencias_pendientes(limit=batch_size)
+                stats['total_pendientes'] = len(pendientes)
+
+                if not pendientes:
+                    return stats
+
+                # Unidad de envío: una fila (addAsistencia) o N filas (addAsistenciasBatch)
+                tamano = self.filas_por_request if self.sync_por_lotes else 1
+                unidades = [pendientes[i:i + tamano]
+                            for i in range(0, len(pendientes), tamano)]
+
+                if self.sync_workers == 1 or len(unidades) == 1:
+                    for unidad in unidades:
+                        resultados = self._enviar_unidad(unidad)
+                        for asistencia, resultado in zip(unidad, resultados):
+                            self._registrar_resultado_sync(asistencia, resultado, stats)
+                else:
+                    if self._sync_executor is None:
+                        self._sync_executor = ThreadPoolExecutor(
+                            max_workers=self.sync_workers,
+                            thread_name_prefix="sync_worker"
+                        )
+                    futuros = {self._sync_executor.submit(self._enviar_unidad, unidad): unidad
+                               for unidad in unidades}
+                    for futuro in as_completed(futuros):
+                        unidad = futuros[futuro]
+                        for asistencia, resultado in zip(unidad, futuro.result()):
+                            self._registrar_resultado_sync(asistencia, resultado, stats)
 
-            if not pendientes:
                 return stats
 
-            # Enviar cada asistencia a Google Sheets
-            for asistencia in pendientes:
-                resultado = self._enviar_a_google_sheets(asistencia)
-
-                if resultado['success']:
-                    # Marcar como sincronizado
-                    self.conn.execute("""
-                        UPDATE asistencias_buffer
-                        SET sincronizado = true
-                        WHERE id = ?
-                    """, [asistencia['id']])
-                    stats['sincronizados'] += 1
-                else:
-                    # Incrementar contador de intentos
-                    self.conn.execute("""
-                        UPDATE asistencias_buffer
-                        SET intentos_sync = intentos_sync + 1,
-                            ultimo_error = ?
-                        WHERE id = ?
-                    """, [resultado.get('error', 'Error desconocido'),
-                          asistencia['id']])
-                    stats['fallidos'] += 1
-                    stats['errores'].append({
-                        'id': asistencia['id'],
-                        'error': resultado.get('error')
-                    })
+            except Exception as e:
+                stats['errores'].append({'error': f'Error general: {str(e)}'})
+                return stats
 
-                # Pequeño delay para no saturar API
-                time.sleep(0.1)
+            finally:
+                if stats['total_pendientes']:
+                    self.metricas.registrar_pasada(time.perf_counter() - inicio,
+                                                   stats['sincronizados'], stats['fallidos'])
+                if self.metricas_path:
+                    self._escribir_metricas()
 
-            return stats
+    def _enviar_unidad(self, unidad):
+        """
+        Envía una unidad de sincronización (thread-safe, no toca DuckDB).
 
-        except Exception as e:
-            stats['errores'].append({'error': f'Error general: {str(e)}'})
-            return stats
+        Args:
+            unidad: Lista de asistencias a enviar en un mismo request
+
+        Returns:
+            list: Un resultado por asistencia de la unidad
+        """
+        if not self.breaker.permitir():
+            return [{'success': False, 'omitido': True, 'clase': 'circuito_abierto',
+                     'error': 'API no disponible (circuito abierto)'} for _ in unidad]
+
+        if self.sync_por_lotes:
+            return self._enviar_lote_a_google_sheets(unidad)
+
+        resultado = self._enviar_a_google_sheets(unidad[0])
+        # Pequeño delay para no saturar API
+        time.sleep(0.1)
+        return [resultado]
+
+    def _registrar_resultado_sync(self, asistencia, resultado, stats):
+        """
+        Actualiza el estado de una asistencia según el resultado del envío.
+
+        Args:
+            asistencia: Dict con datos de asistencia
+            resultado: Dict {'success': bool, 'error': str}
+            stats: Dict de estadísticas de sincronizar() a actualizar
+        """
+        if resultado.get('omitido'):
+            # No se intentó el envío: queda pendiente sin consumir reintentos
+            self.metricas.registrar_error(resultado['clase'])
+            stats['omitidos'] += 1
+        elif resultado['success']:
+            # Marcar la versión enviada como sincronizada; si la fila cambió
+            # mientras el request estaba en vuelo, sigue pendiente (o queda
+            # retenida si no hay sync_updates, ver marcar_asistencia)
+            with self._escritura:
+                fila = self._db().execute("""
+                    UPDATE asistencias_buffer
+                    SET version_sincronizada = greatest(version_sincronizada, ?),
+                        sincronizado = version <= ? OR ?
+                    WHERE id = ?
+                    RETURNING sincronizado
+                """, [asistencia['version'], asistencia['version'], not self.sync_updates,
+                      asistencia['id']]).fetchone()
+                if fila and fila[0]:
+                    self._contar([(asistencia['curso_id'], asistencia['sesion'])],
+                                 desde=PENDIENTES, hacia=SINCRONIZADAS)
+            stats['sincronizados'] += 1
+        else:
+            # Incrementar contador de intentos y agendar el próximo con backoff
+            self.metricas.registrar_error(resultado.get('clase', ERROR_API))
+            intentos = asistencia['intentos_sync'] + 1
+            with self._escritura:
+                self._db().execute("""
+                    UPDATE asistencias_buffer
+                    SET intentos_sync = ?,
+                        ultimo_error = ?,
+                        next_retry_at = ?
+                    WHERE id = ?
+                """, [intentos,
+                      resultado.get('error', 'Error desconocido'),
+                      self._calcular_proximo_intento(intentos),
+                      asistencia['id']])
+                if intentos == MAX_INTENTOS_SYNC:
+                    self._guardar_fallida(self._db(), asistencia, intentos, resultado)
+                    self._contar([(asistencia['curso_id'], asistencia['sesion'])],
+                                 desde=PENDIENTES, hacia=FALLIDAS)
+            stats['fallidos'] += 1
+            stats['errores'].append({
+                'id': asistencia['id'],
+                'error': resultado.get('error'),
+                'clase': resultado.get('clase', ERROR_API)
+            })
+
+    def _guardar_fallida(self, db, asistencia, intentos, resultado):
+        """
+        Copia a la tabla dead-letter un registro que agotó sus reintentos.
+
+        Llamar con self._escritura tomado (o durante _init_database).
+
+        Args:
+            db: Cursor DuckDB a usar
+            asistencia: Dict con datos de asistencia (como get_asistencias_pendientes)
+            intentos: Intentos acumulados
+            resultado: Dict del último envío ({'error': str, 'clase': str})
+        """
+        db.execute("""
+            INSERT INTO asistencias_fallidas
+            (id, curso_id, rut, sesion, payload, error_clase, ultimo_error, intentos, fallida_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                payload = EXCLUDED.payload,
+                error_clase = EXCLUDED.error_clase,
+                ultimo_error = EXCLUDED.ultimo_error,
+                intentos = EXCLUDED.intentos,
+                fallida_at = EXCLUDED.fallida_at
+        """, [asistencia['id'], asistencia['curso_id'], asistencia['rut'], asistencia['sesion'],
+              json.dumps(self._payload_asistencia(asistencia), ensure_ascii=False),
+              resultado.get('clase', ERROR_API),
+              resultado.get('error') or 'Error desconocido',
+              intentos, datetime.now()])
+
+    @staticmethod
+    def _calcular_proximo_intento(intentos):
+        """
+        Calcula cuándo reintentar un registro tras N fallos.
+
+        Backoff exponencial (15s, 30s, 60s, ... hasta 1h) con jitter entre el
+        50% y el 100% de la espera, para no reintentar todo a la vez cuando el
+        API vuelve.
+
+        Args:
+            intentos: Número de intentos fallidos acumulados
+
+        Returns:
+            datetime: Momento a partir del cual el registro vuelve a ser elegible
+        """
+        espera = min(BACKOFF_MAX_SEGUNDOS,
+                     BACKOFF_BASE_SEGUNDOS * 2 ** max(0, intentos - 1))
+        return datetime.now() + timedelta(seconds=random.uniform(espera / 2, espera))
+
+    @staticmethod
+    def _payload_asistencia(asistencia):
+        """
+        Construye el JSON que espera el Apps Script para una asistencia.
+
+        Incluye idempotency_key (ver _clave_idempotencia): el Apps Script
+        responde success sin volver a escribir si ya procesó esa misma clave,
+        así que reenviar tras un timeout no cuesta un error de "ya existe".
+        """
+        payload = {
+            'curso_id': asistencia['curso_id'],
+            'rut': asistencia['rut'],
+            'sesion': asistencia['sesion'],
+            'fecha_registro': asistencia['fecha_registro'].isoformat(),
+            'estado': asistencia['estado'],
+            'metodo': asistencia['metodo'],
+        }
+        payload['idempotency_key'] = AsistenciaBuffer._clave_idempotencia(asistencia['id'], payload)
+        return payload
+
+    @staticmethod
+    def _clave_idempotencia(asist_id, payload):
+        """
+        Clave de idempotencia derivada del contenido del envío: ID más un hash
+        de curso_id, RUT normalizado, sesión, estado y fecha_registro.
+
+        No usa la versión de la fila: vuelve a 1 cuando la fila se re-hidrata
+        (vaciar_buffer, recargar_desde_sheets, archivo DuckDB nuevo), y una
+        edición posterior repetiría una clave ya procesada por el servidor.
+        Un reenvío del mismo contenido sí repite la clave.
+        """
+        curso_id, rut, sesion = _clave_asistencia(payload['curso_id'], payload['rut'], payload['sesion'])
+        contenido = "|".join([curso_id, rut, str(sesion), str(payload['estado']),
+                              str(payload['fecha_registro'])])
+        return f"{asist_id}-{hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:16]}"
+
+    def _operacion(self, asistencia):
+        """
+        'update' si la fila ya llegó a Sheets en una versión anterior, si no 'add'.
+
+        Sin sync_updates esos cambios no llegan a la cola (quedan retenidos,
+        ver get_cambios_retenidos), así que todo lo que se envía es un alta.
+        """
+        if self.sync_updates and asistencia.get('version_sincronizada'):
+            return 'update'
+        return 'add'
+
+    @staticmethod
+    def _interpretar_respuesta(data):
+        """
+        Normaliza la respuesta del Apps Script para una asistencia.
+
+        Returns:
+            dict: {'success': bool, 'error': str}
+        """
+        if data.get('success'):
+            return {'success': True}
+
+        error = data.get('error') or 'Error desconocido'
+        # Si ya existe, considerar como éxito (Apps Script sin idempotency_key)
+        if 'ya existe' in error.lower():
+            return {'success': True}
+        return {'success': False, 'error': error}
 
     def _enviar_a_google_sheets(self, asistencia):
         """
@@ -251,149 +1061,446 @@ class AsistenciaBuffer:
         Returns:
             dict: {'success': bool, 'error': str}
         """
+        accion = 'updateAsistencia' if self._operacion(asistencia) == 'update' else 'addAsistencia'
+        inicio = time.perf_counter()
         try:
-            response = requests.post(
-                self.api_url,
-                params={"action": "addAsistencia", "key": self.api_key},
-                json={
-                    'curso_id': asistencia['curso_id'],
-                    'rut': asistencia['rut'],
-                    'sesion': asistencia['sesion'],
-                    'fecha_registro': asistencia['fecha_registro'].isoformat(),
-                    'estado': asistencia['estado'],
-                    'metodo': asistencia['metodo']
-                },
-                timeout=10
-            )
+            # El breaker ya se consultó en _enviar_unidad: aquí solo se informa el resultado
+            data = self.api.post(accion, self._payload_asistencia(asistencia), breaker=False)
+            self.breaker.registrar_exito()
 
-            data = response.json()
+            return self._interpretar_respuesta(data)
 
-            if data.get('success'):
-                return {'success': True}
-            else:
-                error = data.get('error', 'Error desconocido')
-                # Si ya existe, considerar como éxito
-                if 'ya existe' in error.lower():
-                    return {'success': True}
-                return {'success': False, 'error': error}
+        except Exception as e:
+            self.breaker.registrar_fallo()
+            return {'success': False, 'error': str(e), 'clase': clasificar_excepcion(e)}
+
+        finally:
+            self.metricas.observar_llamada(accion, time.perf_counter() - inicio)
+
+    def _enviar_lote_a_google_sheets(self, lote):
+        """
+        Envía varias asistencias en un solo request (acción addAsistenciasBatch).
+
+        Cada fila lleva 'op': 'add' (nueva) o 'update' (cambio de estado de una
+        fila que ya está en Sheets). El Apps Script responde
+        {'success': True, 'resultados': [...]} con un resultado por fila, en el
+        mismo orden y con el 'id' enviado.
+
+        Args:
+            lote: Lista de dicts con datos de asistencia
+
+        Returns:
+            list: Un dict {'success': bool, 'error': str} por cada asistencia del lote
+        """
+        inicio = time.perf_counter()
+        try:
+            data = self.api.post('addAsistenciasBatch',
+                                 {'asistencias': [dict(self._payload_asistencia(a), id=a['id'],
+                                                       op=self._operacion(a))
+                                                  for a in lote]},
+                                 breaker=False)
+            self.breaker.registrar_exito()
+
+            if not data.get('success'):
+                error = data.get('error') or 'Error desconocido'
+                return [{'success': False, 'error': error} for _ in lote]
+
+            resultados = data.get('resultados') or []
+            por_id = {r.get('id'): r for r in resultados if r.get('id') is not None}
+
+            salida = []
+            for i, asistencia in enumerate(lote):
+                r = por_id.get(asistencia['id'])
+                if r is None and not por_id and i < len(resultados):
+                    r = resultados[i]
+                if r is None:
+                    salida.append({'success': False, 'error': 'Sin resultado para la fila en el lote'})
+                else:
+                    salida.append(self._interpretar_respuesta(r))
+            return salida
 
         except Exception as e:
-            return {'success': False, 'error': str(e)}
+            self.breaker.registrar_fallo()
+            clase = clasificar_excepcion(e)
+            return [{'success': False, 'error': str(e), 'clase': clase} for _ in lote]
+
+        finally:
+            self.metricas.observar_llamada('addAsistenciasBatch', time.perf_counter() - inicio)
 
     def hydrate_from_sheets(self):
         """
         Carga asistencias existentes desde Google Sheets al iniciar el buffer.
         Evita duplicados cuando la app se reinicia y el buffer queda vacío.
 
+        Es incremental: buffer_meta guarda cuántas filas de la hoja ya se
+        leyeron y solo se piden las siguientes (parámetro desde). Si la hoja
+        tiene menos filas que la marca de agua (se borraron filas), se vuelve
+        a leer completa.
+
+        Al terminar deja el buffer en estado listo o degradado (ver
+        get_estado_hidratacion).
+
         Returns:
-            int: Número de registros cargados desde Sheets
+            int: Número de registros nuevos cargados desde Sheets
+        """
+        with self._hidratacion_lock:
+            try:
+                desde = int(self._get_meta('hidratacion_filas', 0))
+                data = self._get_asistencias_sheets(desde)
+                if data.get('success') and data.get('total', desde) < desde:
+                    desde = 0
+                    data = self._get_asistencias_sheets(desde)
+
+                if not data.get('success'):
+                    raise RuntimeError(data.get('error') or 'getAsistencias no respondió success')
+
+                asistencias = data.get('asistencias') or []
+                cargados, reconciliados = self._cargar_asistencias_sheets(asistencias)
+
+                # Un Apps Script sin soporte de desde responde la hoja completa sin total
+                self._set_meta('hidratacion_filas', data.get('total', len(asistencias)))
+                self._terminar_hidratacion(LISTO, cargados=cargados, reconciliados=reconciliados)
+                return cargados
+
+            except Exception as e:
+                # Si falla la hidratación, el buffer sigue funcionando normal
+                self._terminar_hidratacion(DEGRADADO, error=str(e))
+                return 0
+
+    def _terminar_hidratacion(self, estado, cargados=0, reconciliados=0, error=None):
+        """Registra el resultado de una hidratación y despierta a quien la espera."""
+        self._hidratacion = {
+            'estado': estado,
+            'cargados': cargados,
+            'reconciliados': reconciliados,
+            'error': error,
+            'ultima': datetime.now()
+        }
+        self._hidratacion_terminada.set()
+
+    @property
+    def estado_hidratacion(self):
+        """Estado de la hidratación (hidratando, listo o degradado)."""
+        return self._hidratacion['estado']
+
+    def get_estado_hidratacion(self):
+        """
+        Obtiene el resultado de la última hidratación para monitoreo.
+
+        Returns:
+            dict: estado, cargados, reconciliados, error y fecha de la última
+        """
+        return dict(self._hidratacion)
+
+    def esperar_hidratacion(self, timeout=None):
+        """
+        Bloquea hasta que termine la hidratación inicial.
+
+        Args:
+            timeout: Segundos máximos de espera (None = sin límite)
+
+        Returns:
+            bool: True si la hidratación terminó (lista o degradada)
         """
+        return self._hidratacion_terminada.wait(timeout)
+
+    def _get_asistencias_sheets(self, desde=0):
+        """
+        Descarga las filas de asistencia de la hoja a partir de la fila desde.
+
+        Args:
+            desde: Número de filas ya leídas (0 = hoja completa)
+
+        Returns:
+            dict: Respuesta de getAsistencias (success, asistencias, total)
+        """
+        inicio = time.perf_counter()
         try:
-            response = requests.get(
-                self.api_url,
-                params={"action": "getAsistencias", "key": self.api_key},
-                timeout=15
-            )
-            data = response.json()
+            # Con el circuito abierto falla al instante en vez de esperar el timeout
+            return self.api.get('getAsistencias', {"desde": desde} if desde else None,
+                                breaker=self.breaker)
+        finally:
+            self.metricas.observar_llamada('getAsistencias', time.perf_counter() - inicio)
+
+    @staticmethod
+    def _frame_asistencias_sheets(asistencias):
+        """
+        Convierte la respuesta de getAsistencias en un DataFrame columnar listo
+        para insertar, sin recorrer las filas en Python.
 
-            if not data.get('success') or not data.get('asistencias'):
-                return 0
+        Args:
+            asistencias: Lista de dicts tal como la entrega el Apps Script
 
-            cargados = 0
-            for asist in data['asistencias']:
-                try:
-                    # ID consistente para registros provenientes de Sheets
-                    asist_id = f"SHEETS-{asist.get('curso_id','')}-{asist.get('rut','')}-{asist.get('sesion','')}"
+        Returns:
+            pd.DataFrame: id, curso_id, rut, sesion, fecha_registro, estado
+        """
+        df = pd.DataFrame(asistencias)
+        for columna, defecto in (('curso_id', ''), ('rut', ''), ('sesion', 0),
+                                 ('fecha_registro', ''), ('estado', 'presente')):
+            if columna not in df.columns:
+                df[columna] = defecto
+
+        # Sesión no numérica: la fila se descarta (float 1.0 → int 1)
+        sesion = pd.to_numeric(df['sesion'], errors='coerce')
+        df = df[sesion.notna()]
+        sesion = sesion[sesion.notna()].astype('int64')
+
+        # Fechas ISO 8601 de Apps Script (sufijo Z) en bloque; solo las que no
+        # calzan se parsean una a una, y las inválidas quedan con la hora actual
+        texto_fecha = df['fecha_registro'].astype(str)
+        fecha = pd.to_datetime(texto_fecha, utc=True, errors='coerce', format='ISO8601')
+        otras = fecha.isna()
+        if otras.any():
+            fecha[otras] = pd.to_datetime(texto_fecha[otras], utc=True, errors='coerce', format='mixed')
+        fecha = fecha.dt.tz_localize(None).fillna(pd.Timestamp(datetime.now()))
+
+        curso_id = df['curso_id'].fillna('').astype(str)
+        rut = df['rut'].fillna('').astype(str).str.strip().str.upper()
+        frame = pd.DataFrame({
+            # Mismo ID determinístico que las filas locales (ver _id_asistencia)
+            'id': 'ASIST-' + curso_id + '-' + rut + '-' + sesion.astype(str),
+            'curso_id': curso_id,
+            'rut': rut,
+            'rut_norm': rut,
+            'sesion': sesion,
+            'fecha_registro': fecha.astype('datetime64[us]'),
+            'estado': df['estado'].fillna('presente').astype(str),
+        })
+        return frame.drop_duplicates(subset=['curso_id', 'rut_norm', 'sesion'])
+
+    def _cargar_asistencias_sheets(self, asistencias):
+        """
+        Inserta en bloque las asistencias de Sheets que aún no están en el buffer.
 
-                    # Parsear fecha con fallback (compatible con sufijo Z de Apps Script)
-                    try:
-                        fecha_pd = pd.to_datetime(str(asist['fecha_registro']), utc=True, errors='coerce')
-                        fecha = fecha_pd.to_pydatetime().replace(tzinfo=None) if pd.notna(fecha_pd) else datetime.now()
-                    except Exception:
-                        fecha = datetime.now()
+        Registra el lote como tabla Arrow y hace un INSERT ... SELECT con
+        anti-join por (curso_id, RUT normalizado, sesión) cada FILAS_POR_CARGA
+        filas, soltando el lock de escritura entre bloques para no frenar los
+        check-ins.
 
-                    self.conn.execute("""
-                        INSERT INTO asistencias_buffer
-                        (id, curso_id, rut, sesion, fecha_registro, estado, metodo, sincronizado)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, true)
-                        ON CONFLICT (curso_id, rut, sesion) DO NOTHING
-                    """, [
-                        asist_id,
-                        str(asist.get('curso_id', '')),
-                        str(asist.get('rut', '')),
-                        int(asist.get('sesion', 0)),
-                        fecha,
-                        str(asist.get('estado', 'presente')),
-                        'sheets_hydration'
-                    ])
-                    cargados += 1
-                except Exception:
-                    continue
+        Los check-ins locales pendientes que ya estaban en la hoja (aceptados
+        mientras se hidrataba) se reconcilian: quedan como sincronizados y no
+        se reenvían. Los cambios de estado pendientes no se tocan.
 
-            return cargados
+        Args:
+            asistencias: Lista de dicts tal como la entrega el Apps Script
 
-        except Exception:
-            return 0  # Si falla la hidratación, el buffer sigue funcionando normal
+        Returns:
+            tuple: (registros nuevos cargados, check-ins locales reconciliados)
+        """
+        frame = self._frame_asistencias_sheets(asistencias)
+        if frame.empty:
+            return 0, 0
+
+        tabla = pa.Table.from_pandas(frame, preserve_index=False)
+        cargados = reconciliados = 0
+        for inicio in range(0, tabla.num_rows, FILAS_POR_CARGA):
+            bloque = tabla.slice(inicio, FILAS_POR_CARGA)
+            with self._escritura:
+                db = self._db()
+                db.register('asistencias_sheets', bloque)
+                try:
+                    nuevas = db.execute("""
+                        INSERT INTO asistencias_buffer
+                        (id, curso_id, rut, sesion, fecha_registro, estado, metodo,
+                         sincronizado, version, version_sincronizada)
+                        SELECT s.id, s.curso_id, s.rut, s.sesion, s.fecha_registro, s.estado,
+                               'sheets_hydration', true, 1, 1
+                        FROM asistencias_sheets s
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM asistencias_buffer b
+                            WHERE b.curso_id = s.curso_id
+                              AND upper(trim(b.rut)) = s.rut_norm
+                              AND b.sesion = s.sesion
+                        )
+                        RETURNING curso_id, sesion
+                    """).fetchall()
+                    reconciladas = db.execute(f"""
+                        UPDATE asistencias_buffer b
+                        SET sincronizado = true, ultimo_error = NULL,
+                            version_sincronizada = b.version
+                        FROM asistencias_sheets s
+                        WHERE b.sincronizado = false
+                          AND b.version_sincronizada = 0
+                          AND b.curso_id = s.curso_id
+                          AND upper(trim(b.rut)) = s.rut_norm
+                          AND b.sesion = s.sesion
+                        RETURNING b.curso_id, b.sesion, b.intentos_sync >= {MAX_INTENTOS_SYNC}
+                    """).fetchall()
+                    if any(r[2] for r in reconciladas):
+                        db.execute("""
+                            DELETE FROM asistencias_fallidas f
+                            WHERE EXISTS (SELECT 1 FROM asistencias_buffer b
+                                          WHERE b.id = f.id AND b.sincronizado)
+                        """)
+                finally:
+                    db.unregister('asistencias_sheets')
+                self._contar(nuevas, hacia=SINCRONIZADAS)
+                for agotada in (False, True):
+                    self._contar([r[:2] for r in reconciladas if r[2] == agotada],
+                                 desde=FALLIDAS if agotada else PENDIENTES, hacia=SINCRONIZADAS)
+                cargados += len(nuevas)
+                reconciliados += len(reconciladas)
+                self._claves.update(zip(bloque.column('curso_id').to_pylist(),
+                                        bloque.column('rut_norm').to_pylist(),
+                                        bloque.column('sesion').to_pylist()))
+        return cargados, reconciliados
 
     def force_hydrate(self):
         """
-        Elimina registros sincronizados del buffer y recarga todo desde Google Sheets.
+        Trae desde Google Sheets las asistencias nuevas desde la última hidratación.
         Llamar cuando el admin inicia sesión para garantizar datos actualizados.
 
         Returns:
-            int: Número de registros cargados
+            int: Número de registros nuevos cargados
         """
-        self.conn.execute("DELETE FROM asistencias_buffer WHERE sincronizado = true")
         return self.hydrate_from_sheets()
 
+    def recargar_desde_sheets(self):
+        """
+        Elimina registros sincronizados del buffer y recarga la hoja completa.
+        Acción de mantenimiento para cuando la hoja se editó a mano.
+
+        Returns:
+            int: Número de registros cargados
+        """
+        with self._hidratacion_lock:
+            with self._escritura:
+                # Los cambios retenidos no están en la hoja: se conservan
+                borradas = self._db().execute("""
+                    DELETE FROM asistencias_buffer
+                    WHERE sincronizado = true AND version <= version_sincronizada
+                    RETURNING curso_id, sesion
+                """).fetchall()
+                self._db().execute("DELETE FROM buffer_meta WHERE clave = 'hidratacion_filas'")
+                self._reconstruir_indice()
+                self._contar(borradas, desde=SINCRONIZADAS)
+            return self.hydrate_from_sheets()
+
     def _start_auto_sync(self):
-        """Inicia thread de sincronización automática."""
+        """
+        Inicia thread de sincronización automática.
+
+        El intervalo se adapta a la cola:
+        - Con una pasada llena que avanzó (hay backlog), sincroniza de nuevo sin esperar
+        - Una escritura nueva despierta al thread antes de tiempo
+        - Con la cola vacía no consulta DuckDB y duerme hasta la próxima escritura
+        - Sin avance (API caída, filas en backoff) la espera se duplica hasta AUTO_SYNC_MAX_INACTIVO
+        """
         def sync_loop():
+            espera = self.auto_sync_interval
             while not self._stop_sync:
-                time.sleep(self.auto_sync_interval)
-                if not self._stop_sync:
-                    self.sincronizar()
+                if self._hay_escrituras.wait(timeout=espera) and espera > 0:
+                    time.sleep(AUTO_SYNC_AGRUPAR_SEGUNDOS)  # Juntar las escrituras que siguen
+                self._hay_escrituras.clear()
+                if self._stop_sync:
+                    break
+
+                if self.estado_hidratacion == DEGRADADO and self.api_url and self.api_key:
+                    self.hydrate_from_sheets()
+
+                if self.get_estadisticas()[PENDIENTES] == 0:
+                    espera = AUTO_SYNC_MAX_INACTIVO
+                    continue
+
+                lote = self.lote_sync
+                inicio = time.perf_counter()
+                stats = self.sincronizar(batch_size=lote)
+                self._ajustar_lote_sync(lote, stats, time.perf_counter() - inicio)
+
+                if stats['sincronizados'] and stats['total_pendientes'] >= lote:
+                    espera = 0
+                elif stats['sincronizados']:
+                    espera = self.auto_sync_interval
+                else:
+                    espera = min(AUTO_SYNC_MAX_INACTIVO, max(espera, self.auto_sync_interval) * 2)
 
         self._sync_thread = threading.Thread(target=sync_loop, daemon=True)
         self._sync_thread.start()
 
-    def get_estadisticas(self):
+    def _ajustar_lote_sync(self, lote, stats, segundos):
         """
-        Obtiene estadísticas del buffer.
+        Ajusta las filas por pasada del auto-sync según la latencia observada
+        (AIMD: crece de a LOTE_SYNC_INCREMENTO, se reduce a la mitad si la
+        pasada fue lenta o hubo timeouts).
 
-        Returns:
-            dict: Estadísticas
+        Args:
+            lote: Filas pedidas en la pasada
+            stats: Resultado de sincronizar()
+            segundos: Duración de la pasada
+        """
+        timeouts = any(e.get('clase') == ERROR_TIMEOUT for e in stats['errores'])
+        if segundos > LOTE_SYNC_OBJETIVO_SEGUNDOS or timeouts:
+            self.lote_sync = max(LOTE_SYNC_MIN, lote // 2)
+        elif stats['total_pendientes'] >= lote and stats['sincronizados']:
+            self.lote_sync = min(LOTE_SYNC_MAX, lote + LOTE_SYNC_INCREMENTO)
+
+    def get_estadisticas(self):
         """
-        stats = {}
+        Obtiene estadísticas del buffer desde los contadores en memoria.
 
-        # Total de asistencias
-        result = self.conn.execute("""
-            SELECT COUNT(*) FROM asistencias_buffer
-        """).fetchone()
-        stats['total'] = result[0]
+        Los contadores se actualizan con cada escritura y se recuentan desde
+        DuckDB (una sola consulta GROUP BY) cada CONTADORES_RESYNC_SEGUNDOS.
 
-        # Pendientes de sincronizar
-        result = self.conn.execute("""
-            SELECT COUNT(*) FROM asistencias_buffer
-            WHERE sincronizado = false AND intentos_sync < 5
-        """).fetchone()
-        stats['pendientes'] = result[0]
+        Returns:
+            dict: total, pendientes, sincronizadas y fallidas, más el desglose
+                  por_curso {curso_id: {...}} y por_sesion {(curso_id, sesion): {...}}
+        """
+        if time.monotonic() - self._contadores_resync > CONTADORES_RESYNC_SEGUNDOS:
+            self._recontar()
+
+        vacio = {'total': 0, PENDIENTES: 0, SINCRONIZADAS: 0, FALLIDAS: 0}
+        stats = dict(vacio)
+        por_curso = {}
+        por_sesion = {}
+        with self._contadores_lock:
+            for (curso_id, sesion, categoria), n in self._contadores.items():
+                if n <= 0:
+                    continue
+                for grupo in (stats,
+                              por_curso.setdefault(curso_id, dict(vacio)),
+                              por_sesion.setdefault((curso_id, sesion), dict(vacio))):
+                    grupo[categoria] += n
+                    grupo['total'] += n
+
+        stats['por_curso'] = por_curso
+        stats['por_sesion'] = por_sesion
+        return stats
 
-        # Sincronizadas
-        result = self.conn.execute("""
-            SELECT COUNT(*) FROM asistencias_buffer
-            WHERE sincronizado = true
-        """).fetchone()
-        stats['sincronizadas'] = result[0]
+    def get_metricas(self):
+        """
+        Obtiene la telemetría de sincronización junto con el retraso de la cola.
 
-        # Fallidas (>5 intentos)
-        result = self.conn.execute("""
-            SELECT COUNT(*) FROM asistencias_buffer
-            WHERE sincronizado = false AND intentos_sync >= 5
-        """).fetchone()
-        stats['fallidas'] = result[0]
+        Returns:
+            dict: Métricas de MetricasSync.snapshot() más cola_pendientes,
+                  cola_fallidas, fila_pendiente_mas_antigua_segundos y
+                  consumo_api (llamadas y bytes por acción de todo el proceso)
+        """
+        metricas = self.metricas.snapshot()
+        metricas.update(self._gauges_cola())
+        metricas['lote_sync'] = self.lote_sync
+        metricas['consumo_api'] = self.api.get_estadisticas()
+        return metricas
+
+    def _gauges_cola(self):
+        """Medidas instantáneas de la cola de sincronización."""
+        stats = self.get_estadisticas()
+        mas_antigua = self._db().execute("""
+            SELECT MIN(created_at) FROM asistencias_buffer
+            WHERE sincronizado = false AND intentos_sync < ?
+        """, [MAX_INTENTOS_SYNC]).fetchone()[0]
+        edad = (datetime.now() - mas_antigua).total_seconds() if mas_antigua else 0
+        return {
+            'cola_pendientes': stats[PENDIENTES],
+            'cola_fallidas': stats[FALLIDAS],
+            'fila_pendiente_mas_antigua_segundos': round(max(0.0, edad), 1)
+        }
 
-        return stats
+    def _escribir_metricas(self):
+        """Escribe las métricas en metricas_path (los errores no afectan el sync)."""
+        try:
+            self.metricas.escribir(self.metricas_path, gauges=self._gauges_cola())
+        except Exception:
+            pass
 
     def get_asistencias_curso(self, curso_id, sesion=None):
         """
@@ -412,18 +1519,27 @@ class AsistenciaBuffer:
                 WHERE curso_id = ? AND sesion = ?
                 ORDER BY fecha_registro DESC
             """
-            return self.conn.execute(query, [curso_id, sesion]).df()
+            return self._db().execute(query, [curso_id, sesion]).df()
         else:
             query = """
                 SELECT * FROM asistencias_buffer
                 WHERE curso_id = ?
                 ORDER BY fecha_registro DESC
             """
-            return self.conn.execute(query, [curso_id]).df()
+            return self._db().execute(query, [curso_id]).df()
+
+    def get_todas_asistencias(self):
+        """
+        Obtiene todas las asistencias del buffer local.
+
+        Returns:
+            pd.DataFrame: DataFrame con asistencias
+        """
+        return self._db().execute("SELECT * FROM asistencias_buffer").df()
 
     def verificar_asistencia(self, curso_id, rut, sesion):
         """
-        Verifica si ya existe asistencia registrada.
+        Verifica si ya existe asistencia registrada (índice en memoria, sin SQL).
 
         Args:
             curso_id: ID del curso
@@ -433,16 +1549,163 @@ class AsistenciaBuffer:
         Returns:
             bool: True si ya existe
         """
-        result = self.conn.execute("""
-            SELECT COUNT(*) FROM asistencias_buffer
-            WHERE curso_id = ? AND rut = ? AND sesion = ?
-        """, [curso_id, rut, sesion]).fetchone()
+        return _clave_asistencia(curso_id, rut, sesion) in self._claves
+
+    def reanudar_fallidas(self, curso_id=None):
+        """
+        Vuelve a poner en cola los registros con intentos agotados.
+
+        Args:
+            curso_id: Reanudar solo las de este curso (opcional)
+
+        Returns:
+            int: Número de registros reanudados
+        """
+        filtro = "AND curso_id = ?" if curso_id else ""
+        params = [MAX_INTENTOS_SYNC] + ([curso_id] if curso_id else [])
+
+        with self._escritura:
+            reanudadas = self._db().execute(f"""
+                UPDATE asistencias_buffer
+                SET intentos_sync = 0,
+                    next_retry_at = ?
+                WHERE sincronizado = false AND intentos_sync >= ? {filtro}
+                RETURNING curso_id, sesion
+            """, [datetime.now()] + params).fetchall()
+            self._db().execute(f"DELETE FROM asistencias_fallidas WHERE true {filtro}",
+                               [curso_id] if curso_id else [])
+            self._contar(reanudadas, desde=FALLIDAS, hacia=PENDIENTES)
+        if reanudadas:
+            self._hay_escrituras.set()
+
+        return len(reanudadas)
+
+    def get_cambios_retenidos(self):
+        """
+        Lista los cambios de estado de filas ya en Sheets que no se enviaron
+        porque sync_updates está desactivado (secret SYNC_UPDATES).
+
+        Quedan marcados como sincronizados con version > version_sincronizada;
+        al reiniciar el buffer con sync_updates vuelven a la cola como
+        updateAsistencia.
+
+        Returns:
+            pd.DataFrame: Un registro por fila con el estado que falta enviar
+        """
+        return self._db().execute("""
+            SELECT id, curso_id, rut, sesion, estado, metodo, fecha_registro,
+                   version, version_sincronizada
+            FROM asistencias_buffer
+            WHERE sincronizado = true AND version > version_sincronizada
+            ORDER BY fecha_registro DESC
+        """).df()
+
+    @staticmethod
+    def _filtro_fallidas(curso_id=None, error_contiene=None, error_clase=None):
+        """
+        Arma el WHERE de las consultas sobre asistencias_fallidas.
+
+        Returns:
+            tuple: (sql, params)
+        """
+        condiciones, params = ["true"], []
+        if curso_id:
+            condiciones.append("curso_id = ?")
+            params.append(curso_id)
+        if error_contiene:
+            condiciones.append("contains(lower(ultimo_error), lower(?))")
+            params.append(error_contiene)
+        if error_clase:
+            condiciones.append("error_clase = ?")
+            params.append(error_clase)
+        return " AND ".join(condiciones), params
+
+    def get_fallidas(self, curso_id=None, error_contiene=None, error_clase=None):
+        """
+        Lista los registros de la tabla dead-letter.
 
-        return result[0] > 0
+        Args:
+            curso_id: Solo los de este curso (opcional)
+            error_contiene: Solo los cuyo último error contiene este texto (opcional)
+            error_clase: Solo los de esta clase de error (opcional)
+
+        Returns:
+            pd.DataFrame: Un registro por fila, con el payload JSON que falló
+        """
+        filtro, params = self._filtro_fallidas(curso_id, error_contiene, error_clase)
+        return self._db().execute(f"""
+            SELECT id, curso_id, rut, sesion, error_clase, ultimo_error,
+                   intentos, fallida_at, payload
+            FROM asistencias_fallidas
+            WHERE {filtro}
+            ORDER BY fallida_at DESC
+        """, params).df()
+
+    def agrupar_fallidas(self, por='curso_id'):
+        """
+        Agrupa la tabla dead-letter para decidir qué reenviar.
+
+        Args:
+            por: Columna de agrupación: 'curso_id', 'error_clase' o 'ultimo_error'
+
+        Returns:
+            pd.DataFrame: [por, cantidad, primera, ultima], de mayor a menor cantidad
+        """
+        if por not in ('curso_id', 'error_clase', 'ultimo_error'):
+            raise ValueError(f"No se puede agrupar fallidas por '{por}'")
+        return self._db().execute(f"""
+            SELECT {por}, COUNT(*) AS cantidad,
+                   MIN(fallida_at) AS primera, MAX(fallida_at) AS ultima
+            FROM asistencias_fallidas
+            GROUP BY {por}
+            ORDER BY cantidad DESC, {por}
+        """).df()
+
+    def reenviar_fallidas(self, curso_id=None, error_contiene=None, error_clase=None):
+        """
+        Devuelve a la cola los registros de la tabla dead-letter que cumplen
+        los filtros (sin filtros, todos).
+
+        Los registros vuelven con sus intentos en cero y los envía el
+        auto-sync por el camino normal (por lotes si está activo).
+
+        Args:
+            curso_id: Solo los de este curso (opcional)
+            error_contiene: Solo los cuyo último error contiene este texto (opcional)
+            error_clase: Solo los de esta clase de error (opcional)
+
+        Returns:
+            int: Número de registros reencolados
+        """
+        filtro, params = self._filtro_fallidas(curso_id, error_contiene, error_clase)
+        with self._escritura:
+            db = self._db()
+            ids = [fila[0] for fila in db.execute(
+                f"DELETE FROM asistencias_fallidas WHERE {filtro} RETURNING id", params
+            ).fetchall()]
+            if not ids:
+                return 0
+            reencoladas = db.execute("""
+                UPDATE asistencias_buffer
+                SET intentos_sync = 0,
+                    next_retry_at = ?
+                WHERE list_contains(?, id) AND sincronizado = false AND intentos_sync >= ?
+                RETURNING curso_id, sesion
+            """, [datetime.now(), ids, MAX_INTENTOS_SYNC]).fetchall()
+            self._contar(reencoladas, desde=FALLIDAS, hacia=PENDIENTES)
+        if reencoladas:
+            self._hay_escrituras.set()
+
+        return len(reencoladas)
 
     def limpiar_sincronizados(self, dias=7):
         """
-        Limpia registros sincronizados antiguos para liberar espacio.
+        Limpia registros sincronizados antiguos para liberar espacio. Los
+        cambios retenidos (ver get_cambios_retenidos) no se borran.
+
+        Si se borra alguna fila también se borra la marca de agua de la
+        hidratación, para que la próxima hidratación relea la hoja completa y
+        recupere esas claves en el índice de duplicados.
 
         Args:
             dias: Mantener últimos N días (default: 7)
@@ -450,35 +1713,128 @@ class AsistenciaBuffer:
         Returns:
             int: Número de registros eliminados
         """
-        if dias <= 0:
-            count = self.conn.execute("SELECT COUNT(*) FROM asistencias_buffer WHERE sincronizado = true").fetchone()[0]
-            self.conn.execute("DELETE FROM asistencias_buffer WHERE sincronizado = true")
-        else:
-            count = self.conn.execute("""
-                SELECT COUNT(*) FROM asistencias_buffer
-                WHERE sincronizado = true
-                  AND created_at < CAST(CURRENT_TIMESTAMP AS TIMESTAMP) - (? * INTERVAL '1 day')
-            """, [dias]).fetchone()[0]
-            self.conn.execute("""
-                DELETE FROM asistencias_buffer
-                WHERE sincronizado = true
-                  AND created_at < CAST(CURRENT_TIMESTAMP AS TIMESTAMP) - (? * INTERVAL '1 day')
-            """, [dias])
+        with self._escritura:
+            if dias <= 0:
+                borradas = self._db().execute("""
+                    DELETE FROM asistencias_buffer
+                    WHERE sincronizado = true AND version <= version_sincronizada
+                    RETURNING curso_id, sesion
+                """).fetchall()
+            else:
+                borradas = self._db().execute("""
+                    DELETE FROM asistencias_buffer
+                    WHERE sincronizado = true AND version <= version_sincronizada
+                      AND created_at < CAST(CURRENT_TIMESTAMP AS TIMESTAMP) - (? * INTERVAL '1 day')
+                    RETURNING curso_id, sesion
+                """, [dias]).fetchall()
+
+            if borradas:
+                self._db().execute("DELETE FROM buffer_meta WHERE clave = 'hidratacion_filas'")
+                self._reconstruir_indice()
+                self._contar(borradas, desde=SINCRONIZADAS)
 
-        return count
+        return len(borradas)
 
-    def close(self):
-        """Cierra conexión y detiene sincronización automática."""
+    def vaciar_buffer(self):
+        """
+        Elimina TODOS los registros del buffer (incluye pendientes) y recarga
+        lo que ya está en Google Sheets.
+
+        Returns:
+            int: Número de registros cargados desde Sheets
+        """
+        with self._hidratacion_lock:
+            with self._escritura:
+                self._db().execute("DELETE FROM asistencias_buffer")
+                self._db().execute("DELETE FROM asistencias_fallidas")
+                self._db().execute("DELETE FROM buffer_meta WHERE clave = 'hidratacion_filas'")
+                self._claves = set()
+                with self._contadores_lock:
+                    self._contadores = Counter()
+            return self.hydrate_from_sheets()
+
+    def drenar(self, presupuesto_s=DRENAJE_PRESUPUESTO_SEGUNDOS):
+        """
+        Sincroniza pasada tras pasada hasta vaciar la cola, agotar el
+        presupuesto de tiempo o dejar de avanzar (API caída).
+
+        El presupuesto se revisa entre pasadas, así que una pasada en curso
+        puede excederlo por la duración de un request.
+
+        Args:
+            presupuesto_s: Segundos máximos de sincronización
+
+        Returns:
+            dict: sincronizados, pendientes (las que quedan), segundos y
+                  presupuesto_agotado
+        """
+        inicio = time.monotonic()
+        sincronizados = 0
+        agotado = False
+        while self.get_estadisticas()[PENDIENTES] > 0:
+            if time.monotonic() - inicio >= presupuesto_s:
+                agotado = True
+                break
+            stats = self.sincronizar(batch_size=self.lote_sync)
+            sincronizados += stats['sincronizados']
+            if not stats['sincronizados']:
+                break
+
+        return {
+            'sincronizados': sincronizados,
+            'pendientes': self.get_estadisticas()[PENDIENTES],
+            'segundos': round(time.monotonic() - inicio, 2),
+            'presupuesto_agotado': agotado
+        }
+
+    def close(self, presupuesto_s=DRENAJE_PRESUPUESTO_SEGUNDOS):
+        """
+        Cierra conexión y detiene sincronización automática.
+
+        Antes de cerrar drena la cola con drenar(presupuesto_s) y hace un
+        CHECKPOINT para que el archivo DuckDB quede completo sin depender del WAL.
+
+        Args:
+            presupuesto_s: Segundos máximos sincronizando pendientes (0 = no sincronizar)
+
+        Returns:
+            dict: Resultado de drenar() (None si el buffer ya estaba cerrado)
+        """
         self._stop_sync = True
+        self._hay_escrituras.set()
+        if self._escritor_agrupado:
+            self._escritor_agrupado.detener()
+            self._escritor_agrupado = None
         if self._sync_thread:
             self._sync_thread.join(timeout=5)
+        if self._hydrate_thread:
+            self._hydrate_thread.join(timeout=5)
+        drenaje = None
         if self.conn:
             # Intentar sincronizar antes de cerrar
             try:
-                self.sincronizar()
-            except:
+                drenaje = self.drenar(presupuesto_s)
+                if drenaje['pendientes']:
+                    print(f"⚠️ Buffer cerrado con {drenaje['pendientes']} asistencias pendientes "
+                          f"({drenaje['sincronizados']} sincronizadas en {drenaje['segundos']}s); "
+                          f"se enviarán al reiniciar")
+            except Exception:
                 pass
+            self.ultimo_drenaje = drenaje
+            try:
+                with self._escritura:
+                    self.conn.execute("CHECKPOINT")
+            except Exception:
+                pass
+            with self._cursores_lock:
+                for cursor in list(self._cursores):
+                    cursor.close()
             self.conn.close()
+            self.conn = None
+        if self._sync_executor:
+            self._sync_executor.shutdown(wait=False)
+            self._sync_executor = None
+        return drenaje
 
 
 # ==================== INTEGRACIÓN CON STREAMLIT ====================
@@ -488,12 +1844,29 @@ def get_buffer():
     """
     Obtiene instancia singleton del buffer para usar en Streamlit.
 
+    Si está configurado el secret BUFFER_SERVER_URL, retorna un cliente del
+    servidor compartido (buffer_server.py) en vez de abrir el archivo DuckDB
+    en este proceso; así varias réplicas de la app comparten un buffer.
+
     Returns:
-        AsistenciaBuffer: Instancia del buffer
+        AsistenciaBuffer | BufferClient: Instancia del buffer
     """
+    servidor = st.secrets.get("BUFFER_SERVER_URL")
+    if servidor:
+        from buffer_server import BufferClient
+        return BufferClient(servidor, token=st.secrets.get("BUFFER_SERVER_TOKEN"))
+
     return AsistenciaBuffer(
         db_path="asistencias_buffer.duckdb",
-        auto_sync_interval=15  # Sincronizar cada 15 segundos
+        auto_sync_interval=int(st.secrets.get("AUTO_SYNC_INTERVAL", 15)),  # Base; se adapta a la cola
+        sync_por_lotes=bool(st.secrets.get("SYNC_POR_LOTES", False)),
+        sync_updates=bool(st.secrets.get("SYNC_UPDATES", False)),
+        sync_workers=int(st.secrets.get("SYNC_WORKERS", 4)),
+        group_commit=bool(st.secrets.get("GROUP_COMMIT", False)),
+        # Junto a los snapshots de las apps (directorio ignorado por git)
+        metricas_path=st.secrets.get(
+            "METRICAS_PATH", str(Path(st.secrets.get("SNAPSHOT_DIR", "snapshots")) / "metricas_sync.prom")
+        )
     )
 
 
@@ -0,0 +1,388 @@
+"""
+Espejo Local de Registros de Inscripción
+========================================
+
+getRegistros devuelve la hoja completa de inscripciones: todos los cursos,
+incluidos los ya terminados. Crece con la historia y se descargaba entera en
+cada renovación, solo para filtrar un curso en pandas (cupos, validar inscrito,
+reportes).
+
+EspejoRegistros mantiene una copia en un archivo DuckDB propio de cada app:
+
+- Actualización incremental: la marca de agua es el número de filas ya
+  leídas, y solo se piden las siguientes (parámetro desde de getRegistros,
+  igual que la hidratación del buffer con getAsistencias). Si la hoja tiene
+  menos filas que la marca (se borraron filas) o el Apps Script no soporta
+  desde (responde sin total), se reemplaza la copia completa.
+- Consultas por curso en DuckDB: contar inscritos, buscar un RUT y obtener
+  los registros de un curso no cargan la hoja en memoria.
+
+Cada fila se guarda con su JSON original, así los DataFrames que se obtienen
+conservan los tipos que entrega el API. curso_id y el RUT normalizado van en
+columnas propias, con un índice para las búsquedas.
+
+Las filas editadas en la hoja después de leídas (ej: un RUT corregido) no
+llegan con los deltas. Por eso, cada recarga_completa segundos (default
+RECARGA_COMPLETA_SEGUNDOS), sincronizar() relee la hoja completa. recargar()
+lo hace de inmediato.
+
+Uso:
+    from espejo_registros import get_espejo_registros
+
+    espejo = get_espejo_registros("snapshots/registros.duckdb", api)
+    espejo.sincronizar()                      # Solo las filas nuevas
+    espejo.contar_inscritos("may27-RM")
+    espejo.buscar_inscrito("may27-RM", "12345678-9")
+    espejo.get_registros_curso("may27-RM")    # DataFrame del curso
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+import duckdb
+import pandas as pd
+
+RECARGA_COMPLETA_SEGUNDOS = 1800  # Cada cuánto sincronizar() relee la hoja completa
+
+
+def normalizar_rut(rut):
+    """
+    Normaliza un RUT para compararlo: sin puntos ni espacios, con guión y en
+    mayúsculas (12.345.678-k y 12345678k → 12345678-K).
+
+    Args:
+        rut: RUT en cualquier formato (None = '')
+
+    Returns:
+        str: RUT normalizado
+    """
+    if rut is None:
+        return ''
+    rut = str(rut).replace('.', '').replace(' ', '').strip().upper()
+    if rut and '-' not in rut and len(rut) > 1:
+        rut = f"{rut[:-1]}-{rut[-1]}"
+    return rut
+
+
+class EspejoRegistros:
+    """
+    Copia local de getRegistros en DuckDB, actualizada por deltas.
+    """
+
+    def __init__(self, db_path, api, columnas=None, recarga_completa=RECARGA_COMPLETA_SEGUNDOS):
+        """
+        Args:
+            db_path: Archivo DuckDB del espejo (None = solo en memoria)
+            api: ApiClient del Apps Script (ver api_client.py)
+            columnas: Campos de cada registro a guardar (default: todos)
+            recarga_completa: Segundos tras los cuales sincronizar() relee la
+                              hoja completa para tomar filas editadas (None = nunca)
+        """
+        self.db_path = str(db_path) if db_path else None
+        self.api = api
+        self.columnas = columnas
+        self.recarga_completa = recarga_completa
+        self.error_archivo = None
+        self.ultima_sincronizacion = None
+        self.ultima_recarga = None           # Última lectura de la hoja completa
+        self._lock = threading.Lock()        # Protege la conexión
+        self._sync_lock = threading.Lock()   # Una sola actualización a la vez
+        self.conn = self._conectar()
+        self._init_database()
+        with self._lock:
+            meta = dict(self.conn.execute(
+                "SELECT clave, valor FROM espejo_meta WHERE clave IN ('sincronizado_en', 'recargado_en')"
+            ).fetchall())
+        if 'sincronizado_en' in meta:
+            self.ultima_sincronizacion = datetime.fromisoformat(meta['sincronizado_en'])
+        if 'recargado_en' in meta:
+            self.ultima_recarga = datetime.fromisoformat(meta['recargado_en'])
+
+    def _conectar(self):
+        """
+        Abre el archivo del espejo. Si no se puede (ej: otro proceso lo tiene
+        tomado), el espejo funciona en memoria y se llena desde cero.
+        """
+        if self.db_path:
+            try:
+                directorio = os.path.dirname(self.db_path)
+                if directorio:
+                    os.makedirs(directorio, exist_ok=True)
+                return duckdb.connect(self.db_path)
+            except (duckdb.Error, OSError) as e:
+                self.error_archivo = str(e)
+        return duckdb.connect(":memory:")
+
+    def _init_database(self):
+        """Crea las tablas del espejo."""
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS registros (
+                    fila BIGINT PRIMARY KEY,
+                    curso_id VARCHAR,
+                    rut_norm VARCHAR,
+                    datos JSON
+                )
+            """)
+            self.conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_registros_curso_rut
+                ON registros(curso_id, rut_norm)
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS espejo_meta (
+                    clave VARCHAR PRIMARY KEY,
+                    valor VARCHAR
+                )
+            """)
+
+            # Si cambiaron las columnas guardadas, las filas ya leídas no tienen
+            # las nuevas: se descarta la copia y la próxima actualización es completa
+            columnas = json.dumps(sorted(self.columnas) if self.columnas else None)
+            fila = self.conn.execute(
+                "SELECT valor FROM espejo_meta WHERE clave = 'columnas'"
+            ).fetchone()
+            if fila is None or fila[0] != columnas:
+                self.conn.execute("DELETE FROM registros")
+                self.conn.execute("DELETE FROM espejo_meta")
+                self.conn.execute(
+                    "INSERT INTO espejo_meta (clave, valor) VALUES ('columnas', ?)", [columnas]
+                )
+
+    @property
+    def filas(self):
+        """Filas de la hoja ya leídas (marca de agua)."""
+        with self._lock:
+            fila = self.conn.execute(
+                "SELECT valor FROM espejo_meta WHERE clave = 'filas'"
+            ).fetchone()
+        return int(fila[0]) if fila else 0
+
+    # ==================== ACTUALIZACIÓN ====================
+
+    def sincronizar(self):
+        """
+        Trae las filas agregadas a la hoja desde la última actualización, o
+        la hoja completa si la última lectura completa tiene más de
+        recarga_completa segundos.
+
+        Returns:
+            int: Filas de la hoja ya leídas después de actualizar
+
+        Raises:
+            RuntimeError: Si getRegistros no responde success
+            requests.exceptions.RequestException: Errores de red
+        """
+        with self._sync_lock:
+            desde = self.filas
+            if self.recarga_completa is not None and (
+                    self.ultima_recarga is None
+                    or (datetime.now() - self.ultima_recarga).total_seconds() > self.recarga_completa):
+                desde = 0  # Toma también las filas editadas en la hoja
+            data = self._get_registros(desde)
+            if data.get('success') and data.get('total', desde) < desde:
+                desde = 0  # Se borraron filas: releer la hoja completa
+                data = self._get_registros(desde)
+            return self._aplicar(data, desde)
+
+    def recargar(self):
+        """
+        Reemplaza el espejo con la hoja completa (toma también las filas
+        editadas en la hoja).
+
+        Returns:
+            int: Filas de la hoja leídas
+        """
+        with self._sync_lock:
+            return self._aplicar(self._get_registros(0), 0)
+
+    def _get_registros(self, desde):
+        """Descarga las filas de la hoja a partir de la fila desde."""
+        return self.api.get('getRegistros', {"desde": desde} if desde else None)
+
+    def _aplicar(self, data, desde):
+        """
+        Agrega al espejo las filas de una respuesta de getRegistros.
+
+        Args:
+            data: Respuesta (success, registros y, si soporta desde, total)
+            desde: Fila desde la que se pidió
+
+        Returns:
+            int: Nueva marca de agua
+        """
+        if not data.get('success'):
+            raise RuntimeError(data.get('error') or 'getRegistros no respondió success')
+
+        registros = data.get('registros') or []
+        # Un Apps Script sin soporte de desde responde la hoja completa sin total
+        completa = desde == 0 or 'total' not in data
+        base = 0 if completa else desde
+        total = data.get('total', base + len(registros))
+
+        filas = []
+        for i, registro in enumerate(registros):
+            if self.columnas:
+                registro = {c: registro[c] for c in self.columnas if c in registro}
+            filas.append((base + i, _texto(registro.get('curso_id')),
+                          normalizar_rut(registro.get('rut')),
+                          json.dumps(registro, default=str, ensure_ascii=False)))
+
+        with self._lock:
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                if completa:
+                    self.conn.execute("DELETE FROM registros")
+                else:
+                    self.conn.execute("DELETE FROM registros WHERE fila >= ?", [base])
+                if filas:
+                    # Un solo INSERT desde el DataFrame (la carga completa puede ser grande)
+                    nuevas = pd.DataFrame(filas, columns=['fila', 'curso_id', 'rut_norm', 'datos'])
+                    self.conn.register('nuevas', nuevas)
+                    self.conn.execute("""
+                        INSERT INTO registros (fila, curso_id, rut_norm, datos)
+                        SELECT fila, curso_id, rut_norm, datos FROM nuevas
+                    """)
+                    self.conn.unregister('nuevas')
+                ahora = datetime.now()
+                meta = [['filas', str(total)], ['sincronizado_en', ahora.isoformat()]]
+                if completa:
+                    meta.append(['recargado_en', ahora.isoformat()])
+                self.conn.executemany("""
+                    INSERT INTO espejo_meta (clave, valor) VALUES (?, ?)
+                    ON CONFLICT (clave) DO UPDATE SET valor = EXCLUDED.valor
+                """, meta)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        self.ultima_sincronizacion = ahora
+        if completa:
+            self.ultima_recarga = ahora
+        return total
+
+    # ==================== CONSULTAS ====================
+
+    def contar_inscritos(self, curso_id):
+        """
+        Cuenta los inscritos de un curso.
+
+        Args:
+            curso_id: ID del curso
+
+        Returns:
+            int: Número de registros del curso
+        """
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM registros WHERE curso_id = ?", [_texto(curso_id)]
+            ).fetchone()[0]
+
+    def contar_por_curso(self):
+        """
+        Cuenta los inscritos de todos los cursos en una consulta.
+
+        Returns:
+            dict: curso_id → número de registros
+        """
+        with self._lock:
+            return dict(self.conn.execute(
+                "SELECT curso_id, COUNT(*) FROM registros GROUP BY curso_id"
+            ).fetchall())
+
+    def buscar_inscrito(self, curso_id, rut):
+        """
+        Busca la inscripción de un RUT en un curso (sin distinguir puntos ni
+        mayúsculas: 12.345.678-k == 12345678-K).
+
+        Args:
+            curso_id: ID del curso
+            rut: RUT del participante
+
+        Returns:
+            dict: Registro del participante, o None si no está inscrito
+        """
+        with self._lock:
+            fila = self.conn.execute("""
+                SELECT datos FROM registros
+                WHERE curso_id = ? AND rut_norm = ?
+                ORDER BY fila LIMIT 1
+            """, [_texto(curso_id), normalizar_rut(rut)]).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def get_registros_curso(self, curso_id, ruts=None):
+        """
+        Obtiene los registros de un curso, en el orden de la hoja.
+
+        Args:
+            curso_id: ID del curso
+            ruts: Solo estos RUTs (opcional, se normalizan)
+
+        Returns:
+            DataFrame: Registros del curso (vacío si no hay)
+        """
+        sql = "SELECT datos FROM registros WHERE curso_id = ?"
+        params = [_texto(curso_id)]
+        if ruts is not None:
+            sql += " AND list_contains(?, rut_norm)"
+            params.append(sorted({normalizar_rut(r) for r in ruts}))
+        with self._lock:
+            filas = self.conn.execute(sql + " ORDER BY fila", params).fetchall()
+        return pd.DataFrame([json.loads(datos) for (datos,) in filas])
+
+    def get_estado(self):
+        """
+        Obtiene el estado del espejo para monitoreo.
+
+        Returns:
+            dict: filas (marca de agua), registros guardados, cursos, última
+                  sincronización, última recarga completa y error al abrir
+                  el archivo
+        """
+        with self._lock:
+            registros, cursos = self.conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT curso_id) FROM registros"
+            ).fetchone()
+        return {
+            'filas': self.filas,
+            'registros': registros,
+            'cursos': cursos,
+            'ultima_sincronizacion': self.ultima_sincronizacion,
+            'ultima_recarga': self.ultima_recarga,
+            'error_archivo': self.error_archivo
+        }
+
+    def close(self):
+        """Cierra la conexión DuckDB."""
+        with self._lock:
+            self.conn.close()
+
+
+def _texto(valor):
+    """curso_id como texto (en la hoja puede venir como número)."""
+    return None if valor is None else str(valor)
+
+
+_espejos = {}
+_espejos_lock = threading.Lock()
+
+
+def get_espejo_registros(db_path, api, columnas=None):
+    """
+    Obtiene el espejo compartido del proceso para un archivo (lo crea la
+    primera vez). Los argumentos después de db_path solo se usan al crearlo.
+
+    Args:
+        db_path: Archivo DuckDB del espejo
+        api: ApiClient del Apps Script
+        columnas: Campos de cada registro a guardar (default: todos)
+
+    Returns:
+        EspejoRegistros: Instancia única por archivo
+    """
+    with _espejos_lock:
+        clave = str(db_path)
+        if clave not in _espejos:
+            _espejos[clave] = EspejoRegistros(db_path, api, columnas=columnas)
+        return _espejos[clave]
@@ -0,0 +1,240 @@
+"""
+Telemetría de Sincronización del Buffer
+=======================================
+
+Registra cómo va la sincronización del buffer con Google Sheets:
+latencia de cada llamada al Apps Script (histograma por acción), filas
+por segundo de cada pasada de sincronizar(), errores por clase y el
+retraso de la cola (filas pendientes y antigüedad de la más vieja).
+
+Las métricas se pueden leer como dict (pestaña Mantenimiento) o escribir
+en formato de texto Prometheus a un archivo local, para que un scraper
+(node_exporter textfile collector, Grafana Agent, etc.) las recoja.
+
+Uso:
+    from metricas_sync import MetricasSync
+
+    metricas = MetricasSync()
+    metricas.observar_llamada('addAsistencia', 0.42)
+    metricas.registrar_error('timeout')
+    metricas.escribir('metricas_sync.prom', gauges={'cola_pendientes': 12})
+"""
+
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+
+import requests
+
+# Límites superiores (segundos) de los buckets de latencia
+BUCKETS_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Clases de error de sincronización
+ERROR_TIMEOUT = 'timeout'
+ERROR_CONEXION = 'conexion'
+ERROR_RESPUESTA = 'respuesta_invalida'
+ERROR_API = 'api'
+ERROR_OTRO = 'otro'
+
+
+def clasificar_excepcion(error):
+    """
+    Clasifica una excepción de un request al Apps Script.
+
+    Args:
+        error: Excepción capturada
+
+    Returns:
+        str: timeout, conexion, respuesta_invalida u otro
+    """
+    if isinstance(error, requests.exceptions.Timeout):
+        return ERROR_TIMEOUT
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return ERROR_CONEXION
+    if isinstance(error, ValueError):  # JSON inválido (incluye requests JSONDecodeError)
+        return ERROR_RESPUESTA
+    return ERROR_OTRO
+
+
+class Histograma:
+    """
+    Histograma acumulado de buckets fijos (mismo modelo que Prometheus).
+    """
+
+    def __init__(self, limites=BUCKETS_LATENCIA):
+        self.limites = tuple(limites)
+        self.buckets = [0] * (len(self.limites) + 1)  # Último: +Inf
+        self.conteo = 0
+        self.suma = 0.0
+
+    def observar(self, valor):
+        """Agrega una observación."""
+        i = 0
+        while i < len(self.limites) and valor > self.limites[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.conteo += 1
+        self.suma += valor
+
+    def percentil(self, p):
+        """
+        Estima un percentil como el límite superior del bucket que lo contiene.
+
+        Args:
+            p: Percentil (0-100)
+
+        Returns:
+            float: Segundos (inf si cae sobre el último límite), None sin datos
+        """
+        if not self.conteo:
+            return None
+        objetivo = self.conteo * p / 100
+        acumulado = 0
+        for limite, n in zip(self.limites + (float('inf'),), self.buckets):
+            acumulado += n
+            if acumulado >= objetivo:
+                return limite
+        return float('inf')
+
+
+class MetricasSync:
+    """
+    Métricas de sincronización thread-safe de un buffer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencias = {}          # acción → Histograma
+        self._errores = Counter()     # clase → cantidad
+        self._filas_sincronizadas = 0
+        self._pasadas = 0
+        self._ultima_pasada = None
+
+    def observar_llamada(self, accion, segundos):
+        """
+        Registra la latencia de una llamada al Apps Script.
+
+        Args:
+            accion: Acción del API (addAsistencia, addAsistenciasBatch, ...)
+            segundos: Duración del request
+        """
+        with self._lock:
+            if accion not in self._latencias:
+                self._latencias[accion] = Histograma()
+            self._latencias[accion].observar(segundos)
+
+    def registrar_error(self, clase, cantidad=1):
+        """
+        Cuenta filas que fallaron al sincronizar, por clase de error.
+
+        Args:
+            clase: timeout, conexion, respuesta_invalida, api, circuito_abierto, ...
+            cantidad: Filas afectadas
+        """
+        with self._lock:
+            self._errores[clase] += cantidad
+
+    def registrar_pasada(self, segundos, sincronizados, fallidos):
+        """
+        Registra una pasada de sincronizar() que tenía filas pendientes.
+
+        Args:
+            segundos: Duración de la pasada
+            sincronizados: Filas confirmadas por el API
+            fallidos: Filas que fallaron
+        """
+        with self._lock:
+            self._pasadas += 1
+            self._filas_sincronizadas += sincronizados
+            self._ultima_pasada = {
+                'fecha': datetime.now(),
+                'segundos': round(segundos, 3),
+                'sincronizados': sincronizados,
+                'fallidos': fallidos,
+                'filas_por_segundo': round(sincronizados / segundos, 1) if segundos > 0 else 0.0
+            }
+
+    def snapshot(self):
+        """
+        Obtiene una copia de las métricas acumuladas.
+
+        Returns:
+            dict: latencias por acción (conteo, promedio, p50, p95, p99),
+                  errores por clase, filas sincronizadas y última pasada
+        """
+        with self._lock:
+            latencias = {
+                accion: {
+                    'conteo': h.conteo,
+                    'promedio': round(h.suma / h.conteo, 3) if h.conteo else None,
+                    'p50': h.percentil(50),
+                    'p95': h.percentil(95),
+                    'p99': h.percentil(99)
+                }
+                for accion, h in self._latencias.items()
+            }
+            return {
+                'latencias': latencias,
+                'errores': dict(self._errores),
+                'filas_sincronizadas': self._filas_sincronizadas,
+                'pasadas': self._pasadas,
+                'ultima_pasada': dict(self._ultima_pasada) if self._ultima_pasada else None
+            }
+
+    def exportar_prometheus(self, gauges=None):
+        """
+        Genera las métricas en formato de texto de Prometheus.
+
+        Args:
+            gauges: Dict nombre → valor con medidas instantáneas del buffer
+                    (se exportan como buffer_<nombre>)
+
+        Returns:
+            str: Texto listo para un textfile collector
+        """
+        lineas = []
+        with self._lock:
+            lineas.append("# HELP buffer_sync_latencia_segundos Latencia de llamadas al Apps Script")
+            lineas.append("# TYPE buffer_sync_latencia_segundos histogram")
+            for accion, h in sorted(self._latencias.items()):
+                acumulado = 0
+                for limite, n in zip(h.limites + ('+Inf',), h.buckets):
+                    acumulado += n
+                    lineas.append(f'buffer_sync_latencia_segundos_bucket{{accion="{accion}",le="{limite}"}} {acumulado}')
+                lineas.append(f'buffer_sync_latencia_segundos_sum{{accion="{accion}"}} {h.suma:.6f}')
+                lineas.append(f'buffer_sync_latencia_segundos_count{{accion="{accion}"}} {h.conteo}')
+
+            lineas.append("# HELP buffer_sync_errores_total Filas con error de sincronización por clase")
+            lineas.append("# TYPE buffer_sync_errores_total counter")
+            for clase, n in sorted(self._errores.items()):
+                lineas.append(f'buffer_sync_errores_total{{clase="{clase}"}} {n}')
+
+            lineas.append("# TYPE buffer_sync_filas_total counter")
+            lineas.append(f"buffer_sync_filas_total {self._filas_sincronizadas}")
+            lineas.append("# TYPE buffer_sync_filas_por_segundo gauge")
+            fps = self._ultima_pasada['filas_por_segundo'] if self._ultima_pasada else 0
+            lineas.append(f"buffer_sync_filas_por_segundo {fps}")
+
+        for nombre, valor in sorted((gauges or {}).items()):
+            lineas.append(f"# TYPE buffer_{nombre} gauge")
+            lineas.append(f"buffer_{nombre} {valor}")
+
+        return "\n".join(lineas) + "\n"
+
+    def escribir(self, ruta, gauges=None):
+        """
+        Escribe las métricas en un archivo de forma atómica (el scraper nunca
+        lee un archivo a medio escribir).
+
+        Args:
+            ruta: Ruta del archivo .prom
+            gauges: Medidas instantáneas del buffer (ver exportar_prometheus)
+        """
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(self.exportar_prometheus(gauges))
+        os.replace(temporal, ruta)
@@ -0,0 +1,136 @@
+"""
+Registros de Inscripción Compartidos por las Apps
+=================================================
+
+Espejo DuckDB de la hoja de inscripciones (ver espejo_registros.py) y el
+snapshot que lo pone al día en segundo plano (ver snapshot_cache.py), armados
+igual en AsistenciaCurso e InscripcionCSV (antes cada app tenía su copia).
+
+Cada app pasa solo su archivo DuckDB y, si poda columnas, cuáles guarda. Al
+arrancar, un espejo con filas en disco se entrega como snapshot sin esperar
+al API.
+
+Uso:
+    from registros_cursos import get_registros_cursos
+
+    registros = get_registros_cursos(SNAPSHOT_DIR / "asistencia_registros.duckdb", api)
+    espejo = registros.get_espejo()             # Consultas por curso
+    st.sidebar.caption(registros.describir_edades(CONFIG))
+"""
+
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import streamlit as st
+
+from espejo_registros import get_espejo_registros
+from snapshot_cache import get_snapshot_cache, formatear_edad
+
+TTL_REGISTROS = 60  # Segundos tras los cuales se piden las filas nuevas de la hoja
+
+
+class RegistrosCursos:
+    """
+    Espejo de registros de una app y el snapshot que lo renueva.
+    """
+
+    def __init__(self, db_path, api, columnas=None, ttl=TTL_REGISTROS):
+        """
+        Args:
+            db_path: Archivo DuckDB del espejo (uno por app)
+            api: ApiClient del Apps Script
+            columnas: Campos de cada registro a guardar (default: todos)
+            ttl: Segundos entre descargas de filas nuevas
+        """
+        self.espejo = get_espejo_registros(db_path, api, columnas=columnas)
+        # El valor del snapshot es la marca de agua del espejo (filas leídas)
+        self.snapshot = get_snapshot_cache(Path(db_path).stem, self.espejo.sincronizar, ttl=ttl)
+        if self.snapshot.version == 0 and self.espejo.filas:
+            # El espejo en disco ya es un snapshot: se entrega sin esperar al API
+            self.snapshot.sembrar(self.espejo.filas, self.espejo.ultima_sincronizacion)
+
+    def get_espejo(self):
+        """
+        Obtiene el espejo para consultas por curso; si venció, trae las filas
+        nuevas en segundo plano. Si no hay ninguna fila y la descarga falló,
+        muestra el error en la app.
+
+        Returns:
+            EspejoRegistros: Espejo de la app (puede estar vacío)
+        """
+        try:
+            self.snapshot.get()
+        except Exception as e:
+            if not self.espejo.filas:
+                st.error(f"Error al obtener registros: {str(e)}")
+        return self.espejo
+
+    def recargar(self):
+        """
+        Relee la hoja completa (toma también las filas editadas) y renueva el
+        snapshot, aunque la relectura falle (así el error queda en ultimo_error).
+
+        Raises:
+            Exception: Si la relectura completa falló
+        """
+        try:
+            self.espejo.recargar()
+        finally:
+            self.snapshot.refrescar()
+
+    def invalidar(self):
+        """Fuerza la descarga de filas nuevas en el próximo get_espejo (ej: tras inscribir)."""
+        self.snapshot.invalidar()
+
+    @property
+    def ultimo_error(self):
+        """Error de la última descarga fallida (None si la última funcionó)."""
+        return self.snapshot.ultimo_error
+
+    @property
+    def edad_recarga(self):
+        """Segundos desde la última lectura completa de la hoja (None = nunca)."""
+        if self.espejo.ultima_recarga is None:
+            return None
+        return (datetime.now() - self.espejo.ultima_recarga).total_seconds()
+
+    def describir_edades(self, config):
+        """
+        Texto con la antigüedad de los datos de cursos e inscritos. Los deltas
+        solo traen inscritos nuevos; las filas corregidas en la hoja llegan con
+        la última lectura completa.
+
+        Args:
+            config: SnapshotCache de la configuración de cursos
+
+        Returns:
+            str: Línea para el caption del sidebar
+        """
+        return (f"📅 Cursos de hace {formatear_edad(config.edad)} · "
+                f"inscritos nuevos de hace {formatear_edad(self.snapshot.edad)} · "
+                f"correcciones de hace {formatear_edad(self.edad_recarga)}")
+
+
+_registros = {}
+_registros_lock = threading.Lock()
+
+
+def get_registros_cursos(db_path, api, columnas=None):
+    """
+    Obtiene los registros compartidos del proceso para un archivo (los crea
+    la primera vez). Los argumentos después de db_path solo se usan al crearlos.
+
+    Args:
+        db_path: Archivo DuckDB del espejo
+        api: ApiClient del Apps Script
+        columnas: Campos de cada registro a guardar (default: todos)
+
+    Returns:
+        RegistrosCursos: Instancia única por archivo
+    """
+    with _registros_lock:
+        clave = str(db_path)
+        if clave not in _registros:
+            _registros[clave] = RegistrosCursos(db_path, api, columnas=columnas)
+        return _registros[clave]
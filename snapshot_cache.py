@@ -0,0 +1,364 @@
+"""
+Cache Stale-While-Revalidate para datos del Apps Script
+=======================================================
+
+Con st.cache_data, cuando vence el TTL el siguiente usuario espera la
+descarga completa (getConfig, getRegistros), y suele ser el participante que
+está en la fila del check-in. SnapshotCache sirve siempre el último snapshot
+bueno al instante. Si está vencido, lo renueva en un thread de fondo:
+
+- Una sola descarga a la vez por cache (las demás llamadas no la repiten).
+- Si la descarga falla se conserva el último snapshot bueno.
+- Cada snapshot lleva su edad, para mostrar "datos de hace N min".
+
+Solo la primera carga (sin snapshot todavía) bloquea al llamador.
+
+Cada snapshot es inmutable y lleva un número de versión. get() entrega una
+vista del DataFrame sin copiarlo (a diferencia de st.cache_data, que lo
+deserializa en cada llamada). Con Copy-on-Write, modificar la vista copia solo
+lo modificado, así el snapshot compartido nunca cambia. Una renovación publica
+un DataFrame nuevo y no toca las vistas ya entregadas.
+
+Con ruta, cada snapshot DataFrame bueno se guarda además como Parquet
+(escritura atómica, con un sello de versión en los metadatos). Al reiniciar,
+el cache arranca desde ese archivo: lectura memory-mapped y solo de las
+columnas indicadas. Luego se revalida contra el API en segundo plano, así el
+check-in funciona aunque el Apps Script esté caído justo al arrancar.
+
+Uso:
+    from snapshot_cache import get_snapshot_cache
+
+    def descargar_config():
+        data = api.get('getConfig')
+        if not data['success']:
+            raise RuntimeError(data.get('error'))
+        return pd.DataFrame(data['cursos'])
+
+    config = get_snapshot_cache("config", descargar_config, ttl=300,
+                                ruta="snapshots/config.parquet")
+    df = config.get()          # Vista sin copia; nunca espera si ya hay un snapshot
+    config.version             # Sube con cada snapshot nuevo
+    config.edad                # Segundos desde la última descarga buena
+    config.refrescar()         # Botón "Actualizar Datos": descarga y espera
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+REINTENTO_TRAS_FALLO = 30  # Segundos mínimos entre descargas de fondo fallidas
+FORMATO_SNAPSHOT = 1       # Sube si cambia el formato del archivo; los anteriores se ignoran
+
+# Las vistas de get() comparten memoria con el snapshot: Copy-on-Write evita
+# que una sesión lo modifique para las demás (es el default desde pandas 3)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+class SnapshotNoDisponible(Exception):
+    """Todavía no hay ningún snapshot y la descarga falló."""
+
+
+class SnapshotCache:
+    """
+    Último snapshot bueno de un dato remoto, renovado en segundo plano.
+    """
+
+    def __init__(self, nombre, cargar, ttl, ruta=None, columnas=None):
+        """
+        Args:
+            nombre: Identificador del cache (para logs y el thread)
+            cargar: Función sin argumentos que descarga el dato; debe lanzar
+                    una excepción si falla (no retornar un valor vacío)
+            ttl: Segundos tras los cuales el snapshot se renueva en segundo plano
+            ruta: Archivo Parquet donde persistir el snapshot (opcional)
+            columnas: Columnas a leer del archivo al arrancar (default: todas)
+        """
+        self.nombre = nombre
+        self.ttl = ttl
+        self.ruta = str(ruta) if ruta else None
+        self.columnas = columnas
+        self._cargar = cargar
+        self._valor = None
+        self._cargado_en = None   # time.monotonic() de la última carga buena
+        self._fecha = None        # datetime de la última carga buena
+        self._version = 0
+        self._vencido = False     # invalidar() fuerza la renovación
+        self._carga = None        # threading.Event de la descarga en curso
+        self._fallo_en = None
+        self._origen = None       # 'disco' o 'api'
+        self.ultimo_error = None
+        self.error_disco = None
+        self._lock = threading.Lock()
+
+        if ruta:
+            self._cargar_de_disco()
+
+    def get(self):
+        """
+        Obtiene el snapshot actual; si está vencido, lanza su renovación en
+        segundo plano y retorna el vigente sin esperar.
+
+        Returns:
+            El valor retornado por cargar() (un DataFrame se entrega como
+            vista sin copia, ver _vista)
+
+        Raises:
+            SnapshotNoDisponible: Si no hay snapshot y la primera carga falló
+        """
+        with self._lock:
+            if self._cargado_en is not None:
+                if self._vencido or time.monotonic() - self._cargado_en > self.ttl:
+                    self._renovar_en_segundo_plano()
+                return _vista(self._valor)
+        return self.refrescar()
+
+    def refrescar(self, timeout=None):
+        """
+        Descarga el dato ahora y espera el resultado. Si ya hay una descarga
+        en curso, espera esa en vez de iniciar otra.
+
+        Args:
+            timeout: Segundos máximos de espera por una descarga ajena
+
+        Returns:
+            El snapshot más reciente (el anterior si la descarga falló)
+
+        Raises:
+            SnapshotNoDisponible: Si no hay ningún snapshot
+        """
+        with self._lock:
+            evento = self._carga
+            propia = evento is None
+            if propia:
+                evento = self._carga = threading.Event()
+        if propia:
+            self._ejecutar_carga(evento)
+        else:
+            evento.wait(timeout)
+
+        with self._lock:
+            if self._cargado_en is None:
+                raise SnapshotNoDisponible(f"{self.nombre}: {self.ultimo_error or 'sin datos'}")
+            return _vista(self._valor)
+
+    def invalidar(self):
+        """Marca el snapshot como vencido (se renueva en el próximo get)."""
+        with self._lock:
+            self._vencido = True
+            self._fallo_en = None
+
+    def _renovar_en_segundo_plano(self):
+        """Inicia la renovación en un thread si no hay otra en curso (con el lock tomado)."""
+        if self._carga is not None:
+            return
+        if self._fallo_en is not None and time.monotonic() - self._fallo_en < REINTENTO_TRAS_FALLO:
+            return  # No reintentar en cada request mientras el API está caído
+        evento = self._carga = threading.Event()
+        threading.Thread(target=self._ejecutar_carga, args=(evento,),
+                         name=f"snapshot_{self.nombre}", daemon=True).start()
+
+    def _ejecutar_carga(self, evento):
+        """Llama a cargar() y publica el resultado."""
+        try:
+            valor = self._cargar()
+            with self._lock:
+                self._valor = valor
+                self._cargado_en = time.monotonic()
+                self._fecha = datetime.now()
+                self._version += 1
+                self._vencido = False
+                self._fallo_en = None
+                self._origen = 'api'
+                self.ultimo_error = None
+                fecha = self._fecha
+            if self.ruta and isinstance(valor, pd.DataFrame):
+                self._guardar_en_disco(valor, fecha)
+        except Exception as e:
+            with self._lock:
+                self._fallo_en = time.monotonic()
+                self.ultimo_error = str(e)
+        finally:
+            with self._lock:
+                self._carga = None
+            evento.set()
+
+    def _guardar_en_disco(self, df, fecha):
+        """
+        Escribe el snapshot como Parquet de forma atómica (archivo temporal +
+        os.replace): un proceso que arranca nunca lee un archivo a medias.
+        """
+        try:
+            tabla = _tabla_arrow(df)
+            sello = json.dumps({'formato': FORMATO_SNAPSHOT, 'nombre': self.nombre,
+                                'fecha': fecha.isoformat()})
+            tabla = tabla.replace_schema_metadata(
+                dict(tabla.schema.metadata or {}, snapshot=sello)
+            )
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            pq.write_table(tabla, temporal)
+            os.replace(temporal, self.ruta)
+            self.error_disco = None
+        except Exception as e:
+            self.error_disco = str(e)
+
+    def _cargar_de_disco(self):
+        """
+        Arranca desde el último snapshot persistido, si existe y su sello es
+        compatible. Queda vencido para revalidarse en el primer get().
+        """
+        if not os.path.exists(self.ruta):
+            return
+        try:
+            metadata = pq.read_schema(self.ruta).metadata or {}
+            sello = json.loads(metadata.get(b'snapshot', b'{}'))
+            if sello.get('formato') != FORMATO_SNAPSHOT or sello.get('nombre') != self.nombre:
+                return
+
+            columnas = None
+            if self.columnas:
+                existentes = set(pq.read_schema(self.ruta).names)
+                columnas = [c for c in self.columnas if c in existentes]
+            valor = pq.read_table(self.ruta, columns=columnas, memory_map=True).to_pandas()
+        except Exception as e:
+            self.error_disco = str(e)  # Archivo dañado: se ignora y se descarga
+            return
+
+        self.sembrar(valor, datetime.fromisoformat(sello['fecha']))
+
+    def sembrar(self, valor, fecha=None):
+        """
+        Usa un valor ya disponible localmente (ej: un archivo del arranque
+        anterior) como snapshot inicial. Queda vencido: el primer get() lo
+        entrega sin esperar y lo revalida en segundo plano. No hace nada si
+        ya hay un snapshot.
+
+        Args:
+            valor: Snapshot inicial
+            fecha: datetime en que se obtuvo (default: ahora), para su edad
+        """
+        fecha = fecha or datetime.now()
+        with self._lock:
+            if self._cargado_en is not None:
+                return
+            self._valor = valor
+            self._fecha = fecha
+            self._cargado_en = time.monotonic() - max(0.0, (datetime.now() - fecha).total_seconds())
+            self._version = 1
+            self._vencido = True
+            self._origen = 'disco'
+
+    @property
+    def version(self):
+        """Número del snapshot vigente (0 = sin snapshot)."""
+        with self._lock:
+            return self._version
+
+    @property
+    def edad(self):
+        """Segundos desde la última descarga buena (None si no hay snapshot)."""
+        with self._lock:
+            if self._cargado_en is None:
+                return None
+            return time.monotonic() - self._cargado_en
+
+    def get_estado(self):
+        """
+        Obtiene el estado del cache para monitoreo.
+
+        Returns:
+            dict: nombre, version, fecha, edad_segundos, origen ('disco' o
+                  'api'), actualizando, ultimo_error y error_disco
+        """
+        edad = self.edad
+        with self._lock:
+            return {
+                'nombre': self.nombre,
+                'version': self._version,
+                'fecha': self._fecha,
+                'edad_segundos': round(edad, 1) if edad is not None else None,
+                'origen': self._origen,
+                'actualizando': self._carga is not None,
+                'ultimo_error': self.ultimo_error,
+                'error_disco': self.error_disco
+            }
+
+
+def _vista(valor):
+    """
+    Vista de un snapshot para entregar a una sesión. Un DataFrame se entrega
+    como copia superficial: comparte las columnas sin copiarlas, y sus
+    cambios (agregar columnas, asignar celdas) no llegan al snapshot.
+    """
+    if isinstance(valor, pd.DataFrame):
+        return valor.copy(deep=False)
+    return valor
+
+
+def _tabla_arrow(df):
+    """
+    Convierte un DataFrame a tabla Arrow. Las columnas que vienen de Sheets
+    con tipos mezclados (ej: números y textos) se guardan como texto.
+    """
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        for col in df.columns[df.dtypes == object]:
+            df[col] = df[col].map(lambda v: v if v is None or isinstance(v, str) or pd.isna(v)
+                                  else str(v))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def formatear_edad(segundos):
+    """
+    Texto corto para mostrar la edad de un snapshot.
+
+    Args:
+        segundos: Edad en segundos (None = sin datos)
+
+    Returns:
+        str: "sin datos", "12 s", "3 min" o "2 h"
+    """
+    if segundos is None:
+        return "sin datos"
+    if segundos < 60:
+        return f"{segundos:.0f} s"
+    if segundos < 3600:
+        return f"{segundos / 60:.0f} min"
+    return f"{segundos / 3600:.0f} h"
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_snapshot_cache(nombre, cargar, ttl, ruta=None, columnas=None):
+    """
+    Obtiene el cache compartido del proceso con ese nombre (lo crea la
+    primera vez). Todas las sesiones de Streamlit comparten el snapshot.
+    Los argumentos después de nombre solo se usan al crearlo.
+
+    Args:
+        nombre: Identificador único del cache en el proceso
+        cargar: Función de descarga
+        ttl: Segundos de validez del snapshot
+        ruta: Archivo Parquet donde persistirlo (opcional)
+        columnas: Columnas a leer del archivo al arrancar (default: todas)
+
+    Returns:
+        SnapshotCache: Instancia única por nombre
+    """
+    with _caches_lock:
+        if nombre not in _caches:
+            _caches[nombre] = SnapshotCache(nombre, cargar, ttl, ruta=ruta, columnas=columnas)
+        return _caches[nombre]
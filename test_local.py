@@ -5,6 +5,7 @@ Simula todos los flujos críticos sin tocar Google Sheets.
 
 import sys
 import os
+import json
 import pandas as pd
 from datetime import datetime, date
 import duckdb
@@ -406,6 +407,1460 @@ try:
 except Exception as e:
     check("Flujo end-to-end", False, traceback.format_exc())
 
+# ─────────────────────────────────────────────
+seccion("10. SYNC POR LOTES — addAsistenciasBatch contra API local")
+
+import tempfile
+from api_local import iniciar_api_local
+from db_buffer import AsistenciaBuffer
+
+TMP_DIR = tempfile.mkdtemp(prefix="test_local_")
+
+try:
+    api = iniciar_api_local()
+    api.fallar_ruts.add("11111111-1")
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "lotes.duckdb"),
+                              api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0,
+                              sync_por_lotes=True, filas_por_request=25)
+    buffer.esperar_hidratacion()
+
+    for i in range(29):
+        buffer.marcar_asistencia("mar26-RM", f"{20000000 + i}-K", 1)
+    buffer.marcar_asistencia("mar26-RM", "11111111-1", 1)
+
+    stats = buffer.sincronizar(batch_size=50)
+    check("30 pendientes procesados", stats['total_pendientes'] == 30, str(stats['total_pendientes']))
+    check("29 sincronizados por lote", stats['sincronizados'] == 29)
+    check("1 fallido por fila (no todo el lote)", stats['fallidos'] == 1)
+    check("2 requests para 30 filas", api.llamadas.get('addAsistenciasBatch') == 2,
+          str(api.llamadas))
+    check("Fila fallida queda pendiente con error", buffer.get_estadisticas()['pendientes'] == 1)
+
+    # Reintento: duplicados ('ya existe') cuentan como éxito
+    api.fallar_ruts.clear()
+    buffer.conn.execute("UPDATE asistencias_buffer SET sincronizado = false, next_retry_at = ?",
+                        [datetime.now()])
+    stats2 = buffer.sincronizar(batch_size=50)
+    check("Reenvío de existentes cuenta como sincronizado", stats2['sincronizados'] == 30)
+    check("API local sin duplicados", len(api.asistencias) == 30)
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Sync por lotes general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("11. SYNC CONCURRENTE — Workers y equidad por curso")
+
+try:
+    import threading
+    api = iniciar_api_local(latencia=0.02)
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "workers.duckdb"),
+                              api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0, sync_workers=4)
+    buffer.esperar_hidratacion()
+
+    for i in range(40):
+        buffer.marcar_asistencia("curso-grande", f"{30000000 + i}-K", 1)
+    for curso in ("curso-a", "curso-b"):
+        for i in range(3):
+            buffer.marcar_asistencia(curso, f"{40000000 + i}-K", 1)
+
+    primeros = buffer.get_asistencias_pendientes(limit=9)
+    cursos_primeros = {a['curso_id'] for a in primeros}
+    check("Pendientes intercalados por curso", cursos_primeros == {"curso-grande", "curso-a", "curso-b"},
+          str(sorted(cursos_primeros)))
+
+    # Dos pasadas simultáneas no deben enviar la misma fila dos veces
+    hilos = [threading.Thread(target=buffer.sincronizar, kwargs={'batch_size': 100}) for _ in range(2)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    check("Backlog completo sincronizado", buffer.get_estadisticas()['pendientes'] == 0)
+    check("Un request por fila (sin envíos dobles)", api.llamadas.get('addAsistencia') == 46,
+          str(api.llamadas.get('addAsistencia')))
+    check("API local recibió 46 asistencias", len(api.asistencias) == 46)
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Sync concurrente general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("12. BACKOFF — next_retry_at y reanudación de fallidas")
+
+try:
+    import db_buffer
+    api = iniciar_api_local()
+    api.fallar_ruts.add("11111111-1")
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "backoff.duckdb"),
+                              api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+
+    buffer.marcar_asistencia("mar26-RM", "11111111-1", 1)
+    buffer.marcar_asistencia("mar26-RM", "12345678-9", 1)
+    stats = buffer.sincronizar()
+    check("Primer intento: 1 ok, 1 fallido", stats['sincronizados'] == 1 and stats['fallidos'] == 1)
+
+    proximo = buffer.conn.execute(
+        "SELECT next_retry_at FROM asistencias_buffer WHERE rut = '11111111-1'").fetchone()[0]
+    espera = (proximo - datetime.now()).total_seconds()
+    check("Próximo intento agendado con backoff",
+          db_buffer.BACKOFF_BASE_SEGUNDOS / 2 - 1 <= espera <= db_buffer.BACKOFF_BASE_SEGUNDOS,
+          f"{espera:.1f}s")
+    check("Fila en espera no se selecciona", buffer.get_asistencias_pendientes() == [])
+
+    llamadas = api.llamadas.get('addAsistencia')
+    buffer.sincronizar()
+    check("Tick siguiente no gasta requests", api.llamadas.get('addAsistencia') == llamadas)
+
+    esperas = [(AsistenciaBuffer._calcular_proximo_intento(n) - datetime.now()).total_seconds()
+               for n in (1, 3, 20)]
+    check("Backoff crece y respeta el máximo",
+          esperas[0] < esperas[1] and esperas[2] <= db_buffer.BACKOFF_MAX_SEGUNDOS,
+          ", ".join(f"{e:.0f}s" for e in esperas))
+
+    # Agotar intentos → fallida; reanudar → vuelve a la cola
+    buffer.conn.execute("UPDATE asistencias_buffer SET intentos_sync = ? WHERE rut = '11111111-1'",
+                        [db_buffer.MAX_INTENTOS_SYNC])
+    buffer._recontar()  # Edición directa en DuckDB: los contadores no la ven
+    check("Intentos agotados cuenta como fallida", buffer.get_estadisticas()['fallidas'] == 1)
+    check("reanudar_fallidas retorna 1", buffer.reanudar_fallidas() == 1)
+    api.fallar_ruts.clear()
+    stats = buffer.sincronizar()
+    check("Fila reanudada se sincroniza", stats['sincronizados'] == 1
+          and buffer.get_estadisticas()['fallidas'] == 0)
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Backoff general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("13. CIRCUIT BREAKER — Fallo rápido con API caída")
+
+try:
+    import time
+    from circuit_breaker import CircuitBreaker, CircuitoAbiertoError, CERRADO, ABIERTO, SEMI_ABIERTO
+
+    cb = CircuitBreaker(umbral_fallos=2, tiempo_apertura=0.2)
+    cb.registrar_fallo()
+    check("1 fallo no abre el circuito", cb.estado == CERRADO)
+    cb.registrar_fallo()
+    check("2 fallos abren el circuito", cb.estado == ABIERTO and not cb.permitir())
+    try:
+        cb.ejecutar(lambda: 1)
+        check("ejecutar con circuito abierto lanza error", False)
+    except CircuitoAbiertoError:
+        check("ejecutar con circuito abierto lanza error", True)
+    time.sleep(0.25)
+    check("Tras el tiempo de apertura pasa una sola prueba",
+          cb.permitir() and cb.estado == SEMI_ABIERTO and not cb.permitir())
+    cb.registrar_fallo()
+    check("Prueba fallida reabre el circuito", cb.estado == ABIERTO)
+    time.sleep(0.25)
+    check("Prueba exitosa cierra el circuito", cb.ejecutar(lambda: 42) == 42 and cb.estado == CERRADO)
+
+    # Buffer contra API caída
+    api_caida = iniciar_api_local()
+    api_caida.detener()
+    cb = CircuitBreaker(umbral_fallos=3, tiempo_apertura=0.3)
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "breaker.duckdb"),
+                              api_url=api_caida.url, api_key=api_caida.api_key,
+                              auto_sync_interval=0, circuit_breaker=cb)
+    buffer.esperar_hidratacion()
+    cb.registrar_exito()  # Olvidar el fallo de la hidratación inicial
+    for i in range(6):
+        buffer.marcar_asistencia("mar26-RM", f"{50000000 + i}-K", 1)
+
+    stats = buffer.sincronizar()
+    check("API caída: 3 intentos y luego fallo rápido",
+          stats['fallidos'] == 3 and stats['omitidos'] == 3, f"{stats['fallidos']}/{stats['omitidos']}")
+    sin_intentos = buffer.conn.execute(
+        "SELECT COUNT(*) FROM asistencias_buffer WHERE intentos_sync = 0").fetchone()[0]
+    check("Omitidos no consumen reintentos", sin_intentos == 3)
+
+    api = iniciar_api_local()
+    buffer.api_url = api.url
+    time.sleep(0.35)
+    stats = buffer.sincronizar()
+    check("API recuperada: sonda cierra el circuito y sincroniza",
+          stats['sincronizados'] == 3 and cb.estado == CERRADO, str(stats['sincronizados']))
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Circuit breaker general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("14. ESTRÉS — 1000 marcar_asistencia concurrentes contra el sync loop")
+
+try:
+    import concurrent.futures
+    api = iniciar_api_local(latencia=0.01)
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "estres.duckdb"),
+                              api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=1,
+                              sync_por_lotes=True, filas_por_request=25, sync_workers=4)
+    buffer.esperar_hidratacion()
+
+    def participante(i):
+        curso = f"curso-{i % 5}"
+        rut = f"{60000000 + i}-K"
+        r = buffer.marcar_asistencia(curso, rut, 1, metodo='estres')
+        buffer.verificar_asistencia(curso, rut, 1)  # Lecturas concurrentes
+        return r['success']
+
+    inicio = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=64) as executor:
+        exitos = list(executor.map(participante, range(1000)))
+    duracion = time.time() - inicio
+    check("1000 escrituras concurrentes exitosas", all(exitos),
+          f"{sum(exitos)} ok en {duracion:.2f}s")
+
+    # Esperar a que el sync loop drene todo (con tope)
+    limite = time.time() + 60
+    while buffer.get_estadisticas()['pendientes'] > 0 and time.time() < limite:
+        time.sleep(0.2)
+
+    filas, distintas = buffer.conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT (curso_id, rut, sesion)) FROM asistencias_buffer").fetchone()
+    check("Sin filas perdidas ni duplicadas en DuckDB", filas == 1000 and distintas == 1000,
+          f"{filas} filas / {distintas} distintas")
+    check("Todo sincronizado por el sync loop", buffer.get_estadisticas()['sincronizadas'] == 1000)
+    claves_api = {(a['curso_id'], a['rut'], a['sesion']) for a in api.asistencias}
+    check("API recibió cada fila exactamente una vez",
+          len(api.asistencias) == 1000 and len(claves_api) == 1000, str(len(api.asistencias)))
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Estrés concurrente general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("15. GROUP COMMIT — Check-ins agrupados con resultado por llamador")
+
+try:
+    import time
+    api = iniciar_api_local()
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "group_commit.duckdb"),
+                              api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0, group_commit=True)
+    buffer.esperar_hidratacion()
+    check("Group commit activo", buffer.group_commit)
+
+    flushes = []
+    insertar_original = buffer._escritor_agrupado._insertar
+    def insertar_contando(filas):
+        flushes.append(len(filas))
+        return insertar_original(filas)
+    buffer._escritor_agrupado._insertar = insertar_contando
+
+    buffer.marcar_asistencia("mar26-RM", "70000000-0", 1)  # Ya existía antes
+    # 200 check-ins: 150 RUTs distintos + 50 repetidos
+    ruts = [f"{70000000 + i}-{i % 10}" for i in range(150)] + [f"{70000000 + i}-{i % 10}" for i in range(50)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
+        res = list(executor.map(lambda r: buffer.registrar_si_no_existe("mar26-RM", r, 1), ruts))
+
+    nuevos = sum(1 for r in res if r['success'])
+    duplicados = sum(1 for r in res if r.get('duplicado'))
+    check("149 nuevos + 51 duplicados", nuevos == 149 and duplicados == 51, f"{nuevos}/{duplicados}")
+    check("Mensaje de duplicado por llamador",
+          all(r['message'] == "Ya existe un registro de asistencia para este participante en esta sesión"
+              for r in res if r.get('duplicado')))
+    # Los duplicados ya conocidos se rechazan en memoria antes de encolarse
+    check("Menos INSERTs que check-ins", len(flushes) < sum(flushes) <= len(ruts),
+          f"{len(flushes)} flushes, {sum(flushes)} filas encoladas")
+    total = buffer.conn.execute("SELECT COUNT(*) FROM asistencias_buffer").fetchone()[0]
+    check("150 filas en buffer", total == 150, str(total))
+
+    # Escritor frenado por el lock: timeout solo para filas que no alcanzó a tomar
+    buffer._escritor_agrupado._insertar = insertar_original
+    def fila_gc(rut):
+        return {'curso_id': "mar26-RM", 'rut': rut, 'sesion': 2, 'estado': 'presente', 'metodo': 'test'}
+    buffer._escritura.acquire()
+    tomada = concurrent.futures.ThreadPoolExecutor(max_workers=1).submit(
+        buffer._escritor_agrupado.encolar, fila_gc("71000000-0"), 0.3)
+    time.sleep(0.1)   # El escritor toma la fila y queda esperando el lock
+    try:
+        buffer._escritor_agrupado.encolar(fila_gc("71000001-1"), timeout=0.1)
+        retirada = False
+    except TimeoutError:
+        retirada = True
+    time.sleep(0.4)
+    buffer._escritura.release()
+    check("Fila ya tomada por el escritor no informa error", tomada.result(timeout=5)['insertado'])
+    check("Fila aún en cola se retira con TimeoutError", retirada)
+    time.sleep(0.1)
+    check("Fila retirada no se escribe",
+          not buffer.verificar_asistencia("mar26-RM", "71000001-1", 2)
+          and buffer.verificar_asistencia("mar26-RM", "71000000-0", 2))
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Group commit general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("16. REGISTRAR_SI_NO_EXISTE — Check-in atómico sin carrera")
+
+try:
+    api = iniciar_api_local()
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "atomico.duckdb"),
+                              api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+
+    r1 = buffer.registrar_si_no_existe("mar26-RM", "18340815-1", 1)
+    check("Primer registro insertado", r1['success'] and r1['insertado'] and r1['id'])
+    r2 = buffer.registrar_si_no_existe("mar26-RM", "18340815-1", 1)
+    check("Segundo registro informa duplicado", not r2['success'] and r2['duplicado'])
+    check("Mensaje de duplicado correcto", "Ya existe" in r2['message'])
+
+    # 20 envíos simultáneos del mismo participante → exactamente uno gana
+    with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
+        carrera = list(executor.map(
+            lambda _: buffer.registrar_si_no_existe("mar26-RM", "12345678-9", 2), range(20)))
+    check("Carrera: un solo insertado", sum(r['insertado'] for r in carrera) == 1,
+          str(sum(r['insertado'] for r in carrera)))
+    check("Carrera: 19 duplicados", sum(r['duplicado'] for r in carrera) == 19)
+
+    # Fila en DuckDB que el índice no conoce: la restricción UNIQUE la rechaza
+    buffer._claves.discard(("mar26-RM", "18340815-1", 1))
+    r3 = buffer.registrar_si_no_existe("mar26-RM", "18340815-1", 1)
+    check("ConstraintException se informa como duplicado",
+          not r3['success'] and r3['duplicado'], str(r3))
+    lote = buffer._insertar_si_no_existen([
+        {'curso_id': "mar26-RM", 'rut': "18340815-1", 'sesion': 1, 'estado': 'presente', 'metodo': 'test'},
+        {'curso_id': "mar26-RM", 'rut': "18340816-K", 'sesion': 1, 'estado': 'presente', 'metodo': 'test'},
+    ])
+    check("Lote con una fila existente inserta el resto",
+          [r['insertado'] for r in lote] == [False, True], str(lote))
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("registrar_si_no_existe general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("17. ÍNDICE EN MEMORIA — Duplicados sin consultar DuckDB")
+
+try:
+    api = iniciar_api_local()
+    api.asistencias.append({'curso_id': 'abr26-RM', 'rut': '80000000-k', 'sesion': 1,
+                            'fecha_registro': '2026-04-01 10:00:00', 'estado': 'presente'})
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "indice.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+    check("Hidratación llena el índice", buffer.verificar_asistencia("abr26-RM", "80000000-K", 1))
+
+    buffer.registrar_si_no_existe("abr26-RM", "80000001-1", 1)
+
+    def sin_sql():
+        raise AssertionError("consulta a DuckDB")
+    buffer._db = sin_sql
+    r = buffer.registrar_si_no_existe("abr26-RM", " 80000000-K ", 1)
+    check("Duplicado hidratado rechazado sin SQL", r['duplicado'])
+    r = buffer.registrar_si_no_existe("abr26-RM", "80000001-1", 1)
+    check("Duplicado local rechazado sin SQL", r['duplicado'])
+    check("verificar_asistencia sin SQL",
+          buffer.verificar_asistencia("abr26-RM", "80000001-1", 1)
+          and not buffer.verificar_asistencia("abr26-RM", "80000001-1", 2))
+    del buffer._db
+
+    buffer.conn.execute("UPDATE asistencias_buffer SET created_at = created_at - INTERVAL '60 days'")
+    buffer.limpiar_sincronizados(dias=30)
+    check("limpiar_sincronizados quita la clave del índice",
+          not buffer.verificar_asistencia("abr26-RM", "80000000-K", 1)
+          and buffer.verificar_asistencia("abr26-RM", "80000001-1", 1))
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Índice en memoria general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("18. HIDRATACIÓN EN BLOQUE — Un solo INSERT desde tabla Arrow")
+
+try:
+    api = iniciar_api_local()
+    api.asistencias.extend(datos_sheets_mock)
+    api.asistencias.append({"curso_id": "mar26-RM", "rut": "22222222-2", "sesion": "x",
+                            "fecha_registro": "2026-03-04T12:10:00.000Z"})  # sesión inválida
+    api.asistencias.append(dict(datos_sheets_mock[0], rut=" 18340815-1 "))  # repetido en Sheets
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "hidratacion_bloque.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+
+    filas = buffer.conn.execute("""
+        SELECT rut, sesion, fecha_registro, metodo FROM asistencias_buffer ORDER BY id
+    """).fetchall()
+    check("3 filas válidas cargadas", len(filas) == 3, str(filas))
+    check("Sesión 1.0 guardada como int", all(f[1] == 1 for f in filas))
+    fecha = {f[0]: f[2] for f in filas}
+    check("Fecha con sufijo Z parseada", fecha.get("18340815-1") == datetime(2026, 3, 4, 12, 0))
+    check("Fecha inválida usa la hora actual",
+          abs((fecha["11111111-1"] - datetime.now()).total_seconds()) < 60)
+
+    buffer.marcar_asistencia("mar26-RM", "33333333-3", 1)
+    check("Re-hidratar no duplica (anti-join)", buffer.hydrate_from_sheets() == 0)
+    check("Local intacto tras re-hidratar",
+          buffer.conn.execute("SELECT COUNT(*) FROM asistencias_buffer").fetchone()[0] == 4)
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Hidratación en bloque general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("19. HIDRATACIÓN INCREMENTAL — Marca de agua en buffer_meta")
+
+try:
+    api = iniciar_api_local()
+    def fila_sheets(i):
+        return {"curso_id": "may26-RM", "rut": f"{90000000 + i}-{i % 10}", "sesion": 1,
+                "fecha_registro": "2026-05-04T12:00:00.000Z", "estado": "presente"}
+    api.asistencias.extend(fila_sheets(i) for i in range(3))
+
+    pedidos = []
+    get_original = api.get_asistencias
+    def get_espiando(params):
+        pedidos.append(int(params.get('desde') or 0))
+        return get_original(params)
+    api.get_asistencias = get_espiando
+
+    db_path = os.path.join(TMP_DIR, "hidratacion_delta.duckdb")
+    buffer = AsistenciaBuffer(db_path=db_path, api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+    check("Primera hidratación completa", pedidos == [0] and buffer._get_meta('hidratacion_filas') == '3')
+
+    api.asistencias.extend(fila_sheets(i) for i in range(3, 5))
+    check("force_hydrate trae solo filas nuevas", buffer.force_hydrate() == 2 and pedidos[-1] == 3)
+    buffer.close()
+
+    buffer = AsistenciaBuffer(db_path=db_path, api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+    check("Marca de agua persiste tras reinicio", pedidos[-1] == 5)
+
+    del api.asistencias[1:]
+    pedidos.clear()
+    buffer.force_hydrate()
+    check("Hoja más corta → relectura completa",
+          pedidos == [5, 0] and buffer._get_meta('hidratacion_filas') == '1')
+
+    api.get_asistencias = lambda params: {'success': True, 'asistencias': list(api.asistencias)}
+    buffer.force_hydrate()
+    check("API sin 'desde' → marca = filas recibidas", buffer._get_meta('hidratacion_filas') == '1')
+    api.get_asistencias = get_espiando
+
+    check("Recarga completa borra sincronizados y relee la hoja",
+          buffer.recargar_desde_sheets() == 1 and pedidos[-1] == 0
+          and buffer.conn.execute("SELECT COUNT(*) FROM asistencias_buffer").fetchone()[0] == 1)
+
+    # Limpiar sincronizados borra la marca: la siguiente hidratación recupera las claves
+    buffer.registrar_si_no_existe("may26-RM", "90000077-7", 1)
+    buffer.sincronizar()
+    buffer.force_hydrate()
+    buffer.limpiar_sincronizados(dias=0)
+    check("limpiar_sincronizados borra la marca de agua", buffer._get_meta('hidratacion_filas') is None)
+    check("force_hydrate tras limpiar relee la hoja",
+          buffer.force_hydrate() == 2 and pedidos[-1] == 0
+          and buffer.verificar_asistencia("may26-RM", "90000077-7", 1))
+    check("Check-in ya sincronizado sigue siendo duplicado",
+          buffer.registrar_si_no_existe("may26-RM", "90000077-7", 1)['duplicado'])
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Hidratación incremental general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("20. INICIO EN SEGUNDO PLANO — Estado de hidratación y reconciliación")
+
+try:
+    api = iniciar_api_local(latencia=0.5)
+    api.asistencias.extend({"curso_id": "jun26-RM", "rut": f"{91000000 + i}-K", "sesion": 1,
+                            "fecha_registro": "2026-06-01T12:00:00.000Z"} for i in range(3))
+    inicio = time.perf_counter()
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "inicio_async.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0)
+    check("Constructor no espera la descarga", time.perf_counter() - inicio < 0.4,
+          f"{time.perf_counter() - inicio:.2f}s")
+    check("Estado inicial: hidratando", buffer.estado_hidratacion == db_buffer.HIDRATANDO)
+
+    r = buffer.registrar_si_no_existe("jun26-RM", "91000000-K", 1)  # Ya está en la hoja
+    check("Check-in aceptado durante la hidratación", r['success'])
+    buffer.registrar_si_no_existe("jun26-RM", "91000099-K", 1)      # Nuevo de verdad
+
+    check("Hidratación termina", buffer.esperar_hidratacion(timeout=10))
+    estado = buffer.get_estado_hidratacion()
+    check("Estado final: listo, 2 cargados, 1 reconciliado",
+          estado['estado'] == db_buffer.LISTO and estado['cargados'] == 2
+          and estado['reconciliados'] == 1, str(estado))
+    pendientes = [a['rut'] for a in buffer.get_asistencias_pendientes()]
+    check("Solo el check-in nuevo queda pendiente", pendientes == ["91000099-K"], str(pendientes))
+    check("Duplicado rechazado tras hidratar",
+          buffer.registrar_si_no_existe("jun26-RM", "91000001-K", 1)['duplicado'])
+    buffer.close()
+    api.detener()
+
+    api_caida = iniciar_api_local()
+    api_caida.detener()
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "inicio_degradado.duckdb"),
+                              api_url=api_caida.url, api_key=api_caida.api_key,
+                              auto_sync_interval=0, circuit_breaker=CircuitBreaker())
+    buffer.esperar_hidratacion(timeout=10)
+    estado = buffer.get_estado_hidratacion()
+    check("API caída → degradado con error", estado['estado'] == db_buffer.DEGRADADO and estado['error'])
+    check("Degradado igual acepta check-ins",
+          buffer.registrar_si_no_existe("jun26-RM", "91000000-K", 1)['success'])
+    buffer.close()
+except Exception as e:
+    check("Inicio en segundo plano general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("21. ESTADÍSTICAS EN MEMORIA — Contadores incrementales y desglose")
+
+try:
+    api = iniciar_api_local()
+    api.asistencias.append({"curso_id": "jul26-RM", "rut": "92000000-K", "sesion": 1,
+                            "fecha_registro": "2026-07-01T12:00:00.000Z"})
+    api.fallar_ruts.add("92000003-K")
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "contadores.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+    buffer.marcar_asistencia("jul26-RM", "92000001-K", 1)
+    buffer.marcar_asistencia("jul26-RM", "92000001-K", 1, estado='ausente')  # Actualiza, no suma
+    buffer.registrar_si_no_existe("jul26-RM", "92000002-K", 2)
+    buffer.registrar_si_no_existe("jul26-VA", "92000003-K", 1)
+    buffer.registrar_si_no_existe("jul26-VA", "92000003-K", 1)            # Duplicado
+    buffer.sincronizar()
+    buffer.conn.execute("UPDATE asistencias_buffer SET intentos_sync = ? WHERE rut = '92000003-K'",
+                        [db_buffer.MAX_INTENTOS_SYNC - 1])
+    buffer.conn.execute("UPDATE asistencias_buffer SET next_retry_at = now() - INTERVAL 1 MINUTE")
+    buffer.sincronizar()                                                    # Agota intentos
+
+    def sin_sql():
+        raise AssertionError("consulta a DuckDB")
+    buffer._db = sin_sql
+    stats = buffer.get_estadisticas()
+    del buffer._db
+    check("Totales sin consultar DuckDB",
+          (stats['total'], stats['sincronizadas'], stats['pendientes'], stats['fallidas']) == (4, 3, 0, 1),
+          str({k: v for k, v in stats.items() if not k.startswith('por_')}))
+    check("Desglose por curso",
+          stats['por_curso']['jul26-RM']['sincronizadas'] == 3
+          and stats['por_curso']['jul26-VA']['fallidas'] == 1)
+    check("Desglose por sesión", stats['por_sesion'][('jul26-RM', 2)]['total'] == 1
+          and stats['por_sesion'][('jul26-RM', 1)]['total'] == 2)
+
+    api.fallar_ruts.clear()
+    buffer.reanudar_fallidas()
+    buffer.limpiar_sincronizados(dias=0)
+    en_memoria = buffer.get_estadisticas()
+    buffer._recontar()
+    recontado = buffer.get_estadisticas()
+    check("Reanudar + limpiar mantienen contadores exactos",
+          en_memoria == recontado and en_memoria['pendientes'] == 1 and en_memoria['total'] == 1,
+          f"{en_memoria} vs {recontado}")
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Estadísticas en memoria general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("22. TELEMETRÍA — Latencias, errores por clase y archivo Prometheus")
+
+try:
+    from metricas_sync import Histograma, clasificar_excepcion
+    import requests as _requests
+
+    h = Histograma(limites=(0.1, 1))
+    for v in (0.05, 0.05, 0.5, 5):
+        h.observar(v)
+    check("Histograma: percentiles por bucket", h.percentil(50) == 0.1 and h.percentil(75) == 1
+          and h.percentil(100) == float('inf'))
+    check("Clasificación de excepciones",
+          clasificar_excepcion(_requests.exceptions.ReadTimeout()) == 'timeout'
+          and clasificar_excepcion(_requests.exceptions.ConnectionError()) == 'conexion'
+          and clasificar_excepcion(ValueError("JSON")) == 'respuesta_invalida')
+
+    api = iniciar_api_local(latencia=0.02)
+    api.fallar_ruts.add("93000001-K")
+    ruta_prom = os.path.join(TMP_DIR, "prom", "metricas.prom")  # Directorio aún no creado
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "metricas.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0,
+                              metricas_path=ruta_prom)
+    buffer.esperar_hidratacion()
+    for i in range(3):
+        buffer.marcar_asistencia("ago26-RM", f"{93000000 + i}-K", 1)
+    buffer.conn.execute("UPDATE asistencias_buffer SET created_at = created_at - INTERVAL 90 SECOND")
+    check("Antigüedad de la pendiente más vieja", buffer.get_metricas()['fila_pendiente_mas_antigua_segundos'] >= 90)
+
+    buffer.sincronizar()
+    metricas = buffer.get_metricas()
+    check("Latencia por llamada registrada",
+          metricas['latencias']['addAsistencia']['conteo'] == 3
+          and metricas['latencias']['getAsistencias']['conteo'] == 1)
+    check("Filas/s de la pasada", metricas['ultima_pasada']['sincronizados'] == 2
+          and metricas['ultima_pasada']['filas_por_segundo'] > 0)
+    check("Error del API por clase", metricas['errores'] == {'api': 1}, str(metricas['errores']))
+    check("Cola: 1 pendiente", metricas['cola_pendientes'] == 1)
+
+    with open(ruta_prom) as f:
+        prom = f.read()
+    check("Archivo Prometheus escrito",
+          'buffer_sync_latencia_segundos_count{accion="addAsistencia"} 3' in prom
+          and 'buffer_sync_errores_total{clase="api"} 1' in prom
+          and 'buffer_cola_pendientes 1' in prom)
+
+    api.detener()
+    buffer.conn.execute("UPDATE asistencias_buffer SET next_retry_at = now() - INTERVAL 1 MINUTE")
+    buffer.sincronizar()
+    check("API caída → error de conexión", buffer.get_metricas()['errores'].get('conexion') == 1)
+    buffer.close()
+except Exception as e:
+    check("Telemetría general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("23. AUTO-SYNC ADAPTATIVO — Despertar por escritura, backlog continuo y AIMD")
+
+try:
+    api = iniciar_api_local()
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "adaptativo.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=30,
+                              sync_por_lotes=True, filas_por_request=25)
+    buffer.esperar_hidratacion()
+
+    pasadas = []
+    sincronizar_original = buffer.sincronizar
+    def sincronizar_contando(batch_size=50):
+        pasadas.append(batch_size)
+        return sincronizar_original(batch_size=batch_size)
+    buffer.sincronizar = sincronizar_contando
+
+    def esperar_vacia(tope):
+        limite = time.time() + tope
+        while buffer.get_estadisticas()['pendientes'] > 0 and time.time() < limite:
+            time.sleep(0.05)
+        return buffer.get_estadisticas()['pendientes'] == 0
+
+    buffer.marcar_asistencia("sep26-RM", "94000000-K", 1)
+    check("Una escritura despierta al sync (intervalo de 30s)", esperar_vacia(3))
+
+    for i in range(1, 400):
+        buffer.marcar_asistencia("sep26-RM", f"{94000000 + i}-K", 1)
+    check("Backlog de 400 se drena sin esperar el intervalo", esperar_vacia(10))
+    check("Lote crece con backlog y API rápida", buffer.lote_sync > 50, str(buffer.lote_sync))
+
+    time.sleep(0.3)
+    n = len(pasadas)
+    time.sleep(1)
+    check("Cola vacía: el sync loop no consulta", len(pasadas) == n)
+
+    buffer.lote_sync = 400
+    buffer._ajustar_lote_sync(400, {'total_pendientes': 400, 'sincronizados': 400, 'errores': []},
+                              db_buffer.LOTE_SYNC_OBJETIVO_SEGUNDOS + 1)
+    check("Pasada lenta → lote a la mitad", buffer.lote_sync == 200)
+    buffer._ajustar_lote_sync(15, {'total_pendientes': 15, 'sincronizados': 0,
+                                   'errores': [{'clase': 'timeout'}]}, 0.1)
+    check("Timeout → lote a la mitad con mínimo", buffer.lote_sync == db_buffer.LOTE_SYNC_MIN)
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Auto-sync adaptativo general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("24. CIERRE CON DRENAJE — Sync acotado en tiempo y CHECKPOINT")
+
+try:
+    api = iniciar_api_local()
+    db_path = os.path.join(TMP_DIR, "drenaje.duckdb")
+    buffer = AsistenciaBuffer(db_path=db_path, api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0, sync_por_lotes=True)
+    buffer.esperar_hidratacion()
+    for i in range(300):
+        buffer.marcar_asistencia("oct26-RM", f"{95000000 + i}-K", 1)
+    drenaje = buffer.close(presupuesto_s=10)
+    check("close() drena más allá de un lote", drenaje['sincronizados'] == 300 and drenaje['pendientes'] == 0,
+          str(drenaje))
+    check("CHECKPOINT deja el archivo sin WAL", not os.path.exists(db_path + ".wal"))
+    check("close() repetido no falla", buffer.close() is None)
+    api.detener()
+
+    api = iniciar_api_local(latencia=0.2)
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "drenaje_lento.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+    buffer.lote_sync = 2
+    for i in range(20):
+        buffer.marcar_asistencia("oct26-RM", f"{95000000 + i}-K", 1)
+    drenaje = buffer.close(presupuesto_s=0.5)
+    check("Presupuesto agotado informa lo que queda",
+          drenaje['presupuesto_agotado'] and 0 < drenaje['pendientes'] < 20
+          and drenaje['pendientes'] + drenaje['sincronizados'] == 20, str(drenaje))
+    api.detener()
+except Exception as e:
+    check("Cierre con drenaje general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("25. VERSIONADO (CDC) — Cambios de estado también llegan a Sheets")
+
+try:
+    api = iniciar_api_local()
+    api.asistencias.append({"curso_id": "nov26-RM", "rut": "96000009-K", "sesion": 1,
+                            "fecha_registro": "2026-11-01T12:00:00.000Z", "estado": "presente"})
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "cdc.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0,
+                              sync_updates=True)
+    buffer.esperar_hidratacion()
+
+    def estado_api(rut):
+        return [a['estado'] for a in api.asistencias if a['rut'] == rut]
+
+    buffer.marcar_asistencia("nov26-RM", "96000000-K", 1)
+    buffer.sincronizar()
+    r = buffer.marcar_asistencia("nov26-RM", "96000000-K", 1)
+    check("Mismo estado no genera cambio", not r['sync_pending'] and buffer.get_estadisticas()['pendientes'] == 0)
+
+    buffer.marcar_asistencia("nov26-RM", "96000000-K", 1, estado='ausente')
+    buffer.marcar_asistencia("nov26-RM", "96000000-K", 1, estado='justificado')
+    version = buffer.conn.execute(
+        "SELECT version, version_sincronizada FROM asistencias_buffer WHERE rut = '96000000-K'").fetchone()
+    check("Dos cambios → versión 3, sincronizada 1", version == (3, 1), str(version))
+    check("Cambios coalescidos en una fila pendiente", buffer.get_estadisticas()['pendientes'] == 1)
+
+    antes = dict(api.llamadas)
+    buffer.sincronizar()
+    check("Un solo updateAsistencia", api.llamadas.get('updateAsistencia', 0) == 1
+          and api.llamadas.get('addAsistencia') == antes.get('addAsistencia'))
+    check("Sheets con el último estado, sin duplicar", estado_api("96000000-K") == ['justificado'])
+
+    buffer.marcar_asistencia("nov26-RM", "96000009-K", 1, estado='justificado')  # Fila hidratada
+    pendiente = buffer.get_asistencias_pendientes()[0]
+    buffer.marcar_asistencia("nov26-RM", "96000009-K", 1, estado='ausente')      # Cambia en vuelo
+    stats = {'sincronizados': 0, 'fallidos': 0, 'omitidos': 0, 'errores': []}
+    buffer._registrar_resultado_sync(pendiente, {'success': True}, stats)
+    check("Cambio durante el envío sigue pendiente", buffer.get_estadisticas()['pendientes'] == 1)
+    buffer.sincronizar()
+    check("Fila hidratada actualizada en Sheets", estado_api("96000009-K") == ['ausente'])
+
+    buffer.sync_por_lotes = True
+    buffer.marcar_asistencia("nov26-RM", "96000000-K", 1, estado='presente')
+    buffer.marcar_asistencia("nov26-RM", "96000001-K", 1)
+    buffer.sincronizar()
+    check("Lote mezcla op add y update",
+          estado_api("96000000-K") == ['presente'] and estado_api("96000001-K") == ['presente'])
+    buffer._recontar()
+    check("Contadores consistentes", buffer.get_estadisticas()['pendientes'] == 0
+          and buffer.get_estadisticas()['sincronizadas'] == 3)
+
+    # Sin SYNC_UPDATES (Apps Script sin updateAsistencia) el cambio no se envía
+    # como alta ("ya existe" lo daría por sincronizado): queda retenido
+    buffer.sync_updates = False
+    buffer.sync_por_lotes = False
+    antes = dict(api.llamadas)
+    r = buffer.marcar_asistencia("nov26-RM", "96000001-K", 1, estado='ausente')
+    stats = buffer.sincronizar()
+    check("Sin sync_updates el cambio queda retenido, sin requests",
+          r['success'] and not r['sync_pending'] and stats['total_pendientes'] == 0
+          and api.llamadas == antes and estado_api("96000001-K") == ['presente'])
+    retenidos = buffer.get_cambios_retenidos()
+    check("Cambio retenido visible en Mantenimiento",
+          list(retenidos['rut']) == ["96000001-K"] and list(retenidos['estado']) == ['ausente'])
+    buffer.limpiar_sincronizados(dias=0)
+    check("Limpiar sincronizados conserva el cambio retenido", len(buffer.get_cambios_retenidos()) == 1)
+
+    # Cambio en vuelo mientras se envía el alta: también queda retenido
+    buffer.marcar_asistencia("nov26-RM", "96000002-K", 1)
+    pendiente = buffer.get_asistencias_pendientes()[0]
+    buffer.marcar_asistencia("nov26-RM", "96000002-K", 1, estado='justificado')
+    stats = {'sincronizados': 0, 'fallidos': 0, 'omitidos': 0, 'errores': []}
+    buffer._registrar_resultado_sync(pendiente, {'success': True}, stats)
+    check("Cambio en vuelo sin sync_updates queda retenido",
+          sorted(buffer.get_cambios_retenidos()['rut']) == ["96000001-K", "96000002-K"]
+          and buffer.get_estadisticas()['pendientes'] == 0)
+    buffer.close()
+
+    # Al activar SYNC_UPDATES los cambios retenidos se envían como update
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "cdc.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0,
+                              sync_updates=True)
+    buffer.esperar_hidratacion()
+    check("Con sync_updates los retenidos vuelven a la cola",
+          buffer.get_estadisticas()['pendientes'] == 2 and buffer.get_cambios_retenidos().empty)
+    buffer.sincronizar()
+    check("Cambios retenidos llegan a Sheets",
+          estado_api("96000001-K") == ['ausente'] and estado_api("96000002-K") == ['justificado'])
+    buffer.close()
+
+    # Pendientes de update al desactivar SYNC_UPDATES quedan retenidos
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "cdc.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0,
+                              sync_updates=True)
+    buffer.esperar_hidratacion()
+    buffer.marcar_asistencia("nov26-RM", "96000001-K", 1, estado='presente')
+    buffer.close(presupuesto_s=0)
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "cdc.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+    check("Sin sync_updates los updates pendientes pasan a retenidos",
+          buffer.get_estadisticas()['pendientes'] == 0
+          and list(buffer.get_cambios_retenidos()['rut']) == ["96000001-K"])
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Versionado general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("26. IDS DETERMINÍSTICOS — Reintentos idempotentes sin error de 'ya existe'")
+
+try:
+    api = iniciar_api_local()
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "idempotencia.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0,
+                              sync_updates=True)
+    buffer.esperar_hidratacion()
+
+    r1 = buffer.marcar_asistencia("dic26-RM", " 97000000-k", 1)
+    r2 = buffer.registrar_si_no_existe("dic26-RM", "97000001-k", 1)
+    check("ID derivado de la clave normalizada",
+          r1['id'] == "ASIST-dic26-RM-97000000-K-1" and r2['id'] == db_buffer._id_asistencia("dic26-RM", "97000001-K", 1))
+    ruts = sorted(r[0] for r in buffer.conn.execute("SELECT rut FROM asistencias_buffer").fetchall())
+    check("RUT guardado normalizado", ruts == ["97000000-K", "97000001-K"], str(ruts))
+    check("Re-marcar conserva el ID", buffer.marcar_asistencia("dic26-RM", "97000000-K", 1)['id'] == r1['id'])
+    claves_v1 = {a['id']: AsistenciaBuffer._payload_asistencia(a)['idempotency_key']
+                 for a in buffer.get_asistencias_pendientes()}
+
+    buffer.sincronizar()
+    # Respuesta perdida: la fila vuelve a la cola y se reenvía tal cual
+    buffer.conn.execute("""
+        UPDATE asistencias_buffer SET sincronizado = false, version_sincronizada = 0, next_retry_at = ?
+    """, [datetime.now()])
+    buffer._recontar()
+    stats = buffer.sincronizar()
+    check("Reenvío respondido por idempotency_key", api.repetidos == 2 and stats['sincronizados'] == 2,
+          f"repetidos={api.repetidos}")
+    check("Sin filas duplicadas en la API", len(api.asistencias) == 2)
+
+    buffer.marcar_asistencia("dic26-RM", "97000000-K", 1, estado='justificado')
+    pendiente = buffer.get_asistencias_pendientes()[0]
+    clave_v2 = AsistenciaBuffer._payload_asistencia(pendiente)['idempotency_key']
+    check("Clave de idempotencia cambia con el contenido",
+          clave_v2.startswith(r1['id'] + "-") and clave_v2 != claves_v1[r1['id']])
+    buffer.sincronizar()
+    check("Update nuevo no se confunde con el alta", api.repetidos == 2
+          and [a['estado'] for a in api.asistencias if a['rut'] == "97000000-K"] == ['justificado'])
+
+    # La versión vuelve a 1 al re-hidratar: la clave no debe repetir una ya procesada
+    buffer.vaciar_buffer()
+    buffer.marcar_asistencia("dic26-RM", "97000000-K", 1, estado='ausente')
+    buffer.sincronizar()
+    check("Edición tras re-hidratar no se confunde con una anterior", api.repetidos == 2
+          and [a['estado'] for a in api.asistencias if a['rut'] == "97000000-K"] == ['ausente'])
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("IDs determinísticos general", False, traceback.format_exc())
+
+seccion("27. DEAD-LETTER — Tabla de fallidas y reenvío por grupos")
+
+try:
+    api = iniciar_api_local()
+    api.fallar_ruts.update({"98000000-1", "98000001-1", "98000002-1"})
+    db_path = os.path.join(TMP_DIR, "dead_letter.duckdb")
+    buffer = AsistenciaBuffer(db_path=db_path, api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0, sync_por_lotes=True)
+    buffer.esperar_hidratacion()
+
+    buffer.marcar_asistencia("ene27-RM", "98000000-1", 1)
+    buffer.marcar_asistencia("ene27-RM", "98000001-1", 1)
+    buffer.marcar_asistencia("ene27-VA", "98000002-1", 1)
+    buffer.marcar_asistencia("ene27-VA", "98000003-1", 1)
+    buffer.conn.execute("UPDATE asistencias_buffer SET intentos_sync = ?",
+                        [db_buffer.MAX_INTENTOS_SYNC - 1])
+    buffer._recontar()
+    stats = buffer.sincronizar()                                           # Agota intentos
+    fallidas = buffer.get_fallidas()
+    check("Intentos agotados pasan a la tabla dead-letter",
+          stats['fallidos'] == 3 and len(fallidas) == 3, f"{len(fallidas)} filas")
+    payload = json.loads(fallidas.set_index('rut').loc["98000002-1", 'payload'])
+    check("Guarda el payload y la clase de error",
+          payload['curso_id'] == "ene27-VA" and payload['idempotency_key'].startswith("ASIST-ene27-VA-98000002-1-")
+          and set(fallidas['error_clase']) == {'api'})
+    por_curso = buffer.agrupar_fallidas('curso_id')
+    check("Agrupa por curso", dict(zip(por_curso['curso_id'], por_curso['cantidad'])) == {
+        "ene27-RM": 2, "ene27-VA": 1})
+
+    check("Reenvío por curso", buffer.reenviar_fallidas(curso_id="ene27-VA") == 1
+          and buffer.get_estadisticas()['fallidas'] == 2 and len(buffer.get_fallidas()) == 2)
+    api.fallar_ruts.discard("98000002-1")
+    llamadas = api.llamadas.get('addAsistenciasBatch')
+    stats = buffer.sincronizar()
+    check("Reencolada viaja por el sync por lotes",
+          stats['sincronizados'] == 1 and api.llamadas.get('addAsistenciasBatch') == llamadas + 1)
+
+    check("Filtro por texto de error sin coincidencias", buffer.reenviar_fallidas(error_contiene="quota") == 0)
+    api.fallar_ruts.clear()
+    check("Reenvío por texto de error", buffer.reenviar_fallidas(error_contiene="SIMULADO") == 2)
+    buffer.sincronizar()
+    en_memoria = buffer.get_estadisticas()
+    buffer._recontar()
+    check("Dead-letter vacía y contadores exactos",
+          buffer.get_fallidas().empty and en_memoria == buffer.get_estadisticas()
+          and en_memoria['sincronizadas'] == 4)
+
+    # Archivos anteriores: las fallidas existentes se copian al abrir
+    buffer.marcar_asistencia("ene27-RM", "98000004-1", 2)
+    buffer.conn.execute("UPDATE asistencias_buffer SET intentos_sync = ? WHERE rut = '98000004-1'",
+                        [db_buffer.MAX_INTENTOS_SYNC])
+    buffer.conn.execute("DELETE FROM asistencias_fallidas")
+    buffer.close()
+    buffer = AsistenciaBuffer(db_path=db_path, api_url=api.url, api_key=api.api_key,
+                              auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+    check("Migración copia fallidas previas", list(buffer.get_fallidas()['rut']) == ["98000004-1"])
+    buffer.marcar_asistencia("ene27-RM", "98000004-1", 2, estado='justificado')
+    check("Cambio de estado saca la fila de la dead-letter", buffer.get_fallidas().empty)
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Dead-letter general", False, traceback.format_exc())
+
+seccion("28. PRIORIDAD — Sesiones de hoy, luego correcciones admin, luego backfill")
+
+try:
+    api = iniciar_api_local()
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "prioridad.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+
+    for i in range(6):
+        buffer.marcar_asistencia("feb27-RM", f"9900000{i}-K", 1)            # Backfill antiguo
+    buffer.marcar_asistencia("feb27-VA", "99000010-K", 1)
+    buffer.marcar_asistencia("feb27-RM", "99000020-K", 2, metodo='admin_manual')
+    buffer.marcar_asistencia("feb27-VA", "99000030-K", 3)                  # Check-ins de hoy
+    buffer.marcar_asistencia("feb27-BB", "99000031-K", 1)
+    buffer.marcar_asistencia("feb27-VA", "99000032-K", 3)
+
+    orden = [a['rut'] for a in buffer.get_asistencias_pendientes()]
+    check("Sin sesiones de hoy: admin primero, resto intercalado por curso",
+          orden[:3] == ["99000020-K", "99000000-K", "99000010-K"], str(orden[:3]))
+
+    buffer.actualizar_sesiones_hoy([("feb27-VA", 3), ("feb27-BB", "1")])
+    orden = [a['rut'] for a in buffer.get_asistencias_pendientes()]
+    check("Sesiones de hoy primero, intercaladas por curso",
+          orden[:3] == ["99000030-K", "99000031-K", "99000032-K"], str(orden[:3]))
+    check("Luego correcciones admin y después backfill",
+          orden[3] == "99000020-K" and orden[4:6] == ["99000000-K", "99000010-K"], str(orden[3:6]))
+    check("Lote chico solo toma sesiones de hoy",
+          {a['curso_id'] for a in buffer.get_asistencias_pendientes(limit=3)} == {"feb27-VA", "feb27-BB"})
+
+    buffer.actualizar_sesiones_hoy([])
+    check("Lista vacía desactiva la prioridad",
+          buffer.get_asistencias_pendientes()[0]['rut'] == "99000020-K")
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Prioridad general", False, traceback.format_exc())
+
+seccion("29. SERVIDOR DEL BUFFER — Varias réplicas comparten un archivo DuckDB")
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    from buffer_server import BufferServer, BufferClient
+
+    api = iniciar_api_local()
+    buffer = AsistenciaBuffer(db_path=os.path.join(TMP_DIR, "servidor.duckdb"),
+                              api_url=api.url, api_key=api.api_key, auto_sync_interval=0)
+    buffer.esperar_hidratacion()
+    servidor = BufferServer(buffer, token="secreto")
+    url = servidor.iniciar()
+    replicas = [BufferClient(url, token="secreto") for _ in range(3)]
+
+    check("Estado de hidratación remoto", replicas[0].estado_hidratacion == buffer.estado_hidratacion)
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        respuestas = list(executor.map(
+            lambda i: replicas[i % 3].registrar_si_no_existe("mar27-RM", f"{96000000 + i % 30}-K", 1),
+            range(60)))
+    check("Check-ins de 3 réplicas sin duplicados",
+          sum(r['insertado'] for r in respuestas) == 30
+          and sum(r['duplicado'] for r in respuestas) == 30)
+    check("verificar_asistencia remoto", replicas[1].verificar_asistencia("mar27-RM", "96000000-k", 1)
+          and not replicas[2].verificar_asistencia("mar27-RM", "96000000-K", 2))
+
+    stats = replicas[2].get_estadisticas()
+    check("Estadísticas con claves por sesión", stats['por_sesion'][("mar27-RM", 1)]['total'] == 30
+          and stats == buffer.get_estadisticas())
+    df = replicas[0].get_asistencias_curso("mar27-RM", 1)
+    check("DataFrame conserva tipos", len(df) == 30
+          and pd.api.types.is_datetime64_any_dtype(df['fecha_registro'])
+          and df['sincronizado'].dtype == bool)
+
+    # Misma forma que la llamada de AsistenciaCurso.main() (zip de columnas numpy)
+    df_hoy = pd.DataFrame({'curso_id': ["mar27-RM", "abr27-RM"], 'sesion_hoy': [1, 2]})
+    replicas[1].actualizar_sesiones_hoy(zip(df_hoy['curso_id'], df_hoy['sesion_hoy']))
+    replicas[2].actualizar_sesiones_hoy(list(zip(df_hoy['curso_id'], df_hoy['sesion_hoy'])))
+    check("actualizar_sesiones_hoy remoto con zip",
+          buffer._sesiones_hoy == frozenset({("mar27-RM", 1), ("abr27-RM", 2)}))
+
+    replicas[0].sincronizar(batch_size=100)
+    check("Sync desde una réplica", len(api.asistencias) == 30
+          and replicas[1].get_estadisticas()['sincronizadas'] == 30)
+    check("Circuit breaker remoto", replicas[0].breaker.get_estado()['estado'] == buffer.breaker.get_estado()['estado'])
+
+    try:
+        replicas[0].close_buffer_remoto()
+        check("Método no expuesto rechazado", False)
+    except AttributeError:
+        check("Método no expuesto rechazado", True)
+
+    intruso = BufferClient(url)
+    check("Token obligatorio", not intruso.marcar_asistencia("mar27-RM", "96000099-K", 1)['success'])
+
+    servidor.detener()
+    r = replicas[0].marcar_asistencia("mar27-RM", "96000099-K", 1)
+    check("Servidor caído → resultado fallido, no excepción", r['success'] is False, r['message'][:50])
+
+    buffer.close()
+    api.detener()
+except Exception as e:
+    check("Servidor del buffer general", False, traceback.format_exc())
+
+seccion("30. CLIENTE API — Conexiones reutilizadas, gzip, timeouts y consumo")
+
+try:
+    import requests as _requests
+    from api_client import ApiClient, TIMEOUTS
+    from circuit_breaker import CircuitBreaker, CircuitoAbiertoError
+
+    api = iniciar_api_local()
+    api.asistencias.extend({'curso_id': "abr27-RM", 'rut': f"{95000000 + i}-K", 'sesion': 1,
+                            'fecha_registro': '2026-04-01T12:00:00.000Z', 'estado': 'presente'}
+                           for i in range(500))
+    cliente = ApiClient(api.url, api.api_key, breaker=CircuitBreaker(umbral_fallos=1))
+
+    for _ in range(20):
+        data = cliente.get('getAsistencias')
+    check("20 llamadas sobre 1 conexión", api.conexiones == 1, f"{api.conexiones} conexiones")
+    check("Parámetros adicionales", cliente.get('getAsistencias', {'desde': 490})['asistencias'][0]['rut'] == "95000490-K")
+    consumo = cliente.get_estadisticas()['getAsistencias']
+    check("Consumo por acción con respuesta comprimida",
+          consumo['llamadas'] == 21 and consumo['bytes_red'] < consumo['bytes'] / 3,
+          f"{consumo['bytes']:,} bytes, {consumo['bytes_red']:,} por la red")
+    check("Todas las acciones tienen timeout",
+          all(TIMEOUTS.get(a) for a in ('getConfig', 'getRegistros', 'getCursoActivo',
+                                        'activarCurso', 'addCurso', 'addRegistro')))
+
+    check("POST con body", cliente.post('addAsistencia', {'curso_id': "abr27-RM", 'rut': "95009999-K",
+                                                          'sesion': 1})['success'])
+    api.latencia = 0.5
+    try:
+        cliente.get('getAsistencias', timeout=0.1)
+        check("Timeout por llamada", False)
+    except _requests.exceptions.Timeout:
+        check("Timeout por llamada", cliente.get_estadisticas()['getAsistencias']['errores'] == 1)
+    try:
+        cliente.get('getAsistencias')
+        check("Timeout abre el circuito", False)
+    except CircuitoAbiertoError:
+        check("Timeout abre el circuito", True)
+    api.latencia = 0
+    check("Sin breaker se llama igual", cliente.get('getAsistencias', breaker=False)['success'])
+
+    cliente.close()
+    api.detener()
+except Exception as e:
+    check("Cliente API general", False, traceback.format_exc())
+
+seccion("31. SNAPSHOT CACHE — Stale-while-revalidate con una sola descarga")
+
+try:
+    import threading
+    import snapshot_cache
+    from snapshot_cache import SnapshotCache, SnapshotNoDisponible, formatear_edad
+
+    descargas = []
+    fallar = []
+
+    def descargar():
+        descargas.append(time.monotonic())
+        time.sleep(0.3)
+        if fallar:
+            raise RuntimeError("API caída")
+        return pd.DataFrame({'version': [len(descargas)]})
+
+    cache = SnapshotCache("prueba", descargar, ttl=0.5)
+    check("Sin snapshot: edad desconocida", cache.edad is None and formatear_edad(cache.edad) == "sin datos")
+
+    hilos = [threading.Thread(target=cache.get) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    check("Primera carga: 8 llamadas, 1 descarga", len(descargas) == 1)
+
+    time.sleep(0.6)
+    inicio = time.perf_counter()
+    valores = [cache.get()['version'][0] for _ in range(20)]
+    espera = time.perf_counter() - inicio
+    check("Vencido: responde al instante con el snapshot anterior",
+          espera < 0.1 and set(valores) == {1} and cache.get_estado()['actualizando'],
+          f"{espera * 1000:.1f}ms")
+    time.sleep(0.5)
+    check("Renovación de fondo única", len(descargas) == 2 and cache.get()['version'][0] == 2
+          and cache.get_estado()['version'] == 2)
+
+    fallar.append(True)
+    time.sleep(0.6)
+    cache.get()
+    time.sleep(0.5)
+    check("Descarga fallida conserva el último snapshot",
+          cache.get()['version'][0] == 2 and cache.ultimo_error == "API caída" and cache.edad > 1)
+    n = len(descargas)
+    cache.get()
+    check("Tras un fallo no reintenta en cada request", len(descargas) == n)
+
+    fallar.clear()
+    check("refrescar() descarga y espera", cache.refrescar()['version'][0] == len(descargas)
+          and cache.ultimo_error is None and cache.edad < 0.1)
+
+    fallar.append(True)
+    vacio = SnapshotCache("vacio", descargar, ttl=60)
+    try:
+        vacio.get()
+        check("Sin snapshot y API caída lanza SnapshotNoDisponible", False)
+    except SnapshotNoDisponible:
+        check("Sin snapshot y API caída lanza SnapshotNoDisponible", True)
+
+    check("Registro compartido por nombre", snapshot_cache.get_snapshot_cache("x", descargar, 1)
+          is snapshot_cache.get_snapshot_cache("x", None, 99))
+    check("Formato de edad", [formatear_edad(v) for v in (5, 180, 7200)] == ["5 s", "3 min", "2 h"])
+except Exception as e:
+    check("Snapshot cache general", False, traceback.format_exc())
+
+seccion("32. SNAPSHOT EN DISCO — Arranque en frío desde Parquet")
+
+try:
+    import pyarrow.parquet as pq
+    from snapshot_cache import SnapshotCache, FORMATO_SNAPSHOT
+
+    ruta = os.path.join(TMP_DIR, "snapshots", "registros.parquet")
+    api_caida = []
+
+    def descargar_registros():
+        if api_caida:
+            raise RuntimeError("API caída")
+        return pd.DataFrame({'curso_id': ["may27-RM"] * 3, 'rut': ["1-9", "2-7", "3-5"],
+                             'telefono': [912345678, "sin dato", None],
+                             'fecha': pd.to_datetime(["2026-05-01"] * 3)})
+
+    cache = SnapshotCache("registros", descargar_registros, ttl=60, ruta=ruta)
+    cache.get()
+    sello = json.loads(pq.read_schema(ruta).metadata[b'snapshot'])
+    check("Snapshot persistido con sello de versión",
+          sello['formato'] == FORMATO_SNAPSHOT and sello['nombre'] == "registros"
+          and cache.error_disco is None, str(cache.error_disco))
+    check("Escritura atómica (sin temporales)", os.listdir(os.path.dirname(ruta)) == ["registros.parquet"])
+
+    api_caida.append(True)
+    time.sleep(0.2)
+    inicio = time.perf_counter()
+    frio = SnapshotCache("registros", descargar_registros, ttl=60, ruta=ruta, columnas=['rut', 'curso_id', 'email'])
+    df = frio.get()
+    espera = time.perf_counter() - inicio
+    check("Arranque en frío con API caída sirve el disco",
+          list(df['rut']) == ["1-9", "2-7", "3-5"] and frio.get_estado()['origen'] == 'disco',
+          f"{espera * 1000:.1f}ms")
+    check("Lectura podada a las columnas pedidas", list(df.columns) == ['rut', 'curso_id'])
+    check("Edad tomada del sello", frio.edad >= 0.2)
+    time.sleep(0.1)
+    check("Revalidación de fondo fallida conserva el disco",
+          frio.ultimo_error == "API caída" and frio.get()['rut'].tolist() == ["1-9", "2-7", "3-5"])
+
+    api_caida.clear()
+    frio.refrescar()
+    check("Revalidación exitosa pasa a datos del API", frio.get_estado()['origen'] == 'api'
+          and 'telefono' in frio.get().columns)
+
+    otro = SnapshotCache("config", descargar_registros, ttl=60, ruta=ruta)
+    check("Sello de otro cache se ignora", otro.get_estado()['origen'] is None)
+    with open(ruta, 'wb') as f:
+        f.write(b"no es parquet")
+    danado = SnapshotCache("registros", descargar_registros, ttl=60, ruta=ruta)
+    check("Archivo dañado se ignora y se descarga", danado.get_estado()['origen'] is None
+          and danado.error_disco and len(danado.get()) == 3)
+except Exception as e:
+    check("Snapshot en disco general", False, traceback.format_exc())
+
+seccion("33. ESPEJO DE REGISTROS — Deltas por marca de agua y consultas por curso")
+
+try:
+    import espejo_registros as db_espejo
+    from espejo_registros import EspejoRegistros, normalizar_rut
+    from api_client import ApiClient
+
+    api = iniciar_api_local()
+    api.registros.extend(
+        [{'curso_id': "abr26-RM", 'rut': f"{10000000 + i}-{i % 10}", 'nombres': f"P{i}",
+          'num_suc': i, 'fecha_registro': "2026-04-01"} for i in range(300)]
+        + [{'curso_id': "may27-RM", 'rut': "12.345.678-k", 'nombres': "Ana", 'num_suc': 7,
+            'fecha_registro': "2026-05-20"}]
+    )
+    cliente = ApiClient(api.url, api.api_key)
+    ruta = os.path.join(TMP_DIR, "espejo", "registros.duckdb")
+    espejo = EspejoRegistros(ruta, cliente, columnas=['curso_id', 'rut', 'nombres', 'num_suc'])
+
+    check("Carga inicial completa", espejo.sincronizar() == 301 and espejo.get_estado()['registros'] == 301)
+    check("RUT normalizado sin puntos, con guión y mayúscula",
+          normalizar_rut("12.345.678-k") == "12345678-K" and normalizar_rut("123456785") == "12345678-5")
+    ana = espejo.buscar_inscrito("may27-RM", "12345678-K")
+    check("Búsqueda de inscrito con tipos del API", ana == {'curso_id': "may27-RM", 'rut': "12.345.678-k",
+                                                            'nombres': "Ana", 'num_suc': 7})
+    check("Columnas podadas al guardar", 'fecha_registro' not in ana)
+    check("Inscrito en otro curso no cuenta", espejo.buscar_inscrito("abr26-RM", "12345678-k") is None)
+    check("Conteo por curso en DuckDB", espejo.contar_inscritos("abr26-RM") == 300
+          and espejo.contar_por_curso() == {"abr26-RM": 300, "may27-RM": 1})
+
+    bytes_antes = cliente.get_estadisticas()['getRegistros']['bytes']
+    api.add_registro({'curso_id': "may27-RM", 'rut': "22222222-2", 'nombres': "Beto", 'num_suc': 8})
+    check("Delta solo con la fila nueva", espejo.sincronizar() == 302
+          and espejo.contar_inscritos("may27-RM") == 2)
+    bytes_delta = cliente.get_estadisticas()['getRegistros']['bytes'] - bytes_antes
+    check("Delta descarga mucho menos que la hoja", bytes_delta * 20 < bytes_antes, f"{bytes_delta} vs {bytes_antes} bytes")
+
+    df_curso = espejo.get_registros_curso("may27-RM")
+    check("Registros del curso en orden de la hoja", list(df_curso['nombres']) == ["Ana", "Beto"]
+          and df_curso['num_suc'].dtype.kind == 'i')
+    df_asist = espejo.get_registros_curso("may27-RM", ruts=["12345678-K", "99999999-9"])
+    check("Filtro por RUTs asistentes", list(df_asist['nombres']) == ["Ana"])
+    check("Curso sin registros → DataFrame vacío", espejo.get_registros_curso("jun27-RM").empty)
+
+    espejo.close()
+    reabierto = EspejoRegistros(ruta, cliente, columnas=['curso_id', 'rut', 'nombres', 'num_suc'])
+    check("Marca de agua y fecha persisten al reabrir", reabierto.filas == 302 and reabierto.error_archivo is None
+          and reabierto.ultima_sincronizacion is not None)
+    del api.registros[:250]
+    check("Hoja con menos filas → recarga completa", reabierto.sincronizar() == 52
+          and reabierto.contar_inscritos("abr26-RM") == 50)
+
+    api.registros[0]['nombres'] = "Editado"
+    reabierto.sincronizar()
+    check("Delta no relee filas editadas", reabierto.get_registros_curso("abr26-RM")['nombres'].iloc[0] != "Editado")
+    reabierto.recargar()
+    check("recargar() toma las filas editadas", reabierto.get_registros_curso("abr26-RM")['nombres'].iloc[0] == "Editado")
+    api.registros[0]['nombres'] = "Corregido"
+    reabierto.recarga_completa = 0
+    reabierto.sincronizar()
+    reabierto.recarga_completa = db_espejo.RECARGA_COMPLETA_SEGUNDOS
+    check("Recarga completa periódica toma las filas editadas",
+          reabierto.get_registros_curso("abr26-RM")['nombres'].iloc[0] == "Corregido"
+          and (datetime.now() - reabierto.ultima_recarga).total_seconds() < 5)
+
+    # Arranque con el espejo lleno y el API colgado: no se espera el timeout
+    api.latencia = 2
+    frio = SnapshotCache("espejo", reabierto.sincronizar, ttl=60)
+    if frio.version == 0 and reabierto.filas:
+        frio.sembrar(reabierto.filas, reabierto.ultima_sincronizacion)
+    inicio = time.perf_counter()
+    frio.get()
+    frio.get()
+    espera = time.perf_counter() - inicio
+    check("Espejo en disco se entrega sin esperar al API", espera < 0.5 and frio.get_estado()['actualizando'],
+          f"{espera * 1000:.0f}ms")
+    frio.refrescar(timeout=10)
+    api.latencia = 0
+
+    api.detener()
+    try:
+        reabierto.sincronizar()
+        check("API caída lanza al sincronizar", False)
+    except Exception:
+        check("API caída lanza al sincronizar", True)
+    check("Consultas siguen respondiendo sin API", reabierto.contar_inscritos("may27-RM") == 2)
+
+    reabierto.close()
+    ampliado = EspejoRegistros(ruta, cliente, columnas=['curso_id', 'rut', 'nombres', 'num_suc', 'direccion'])
+    check("Cambio de columnas descarta la copia para releerla completa", ampliado.filas == 0)
+    ampliado.close()
+
+    # Los reportes IST/MK de AsistenciaCurso solo ven las columnas guardadas en su espejo
+    import ast, re
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "AsistenciaCurso.py"),
+              encoding="utf-8") as f:
+        fuente = f.read()
+    columnas_app = next(ast.literal_eval(n.value) for n in ast.parse(fuente).body
+                        if isinstance(n, ast.Assign) and getattr(n.targets[0], 'id', '') == 'COLUMNAS_REGISTROS')
+    leidas = set(re.findall(r"getattr\(row, '(\w+)'", fuente))
+    check("COLUMNAS_REGISTROS cubre los campos de los reportes", {"nacionalidad", "direccion"} <= leidas <= set(columnas_app),
+          str(sorted(leidas - set(columnas_app))))
+
+    import subprocess
+    otro_proceso = subprocess.Popen(
+        [sys.executable, "-c", "import duckdb, sys, time; c = duckdb.connect(sys.argv[1]); "
+                               "print('ok', flush=True); time.sleep(30)", ruta],
+        stdout=subprocess.PIPE, text=True
+    )
+    try:
+        otro_proceso.stdout.readline()
+        en_memoria = EspejoRegistros(ruta, cliente)
+        check("Archivo tomado por otro proceso → espejo en memoria",
+              en_memoria.error_archivo is not None and en_memoria.filas == 0)
+        en_memoria.close()
+    finally:
+        otro_proceso.kill()
+        otro_proceso.wait()
+    cliente.close()
+except Exception as e:
+    check("Espejo de registros general", False, traceback.format_exc())
+
+seccion("34. SNAPSHOT INMUTABLE — Vistas sin copia y versiones")
+
+try:
+    import numpy as np
+    from snapshot_cache import SnapshotCache
+
+    cargas = []
+
+    def descargar_cursos():
+        cargas.append(True)
+        return pd.DataFrame({'curso_id': [f"c{len(cargas)}-{i}" for i in range(1000)],
+                             'cupo_maximo': np.arange(1000, dtype=float)})
+
+    cache = SnapshotCache("cursos", descargar_cursos, ttl=3600)
+    v1a, v1b = cache.get(), cache.get()
+    check("Cada llamada entrega su propia vista", v1a is not v1b and cache.version == 1)
+    check("Las vistas comparten memoria (sin copia)",
+          np.shares_memory(v1a['cupo_maximo'].to_numpy(), v1b['cupo_maximo'].to_numpy()))
+
+    v1a['inscritos'] = 0
+    v1a.loc[0, 'cupo_maximo'] = -1
+    v1a.sort_values('curso_id', ascending=False, inplace=True)
+    v1c = cache.get()
+    check("Modificar una vista no cambia el snapshot",
+          'inscritos' not in v1c.columns and v1c['cupo_maximo'].iloc[0] == 0
+          and v1c['curso_id'].iloc[0] == "c1-0" and v1b['cupo_maximo'].iloc[0] == 0)
+
+    cache.refrescar()
+    v2 = cache.get()
+    check("Renovar publica una versión nueva", cache.version == 2 and v2['curso_id'].iloc[0] == "c2-0")
+    check("Vistas anteriores conservan su versión", v1b['curso_id'].iloc[0] == "c1-0")
+
+    valor = {'a': 1}
+    dict_cache = SnapshotCache("dict", lambda: valor, ttl=3600)
+    check("Valores que no son DataFrame se entregan tal cual", dict_cache.get() is valor)
+except Exception as e:
+    check("Snapshot inmutable general", False, traceback.format_exc())
+
+seccion("35. CONFIG DE CURSOS — Descarga compartida por ambas apps")
+
+try:
+    from config_cursos import descargar_config
+    from api_client import ApiClient
+
+    api = iniciar_api_local()
+    api.cursos.extend([
+        {'curso_id': "jul27-RM", 'cupo_maximo': "40", 'fecha_sesion_1': "2027-07-06T04:00:00.000Z",
+         'fecha_sesion_2': "2027-07-13T04:00:00.000Z", 'fecha_sesion_3': "", 'fecha_sesion_4': "2027-07-27T04:00:00.000Z"},
+        {'curso_id': "ago27-RM", 'cupo_maximo': "x", 'fecha_sesion_1': "2027-08-03T04:00:00.000Z"},
+    ])
+    cliente = ApiClient(api.url, api.api_key)
+    df_utc = descargar_config(cliente, fechas_utc=True)
+    check("Fechas UTC normalizadas a medianoche (AsistenciaCurso)",
+          df_utc['fecha_sesion_1'].iloc[0] == pd.Timestamp("2027-07-06") and df_utc['fecha_sesion_1'].dt.tz is None)
+    df_local = descargar_config(cliente)
+    check("Fechas con zona tal cual (InscripcionCSV)",
+          df_local['fecha_sesion_1'].iloc[0] == pd.Timestamp("2027-07-06 04:00", tz="UTC"))
+    check("cupo_maximo numérico", df_utc['cupo_maximo'].iloc[0] == 40 and pd.isna(df_utc['cupo_maximo'].iloc[1]))
+    check("num_sesiones detectado por columnas de fecha", list(df_utc['num_sesiones']) == [4, 3])
+
+    api.cursos.clear()
+    check("Sin cursos → DataFrame vacío", descargar_config(cliente).empty)
+    api.api_key = "otra"
+    try:
+        descargar_config(cliente)
+        check("getConfig fallido lanza (conserva el snapshot)", False)
+    except RuntimeError:
+        check("getConfig fallido lanza (conserva el snapshot)", True)
+    cliente.close()
+    api.detener()
+except Exception as e:
+    check("Config de cursos general", False, traceback.format_exc())
+
+# ─────────────────────────────────────────────
+seccion("36. REGISTROS COMPARTIDOS — Espejo + snapshot armados en un solo módulo")
+
+try:
+    from registros_cursos import get_registros_cursos
+    from api_client import ApiClient
+
+    api = iniciar_api_local()
+    api.registros.extend({'curso_id': "sep27-RM", 'rut': f"{98000000 + i}-K", 'nombres': f"N{i}"}
+                         for i in range(3))
+    cliente = ApiClient(api.url, api.api_key)
+    ruta = os.path.join(TMP_DIR, "registros_app.duckdb")
+    registros = get_registros_cursos(ruta, cliente, columnas=['curso_id', 'rut', 'nombres'])
+    check("Una instancia por archivo", get_registros_cursos(ruta, cliente) is registros)
+
+    espejo = registros.get_espejo()
+    check("get_espejo trae la hoja en la primera llamada",
+          espejo is registros.espejo and espejo.contar_inscritos("sep27-RM") == 3)
+
+    api.registros.append({'curso_id': "sep27-RM", 'rut': "98000009-K", 'nombres': "Nuevo"})
+    registros.invalidar()
+    registros.get_espejo()
+    registros.snapshot.refrescar(timeout=5)
+    check("invalidar trae las filas nuevas", registros.espejo.contar_inscritos("sep27-RM") == 4)
+
+    api.registros[0]['nombres'] = "Corregido"
+    registros.recargar()
+    check("recargar toma las filas editadas",
+          registros.espejo.buscar_inscrito("sep27-RM", "98000000-K")['nombres'] == "Corregido"
+          and registros.ultimo_error is None)
+
+    api.api_key = "otra"
+    try:
+        registros.recargar()
+        check("recargar fallido lanza y deja ultimo_error", False)
+    except Exception:
+        check("recargar fallido lanza y deja ultimo_error", registros.ultimo_error is not None)
+    check("Espejo conserva las filas si el API falla", registros.get_espejo().filas == 4)
+    check("Edad de la última recarga completa", 0 <= registros.edad_recarga < 60)
+    texto = registros.describir_edades(registros.snapshot)
+    check("Caption con edad de inscritos nuevos y correcciones",
+          "inscritos nuevos de hace" in texto and "correcciones de hace" in texto, texto)
+
+    # Espejo ya lleno en disco: se entrega sembrado, sin esperar al API (caído)
+    from espejo_registros import EspejoRegistros
+    ruta_lleno = os.path.join(TMP_DIR, "registros_lleno.duckdb")
+    api.api_key = cliente.api_key
+    previo = EspejoRegistros(ruta_lleno, cliente)
+    previo.sincronizar()
+    previo.close()
+    api.api_key = "otra"
+    sembrado = get_registros_cursos(ruta_lleno, cliente)
+    check("Espejo en disco sembrado como snapshot",
+          sembrado.snapshot.version == 1 and sembrado.snapshot.get_estado()['origen'] == 'disco'
+          and sembrado.get_espejo().contar_inscritos("sep27-RM") == 4)
+
+    cliente.close()
+    api.detener()
+except Exception as e:
+    check("Registros compartidos general", False, traceback.format_exc())
+
 # ─────────────────────────────────────────────
 # Limpieza
 if os.path.exists(TEST_DB):